@@ -0,0 +1,251 @@
+"""
+Нагрузочный тест бота
+
+Поднимает локальные замены YandexGPT (fake_yandex.py) и Telegram Bot API
+(fake_telegram.py), создает TextBot с приложением build_application и вызывает
+обработчики check_command, handle_text, button_callback (кнопка «Проверить
+грамотность», затем текст) и handle_forwarded_message синтетическими обновлениями.
+Для каждого уровня параллельности печатает пропускную способность и время
+обработки запроса от получения обновления до отправки ответа (p50/p95/p99).
+
+Каждый запрос идет от нового пользователя с уникальным текстом, поэтому кэш
+и объединение одинаковых запросов не влияют на замер, а лимит сообщений в чат
+действует только на сообщения одного запроса (статус, обновления, результат).
+Общий лимит исходящих сообщений по умолчанию снят (TELEGRAM_GLOBAL_RATE=1000);
+чтобы учесть лимиты Telegram, задайте TELEGRAM_GLOBAL_RATE=30. Остальные
+настройки бота тоже берутся из переменных окружения.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_load.py --concurrency 1,8,32 --requests 200 --llm-latency 0.8
+
+С --max-p95 скрипт завершается с кодом 1, если p95 на каком-либо уровне
+превысил порог, - так регрессию можно поймать до выкладки.
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from fake_telegram import FakeTelegram
+from fake_yandex import FakeYandex, start_server
+
+WORDS = (
+    "привет как дела сегодня мы обсуждали новый проект и решили что нужно больше времени "
+    "на подготовку документов поэтому встреча переносится на следующую неделю если будут "
+    "вопросы пишите в общий чат команда ответит в течение дня"
+).split()
+
+SCENARIOS = ["check_command", "handle_text", "button_callback", "handle_forwarded_message"]
+
+def configure_environment(args):
+    """Направляет бота на локальные серверы; вызывается до импорта модулей бота"""
+    yandex = f"http://127.0.0.1:{args.yandex_port}/foundationModels/v1"
+    os.environ.update({
+        "TELEGRAM_TOKEN": "123456:bench",
+        "YANDEX_API_KEY": "bench",
+        "YANDEX_FOLDER_ID": "bench",
+        "YANDEX_API_URL": f"{yandex}/completion",
+        "YANDEX_TOKENIZE_URL": f"{yandex}/tokenize",
+        "LLM_CACHE_FILE": "",
+        "LLM_JOBS_FILE": "",
+        "TOKEN_STATS_FILE": "",
+        "ROUTER_LOG_FILE": "",
+        "USER_STORAGE": "json",
+    })
+    os.environ.setdefault("TELEGRAM_GLOBAL_RATE", "1000")
+
+def make_text(length: int, marker: str) -> str:
+    """Случайный текст; по маркеру в начале ответ бота отличается от сообщения об ошибке"""
+    words = [marker]
+    while sum(len(word) + 1 for word in words) < length:
+        words.append(random.choice(WORDS))
+    return " ".join(words)
+
+def user_data(user_id: int) -> Dict:
+    return {"id": user_id, "is_bot": False, "first_name": "Bench", "username": f"bench{user_id}"}
+
+def message_data(user_id: int, text: str, **extra) -> Dict:
+    data = {
+        "message_id": 1,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": user_data(user_id),
+        "text": text,
+    }
+    data.update(extra)
+    return data
+
+class LoadTest:
+    def __init__(self, bot, application, telegram: FakeTelegram):
+        self.bot = bot
+        self.application = application
+        self.telegram = telegram
+
+    def _update(self, data: Dict):
+        from telegram import Update
+        return Update.de_json(data, self.application.bot)
+
+    def _context(self, update, args=None):
+        from telegram.ext import CallbackContext
+        context = CallbackContext.from_update(update, self.application)
+        context.args = args
+        return context
+
+    async def check_command(self, user_id: int, text: str):
+        update = self._update({"update_id": user_id, "message": message_data(
+            user_id, f"/check {text}", entities=[{"type": "bot_command", "offset": 0, "length": 6}]
+        )})
+        await self.bot.check_command(update, self._context(update, text.split()))
+
+    async def handle_text(self, user_id: int, text: str):
+        self.bot.user_states[user_id] = "waiting_for_text_check"
+        update = self._update({"update_id": user_id, "message": message_data(user_id, text)})
+        await self.bot.handle_text(update, self._context(update))
+
+    async def button_callback(self, user_id: int, text: str):
+        update = self._update({"update_id": user_id, "callback_query": {
+            "id": str(user_id),
+            "from": user_data(user_id),
+            "chat_instance": "bench",
+            "data": "check_grammar",
+            "message": message_data(user_id, "Выберите действие", **{"from": {
+                "id": 1000, "is_bot": True, "first_name": "Bench"
+            }}),
+        }})
+        await self.bot.button_callback(update, self._context(update))
+        # Кнопка переводит пользователя в ожидание текста
+        update = self._update({"update_id": user_id, "message": message_data(user_id, text, message_id=2)})
+        await self.bot.handle_text(update, self._context(update))
+
+    async def handle_forwarded_message(self, user_id: int, text: str):
+        update = self._update({"update_id": user_id, "message": message_data(
+            user_id, text, forward_from=user_data(user_id + 1), forward_date=int(time.time())
+        )})
+        await self.bot.handle_forwarded_message(update, self._context(update))
+
+    async def run_level(self, scenarios: List[str], concurrency: int, total: int, text_length: int,
+                        first_user: int) -> Dict:
+        counter = itertools.count()
+        latencies: List[float] = []
+        failures = 0
+
+        async def worker():
+            nonlocal failures
+            while True:
+                n = next(counter)
+                if n >= total:
+                    return
+                user_id = first_user + n
+                marker = f"#{user_id}"
+                scenario = getattr(self, scenarios[n % len(scenarios)])
+                started = time.perf_counter()
+                try:
+                    await scenario(user_id, make_text(text_length, marker))
+                    ok = marker in self.telegram.last_text.get(user_id, "")
+                except Exception as e:
+                    logging.getLogger(__name__).warning(f"Ошибка сценария: {e}")
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    failures += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        return {
+            "concurrency": concurrency,
+            "requests": total,
+            "failures": failures,
+            "throughput": total / elapsed,
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+        }
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+async def main(args) -> int:
+    yandex = FakeYandex(args.llm_latency, args.llm_sigma, args.error_rate, args.throttle_rate)
+    telegram = FakeTelegram(args.telegram_latency)
+    yandex_runner = await start_server(yandex.make_app(), "127.0.0.1", args.yandex_port)
+    telegram_runner = await start_server(telegram.make_app(), "127.0.0.1", args.telegram_port)
+
+    from bot import TextBot, build_application
+    if not args.verbose:
+        # Повторы после ошибок, заданных --error-rate, ожидаемы; неудачные запросы попадают в счетчик ошибок
+        logging.disable(logging.ERROR)
+
+    bot = TextBot()
+    application = build_application(bot, base_url=f"http://127.0.0.1:{args.telegram_port}/bot")
+    await application.initialize()
+    await bot.post_init(application)
+
+    scenarios = args.scenarios.split(",")
+    for scenario in scenarios:
+        if scenario not in SCENARIOS:
+            raise SystemExit(f"Неизвестный сценарий {scenario}, доступны: {', '.join(SCENARIOS)}")
+
+    print(f"Сценарии: {', '.join(scenarios)}; текст ~{args.text_length} символов; "
+          f"YandexGPT: медиана {args.llm_latency} с, ошибок {args.error_rate:.0%}, 429 {args.throttle_rate:.0%}")
+    print(f"{'Параллельно':>11} {'Запросов':>9} {'Ошибок':>7} {'Запросов/с':>11} {'p50, с':>8} {'p95, с':>8} {'p99, с':>8}")
+
+    load_test = LoadTest(bot, application, telegram)
+    exit_code = 0
+    first_user = 1
+    try:
+        for concurrency in (int(value) for value in args.concurrency.split(",")):
+            result = await load_test.run_level(scenarios, concurrency, args.requests, args.text_length, first_user)
+            first_user += args.requests
+            print(f"{result['concurrency']:>11} {result['requests']:>9} {result['failures']:>7} "
+                  f"{result['throughput']:>11.1f} {result['p50']:>8.2f} {result['p95']:>8.2f} {result['p99']:>8.2f}")
+            if args.max_p95 is not None and not result['p95'] <= args.max_p95:
+                exit_code = 1
+    finally:
+        await application.shutdown()
+        await bot.post_shutdown(application)
+        await yandex_runner.cleanup()
+        await telegram_runner.cleanup()
+
+    print(f"YandexGPT: {yandex.get_stats()}")
+    print(f"Telegram: {telegram.get_stats()['calls']}")
+    print(f"Исходящие сообщения: {bot.rate_limiter.get_stats()}")
+    if exit_code:
+        print(f"p95 превысил порог {args.max_p95} с")
+    return exit_code
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота с локальными YandexGPT и Telegram")
+    parser.add_argument('--concurrency', default="1,8,32", help="уровни параллельности через запятую")
+    parser.add_argument('--requests', type=int, default=100, help="запросов на каждом уровне")
+    parser.add_argument('--scenarios', default=",".join(SCENARIOS), help="обработчики через запятую")
+    parser.add_argument('--text-length', type=int, default=300, help="длина текста, символов")
+    parser.add_argument('--llm-latency', type=float, default=0.5, help="медиана времени ответа YandexGPT, секунд")
+    parser.add_argument('--llm-sigma', type=float, default=0.3, help="разброс времени ответа YandexGPT")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="доля ответов 500 от YandexGPT")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="доля ответов 429 от YandexGPT")
+    parser.add_argument('--telegram-latency', type=float, default=0.03, help="время ответа Bot API, секунд")
+    parser.add_argument('--yandex-port', type=int, default=8781)
+    parser.add_argument('--telegram-port', type=int, default=8782)
+    parser.add_argument('--max-p95', type=float, default=None, help="порог p95, секунд")
+    parser.add_argument('--verbose', action='store_true', help="показывать журнал бота")
+    args = parser.parse_args()
+
+    random.seed(42)
+    configure_environment(args)
+    # users.json и другие файлы бота создаются во временном каталоге
+    os.chdir(tempfile.mkdtemp(prefix="bench_load_"))
+    sys.exit(asyncio.run(main(args)))
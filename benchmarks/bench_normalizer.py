@@ -0,0 +1,126 @@
+"""
+Микробенчмарк нормализации текста
+
+Сравнивает прежние функции (fix_dashes, preserve_paragraphs, remove_paragraph_dots
+из LLMService и clean_formatting_for_llm из TelegramFormatter: несколько проходов
+re.sub с компиляцией шаблонов при вызове) с text_normalizer. Перед замерами
+проверяет на случайных строках (переносы \\r\\n, \\r, \\n, тире, точки, Markdown),
+что результаты совпадают посимвольно.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_normalizer.py
+"""
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from text_normalizer import clean_formatting, fix_dashes, normalize, preserve_paragraphs, remove_paragraph_dots
+
+def legacy_fix_dashes(text):
+    text = re.sub(r'—', '–', text)
+    text = re.sub(r'(?<![\w])-(?![\w])', '–', text)
+    return text
+
+def legacy_preserve_paragraphs(text):
+    text = re.sub(r'\r\n', '\n', text)
+    text = re.sub(r'\r', '\n', text)
+    text = text.strip()
+    text = re.sub(r'\n{3,}', '\n\n', text)
+    return text
+
+def legacy_remove_paragraph_dots(text):
+    paragraphs = text.split('\n')
+    processed_paragraphs = []
+    for paragraph in paragraphs:
+        if paragraph.strip():
+            processed_paragraphs.append(paragraph.rstrip('.'))
+        else:
+            processed_paragraphs.append(paragraph)
+    return '\n'.join(processed_paragraphs)
+
+def legacy_clean_formatting(text):
+    text = re.sub(r'\*\*(.*?)\*\*', r'\1', text)
+    text = re.sub(r'\*(.*?)\*', r'\1', text)
+    text = re.sub(r'`(.*?)`', r'\1', text)
+    text = re.sub(r'```(.*?)```', r'\1', text, flags=re.DOTALL)
+    text = re.sub(r'\[([^\]]+)\]\([^)]+\)', r'\1', text)
+    return text.strip()
+
+def legacy_result(text, nodot):
+    """Прежняя обработка ответа модели: тире, абзацы, затем nodot"""
+    text = legacy_preserve_paragraphs(legacy_fix_dashes(text))
+    return legacy_remove_paragraph_dots(text) if nodot else text
+
+PAIRS = [
+    ("fix_dashes", legacy_fix_dashes, fix_dashes),
+    ("preserve_paragraphs", legacy_preserve_paragraphs, preserve_paragraphs),
+    ("remove_paragraph_dots", legacy_remove_paragraph_dots, remove_paragraph_dots),
+    ("clean_formatting", legacy_clean_formatting, clean_formatting),
+]
+
+# Символы, на которых правила ведут себя по-разному
+ALPHABET = ["а", "Б", "z", "7", "_", " ", "\t", "\n", "\r", "\r\n", "-", "—", "–", ".", "...", ",",
+            "*", "**", "`", "```", "[", "]", "(", ")", "](", " ", " "]
+
+def random_text(max_tokens=40):
+    return "".join(random.choice(ALPHABET) for _ in range(random.randint(0, max_tokens)))
+
+def check_equivalence(rounds=50000):
+    """Сравнивает прежние и новые функции на случайных строках; печатает первое расхождение"""
+    for _ in range(rounds):
+        text = random_text()
+        for name, legacy, current in PAIRS:
+            expected, actual = legacy(text), current(text)
+            if expected != actual:
+                raise AssertionError(f"{name}({text!r}): {expected!r} != {actual!r}")
+        nodot = random.random() < 0.5
+        if legacy_result(text, nodot) != normalize(text, dashes=True, paragraphs=True, nodot=nodot):
+            raise AssertionError(f"normalize({text!r}, nodot={nodot}) расходится с прежней обработкой")
+
+WORDS = (
+    "привет как дела сегодня мы обсуждали новый проект и решили что нужно больше времени "
+    "на подготовку документов - поэтому встреча переносится на следующую неделю кое-что "
+    "еще — вопросы пишите в общий **чат** команда ответит в течение дня"
+).split()
+
+def realistic_text(length):
+    """Текст из абзацев с переносами Windows, тире, дефисами и редким Markdown"""
+    paragraphs = []
+    size = 0
+    while size < length:
+        sentences = []
+        for _ in range(random.randint(1, 4)):
+            words = [random.choice(WORDS) for _ in range(random.randint(5, 15))]
+            sentences.append(" ".join(words).capitalize() + ".")
+        paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 4
+    return "\r\n\r\n".join(paragraphs)[:length] + "\n\n\n"
+
+def measure(function, text, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function(text)
+    return (time.perf_counter() - started) / repeat
+
+def bench(length, repeat):
+    text = realistic_text(length)
+    print(f"Текст {len(text)} символов ({repeat} повторов):")
+    for name, legacy, current in PAIRS:
+        before, after = measure(legacy, text, repeat), measure(current, text, repeat)
+        print(f"  {name:<22} {before * 1e6:9.1f} -> {after * 1e6:8.1f} мкс  (x{before / after:.1f})")
+
+    before = measure(lambda value: legacy_result(value, True), text, repeat)
+    after = measure(lambda value: normalize(value, dashes=True, paragraphs=True, nodot=True), text, repeat)
+    print(f"  {'ответ модели + nodot':<22} {before * 1e6:9.1f} -> {after * 1e6:8.1f} мкс  (x{before / after:.1f})")
+
+if __name__ == '__main__':
+    random.seed(42)
+    check_equivalence()
+    print("Результаты совпадают с прежними функциями")
+    for length, repeat in ((4000, 500), (10000, 200), (40000, 50)):
+        bench(length, repeat)
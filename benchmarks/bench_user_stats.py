@@ -0,0 +1,124 @@
+"""
+Микробенчмарк данных пользователей
+
+Сравнивает прежнее представление (словарь с историей из словарей с ISO-временем)
+с UserRecord: скорость подсчета дневной и недельной статистики, расход памяти
+и размер файла. Перед замерами проверяет, что счетчики совпадают с полным пересчетом.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_user_stats.py
+"""
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from user_record import HISTORY_LIMIT, UserRecord, to_seconds
+
+def legacy_counts(history, now):
+    """Прежний алгоритм update_period_stats: разбор всей истории на каждый вызов"""
+    today = 0
+    week = 0
+    for request in history:
+        request_time = datetime.fromisoformat(request["timestamp"])
+        if now.date() == request_time.date():
+            today += 1
+        if now - request_time <= timedelta(days=7):
+            week += 1
+    return today, week
+
+def make_legacy_user(user_id, start, size):
+    """Строит пользователя в прежнем формате с интервалами между запросами от секунд до суток"""
+    history = []
+    moment = start
+    for _ in range(size):
+        moment += timedelta(seconds=random.choice([5, 600, 3600 * 5, 3600 * 20]))
+        history.append({"type": "check_grammar", "timestamp": moment.replace(microsecond=0).isoformat()})
+    return {
+        "user_id": user_id,
+        "username": f"user{user_id}",
+        "first_name": "Имя",
+        "joined_date": start.isoformat(),
+        "requests": {"total": size, "today": 0, "week": 0, "last_request": history[-1]["timestamp"] if history else None},
+        "requests_history": history
+    }, moment
+
+def check_equivalence(rounds=300):
+    """Прогоняет случайные последовательности запросов и сравнивает результаты"""
+    for _ in range(rounds):
+        legacy, moment = make_legacy_user(1, datetime(2025, 8, 1), random.randint(0, HISTORY_LIMIT))
+        record = UserRecord.from_data(legacy)
+        history = legacy["requests_history"]
+        for _ in range(random.randint(1, 300)):
+            moment += timedelta(seconds=random.choice([1, 300, 3600 * 7, 3600 * 30]))
+            if random.random() < 0.7:
+                history.append({"type": "check_grammar", "timestamp": moment.isoformat()})
+                history = history[-HISTORY_LIMIT:]
+                record.add_request(to_seconds(moment), "check_grammar")
+            record.update_period_stats(to_seconds(moment))
+            assert (record.today, record.week) == legacy_counts(history, moment)
+
+def bench_counters(users, calls=5):
+    now = datetime(2025, 8, 20, 12, 0)
+    legacy_users = [make_legacy_user(i, now - timedelta(days=40), HISTORY_LIMIT)[0] for i in range(users)]
+    records = [UserRecord.from_data(user) for user in legacy_users]
+
+    started = time.perf_counter()
+    for _ in range(calls):
+        for user in legacy_users:
+            legacy_counts(user["requests_history"], now)
+    legacy_time = time.perf_counter() - started
+
+    now_seconds = to_seconds(now)
+    started = time.perf_counter()
+    for _ in range(calls):
+        for record in records:
+            record.update_period_stats(now_seconds)
+    record_time = time.perf_counter() - started
+
+    total = users * calls
+    print(f"Подсчет статистики ({users} польз., история {HISTORY_LIMIT} запросов, {total} вызовов):")
+    print(f"  полный пересчет: {legacy_time / total * 1e6:8.2f} мкс/вызов")
+    print(f"  UserRecord:      {record_time / total * 1e6:8.2f} мкс/вызов")
+    print(f"  ускорение: x{legacy_time / record_time:.0f}")
+
+def measure_memory(build):
+    tracemalloc.start()
+    data = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return data, size
+
+def bench_size(users):
+    start = datetime(2025, 7, 1)
+    random.seed(7)
+    legacy_users, legacy_memory = measure_memory(
+        lambda: {str(i): make_legacy_user(i, start, HISTORY_LIMIT)[0] for i in range(users)}
+    )
+    records, record_memory = measure_memory(
+        lambda: {key: UserRecord.from_data(user) for key, user in legacy_users.items()}
+    )
+
+    legacy_file = len(json.dumps(legacy_users, ensure_ascii=False, indent=2).encode('utf-8'))
+    compact_file = len(json.dumps(
+        {key: record.to_data() for key, record in records.items()},
+        ensure_ascii=False, separators=(',', ':')
+    ).encode('utf-8'))
+
+    print(f"Размер данных ({users} польз., история {HISTORY_LIMIT} запросов):")
+    print(f"  память: {legacy_memory / users:8.0f} -> {record_memory / users:6.0f} байт/польз. "
+          f"(x{legacy_memory / record_memory:.0f})")
+    print(f"  файл:   {legacy_file / users:8.0f} -> {compact_file / users:6.0f} байт/польз. "
+          f"(x{legacy_file / compact_file:.0f})")
+
+if __name__ == '__main__':
+    random.seed(42)
+    check_equivalence()
+    print("Счетчики совпадают с полным пересчетом")
+    bench_counters(2000)
+    bench_size(2000)
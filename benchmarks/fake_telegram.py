@@ -0,0 +1,71 @@
+"""
+Локальная замена Telegram Bot API для нагрузочных тестов
+
+Принимает методы, которые вызывает бот (getMe, sendMessage, editMessageText,
+deleteMessage, answerCallbackQuery), отвечает через latency секунд, считает
+вызовы и запоминает последний текст, отправленный в каждый чат.
+Остальные методы отвечают true.
+"""
+import asyncio
+import json
+import time
+from collections import Counter
+from typing import Dict
+from aiohttp import web
+
+BOT_USER = {"id": 1000, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+class FakeTelegram:
+    def __init__(self, latency: float = 0.03):
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self.last_text: Dict[int, str] = {}
+        self._message_id = 0
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        return app
+
+    async def _params(self, request: web.Request) -> Dict:
+        if request.content_type == 'application/json':
+            return await request.json()
+        params = {}
+        for key, value in (await request.post()).items():
+            # Сложные параметры (клавиатуры) приходят JSON-строками
+            try:
+                params[key] = json.loads(value)
+            except (TypeError, ValueError):
+                params[key] = value
+        return params
+
+    def _message(self, params: Dict) -> Dict:
+        self._message_id += 1
+        chat_id = int(params.get("chat_id", 0))
+        return {
+            "message_id": int(params.get("message_id", self._message_id)),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": BOT_USER,
+            "text": str(params.get("text", "")),
+        }
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        self.calls[method] += 1
+        params = await self._params(request)
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+
+        if method == "getMe":
+            result = BOT_USER
+        elif method in ("sendMessage", "editMessageText"):
+            if "chat_id" in params:
+                self.last_text[int(params["chat_id"])] = str(params.get("text", ""))
+            result = self._message(params) if "chat_id" in params else True
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    def get_stats(self) -> Dict:
+        return {"calls": dict(self.calls)}
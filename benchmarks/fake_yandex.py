@@ -0,0 +1,131 @@
+"""
+Локальная замена YandexGPT для нагрузочных тестов
+
+Отвечает на запросы completion (обычные и потоковые) и tokenize. Время ответа
+распределено логнормально вокруг медианы latency, доля ответов 500 и 429
+задается error_rate и throttle_rate. В ответе возвращается исходный текст
+с заглавной первой буквой, чтобы бот проходил весь путь обработки результата.
+
+Отдельный запуск:
+    python benchmarks/fake_yandex.py --port 8081 --latency 0.8
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+from typing import Dict
+from aiohttp import web
+
+USER_PROMPT_PREFIX = "Обработай следующий текст:\n\n"
+
+class FakeYandex:
+    def __init__(self, latency: float = 0.5, sigma: float = 0.3, error_rate: float = 0.0,
+                 throttle_rate: float = 0.0, stream_chunks: int = 5):
+        self.latency = latency
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.stream_chunks = stream_chunks
+
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self.tokenized = 0
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post('/foundationModels/v1/completion', self.completion)
+        app.router.add_post('/foundationModels/v1/tokenize', self.tokenize)
+        return app
+
+    def _delay(self) -> float:
+        if self.latency <= 0:
+            return 0.0
+        return random.lognormvariate(math.log(self.latency), self.sigma)
+
+    @staticmethod
+    def _answer(payload: Dict) -> str:
+        text = payload["messages"][-1]["text"]
+        if text.startswith(USER_PROMPT_PREFIX):
+            text = text[len(USER_PROMPT_PREFIX):]
+        return text[:1].upper() + text[1:]
+
+    @staticmethod
+    def _result(text: str, status: str, payload: Dict) -> Dict:
+        input_chars = sum(len(message["text"]) for message in payload["messages"])
+        return {
+            "result": {
+                "alternatives": [{"message": {"role": "assistant", "text": text}, "status": status}],
+                "usage": {
+                    "inputTextTokens": str(input_chars // 4 + 1),
+                    "completionTokens": str(len(text) // 4 + 1),
+                    "totalTokens": str((input_chars + len(text)) // 4 + 2),
+                },
+                "modelVersion": "fake",
+            }
+        }
+
+    async def completion(self, request: web.Request) -> web.StreamResponse:
+        self.requests += 1
+        payload = await request.json()
+        roll = random.random()
+        if roll < self.throttle_rate:
+            self.throttled += 1
+            return web.Response(status=429, text="Too Many Requests", headers={"Retry-After": "1"})
+        if roll < self.throttle_rate + self.error_rate:
+            await asyncio.sleep(self._delay() / 2)
+            self.errors += 1
+            return web.Response(status=500, text="Internal Server Error")
+
+        answer = self._answer(payload)
+        delay = self._delay()
+        if not payload.get("completionOptions", {}).get("stream"):
+            await asyncio.sleep(delay)
+            return web.json_response(self._result(answer, "ALTERNATIVE_STATUS_FINAL", payload))
+
+        # Потоковый ответ: каждая строка содержит весь накопленный текст
+        response = web.StreamResponse(headers={"Content-Type": "application/json"})
+        await response.prepare(request)
+        chunks = max(1, self.stream_chunks)
+        for i in range(1, chunks + 1):
+            await asyncio.sleep(delay / chunks)
+            final = i == chunks
+            partial = answer[:len(answer) * i // chunks]
+            status = "ALTERNATIVE_STATUS_FINAL" if final else "ALTERNATIVE_STATUS_PARTIAL"
+            await response.write((json.dumps(self._result(partial, status, payload), ensure_ascii=False) + "\n").encode())
+        await response.write_eof()
+        return response
+
+    async def tokenize(self, request: web.Request) -> web.Response:
+        self.tokenized += 1
+        payload = await request.json()
+        return web.json_response({"tokens": [{"id": str(i)} for i in range(len(payload.get("text", "")) // 4 + 1)]})
+
+    def get_stats(self) -> Dict:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "throttled": self.throttled,
+            "tokenized": self.tokenized,
+        }
+
+async def start_server(app: web.Application, host: str, port: int) -> web.AppRunner:
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Локальная замена YandexGPT")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.5, help="медиана времени ответа, секунд")
+    parser.add_argument('--sigma', type=float, default=0.3, help="разброс (логнормальное распределение)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="доля ответов 500")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="доля ответов 429")
+    args = parser.parse_args()
+
+    fake = FakeYandex(args.latency, args.sigma, args.error_rate, args.throttle_rate)
+    print(f"YandexGPT: http://{args.host}:{args.port}/foundationModels/v1/completion")
+    web.run_app(fake.make_app(), host=args.host, port=args.port, access_log=None, print=None)
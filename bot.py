@@ -1,11 +1,28 @@
 import logging
 import asyncio
+import re
+from functools import partial, wraps
+from typing import Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, ContextTypes, filters
-from config import TELEGRAM_TOKEN
-from llm_service import LLMService
+from config import (
+    TELEGRAM_TOKEN, CONCURRENT_UPDATES, MAX_LONG_TEXT_LENGTH, STREAM_RESPONSES, STREAM_EDIT_INTERVAL,
+    TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE, TELEGRAM_GROUP_RATE, TELEGRAM_CHAT_BURST, TELEGRAM_MAX_RETRIES,
+    MAX_TEXT_LENGTH, LLM_ASYNC_JOBS, LLM_ASYNC_MIN_LENGTH, LLM_JOBS_FILE,
+    LLM_JOBS_POLL_INTERVAL, LLM_JOBS_MAX_POLL_INTERVAL, LLM_JOBS_MAX_AGE,
+    BOT_MODE, WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET,
+    METRICS_PORT, METRICS_LISTEN,
+    TRACE_SAMPLE_RATE, TRACE_SLOW_THRESHOLD, TRACE_FILE, TRACE_PROFILE, TRACE_PROFILE_INTERVAL
+)
+from llm_service import LLMService, LLMServiceError
+from llm_jobs import BackgroundJobs
 from user_manager import UserManager
-from telegram_utils import TelegramFormatter
+from telegram_utils import TelegramFormatter, StreamingMessage
+from update_processor import PerUserUpdateProcessor
+from rate_limiter import TelegramRateLimiter
+from webhook_server import WebhookServer, run_webhook
+from metrics import REGISTRY, MetricsServer, HANDLER_LATENCY, MARKDOWN_FALLBACKS, USER_STATES
+from tracing import Tracer, span, traced
 
 # Настройка логирования
 logging.basicConfig(
@@ -14,11 +31,72 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Параметр diff - первое слово после команды (/check diff текст), а не слово в самом тексте
+DIFF_FLAG_RE = re.compile(r'diff(?:\s+|$)', re.IGNORECASE)
+
+# Типы обновлений, которые обрабатывают хендлеры бота: сообщения (команды, текст,
+# пересланные сообщения) и нажатия на кнопки. Остальные Telegram не присылает
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY]
+
+# Заголовки результатов фоновых задач, которые приходят отдельным сообщением
+JOB_RESULT_HEADERS = {
+    "improve_text": "✨ Улучшенный текст:",
+    "shorten_text": "📄 Сокращенный текст:",
+}
+
 class TextBot:
     def __init__(self):
         self.llm_service = LLMService()
+        self.jobs = BackgroundJobs(
+            self.llm_service, LLM_JOBS_FILE,
+            min_length=LLM_ASYNC_MIN_LENGTH, max_length=MAX_TEXT_LENGTH,
+            poll_interval=LLM_JOBS_POLL_INTERVAL, max_poll_interval=LLM_JOBS_MAX_POLL_INTERVAL,
+            max_age=LLM_JOBS_MAX_AGE, enabled=LLM_ASYNC_JOBS
+        )
         self.user_manager = UserManager()
+        self.rate_limiter = TelegramRateLimiter(
+            TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE, TELEGRAM_GROUP_RATE / 60,
+            TELEGRAM_CHAT_BURST, TELEGRAM_MAX_RETRIES
+        )
         self.user_states = {}  # Для отслеживания состояния пользователей
+        self.tracer = Tracer(
+            TRACE_SAMPLE_RATE, TRACE_SLOW_THRESHOLD, TRACE_FILE, TRACE_PROFILE, TRACE_PROFILE_INTERVAL
+        )
+        self.metrics_server = MetricsServer(REGISTRY, METRICS_LISTEN, METRICS_PORT) if METRICS_PORT else None
+        self.register_metrics()
+    
+    def register_metrics(self):
+        """Публикует статистику компонентов в реестре метрик (читается только при запросе /metrics)"""
+        USER_STATES.function = lambda: len(self.user_states)
+        REGISTRY.register_stats("llm", self.llm_service.get_stats)
+        REGISTRY.register_stats("llm_scheduler", self.llm_service.scheduler.get_stats)
+        REGISTRY.register_stats("llm_cache", self.llm_service.cache.get_stats)
+        REGISTRY.register_stats("llm_router", self.llm_service.router.get_stats)
+        REGISTRY.register_stats("llm_tokens", self.llm_service.token_budget.get_stats)
+        REGISTRY.register_stats("precheck", self.llm_service.precheck.get_stats)
+        REGISTRY.register_stats("jobs", self.jobs.get_stats)
+        REGISTRY.register_stats("telegram_outgoing", self.rate_limiter.get_stats)
+        REGISTRY.register_stats("users", self.user_manager.get_stats)
+        REGISTRY.register_stats("tracing", self.tracer.get_stats)
+    
+    async def post_init(self, application: Application):
+        """Вызывается после инициализации приложения: прогреваем пул соединений с YandexGPT"""
+        await self.llm_service.start()
+        if isinstance(application.update_processor, PerUserUpdateProcessor):
+            REGISTRY.register_stats("updates", application.update_processor.get_stats)
+        if self.metrics_server:
+            await self.metrics_server.start()
+        # Фоновые задачи (в том числе оставшиеся с прошлого запуска) доставляются через бота приложения
+        self.jobs.deliver = partial(self.deliver_job_result, application.bot)
+        self.jobs.start()
+    
+    async def post_shutdown(self, application: Application):
+        """Вызывается при остановке приложения: закрываем пул соединений и хранилище"""
+        await self.jobs.stop()
+        if self.metrics_server:
+            await self.metrics_server.stop()
+        await self.llm_service.close()
+        self.user_manager.close()
     
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /start"""
@@ -64,7 +142,7 @@ class TextBot:
     
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /help"""
-        help_text = """
+        help_text = f"""
 📚 **Как использовать бота:**
 
 1️⃣ **Проверить грамотность** - исправляет орфографические и пунктуационные ошибки, сохраняя стиль текста
@@ -80,6 +158,7 @@ class TextBot:
 /help - Эта справка
 /check [текст] - Проверить грамотность
 /check [текст] nodot - Проверить грамотность без точек в конце абзацев
+/check diff [текст] - Показать только исправленные фрагменты
 /improve [текст] - Улучшить текст  
 /improve [текст] nodot - Улучшить текст без точек в конце абзацев
 /shorten [текст] - Сократить текст
@@ -100,6 +179,7 @@ class TextBot:
 **Примеры:**
 /check Привет как дела
 /check Привет как дела nodot
+/check diff Привет как дела
 /improve Текст с ошибками
 /improve Текст с ошибками nodot
 /shorten Очень длинный текст который нужно сократить
@@ -108,7 +188,7 @@ class TextBot:
 /translate uz Как дела
 /translate am Добрый день
 
-Максимальная длина текста: 4000 символов
+Максимальная длина текста: {MAX_LONG_TEXT_LENGTH} символов
         """
         await update.message.reply_text(help_text, parse_mode='Markdown')
     
@@ -138,12 +218,19 @@ class TextBot:
             # Убираем nodot из текста
             text = text.replace('nodot', '').replace('NODOT', '').strip()
         
+        # Проверяем параметр diff: в ответе только исправленные фрагменты
+        diff_flag = DIFF_FLAG_RE.match(text)
+        changes_only = diff_flag is not None
+        if changes_only:
+            text = text[diff_flag.end():].strip()
+        
         # Обрабатываем многострочные сообщения
         if text:
             text = text.replace('\r\n', '\n').replace('\r', '\n')
-            await self.process_check_text(update, text, no_dot)
+            await self.process_check_text(update, text, no_dot, changes_only)
         else:
-            self.user_states[user_id] = "waiting_for_text_check"
+            # Параметр diff сохраняется вместе с ожиданием текста
+            self.user_states[user_id] = "waiting_for_text_check_diff" if changes_only else "waiting_for_text_check"
             await update.message.reply_text("📝 Отправьте текст для проверки грамотности:")
     
     async def improve_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -299,6 +386,40 @@ class TextBot:
             else:
                 stats_text += "\nПока нет данных о пользователях"
             
+            outgoing = self.rate_limiter.get_stats()
+            stats_text += (
+                f"\n\n📤 Исходящие сообщения:"
+                f"\n• Отправлено: {outgoing['sent']}"
+                f"\n• Задержано лимитом: {outgoing['throttled']} (в очереди сейчас {outgoing['queued']}, "
+                f"максимум {outgoing['max_queued']})"
+                f"\n• Повторов после 429: {outgoing['retries']}"
+                f"\n• Схлопнуто редактирований: {outgoing['coalesced']}"
+            )
+            
+            routing = self.llm_service.router.get_stats()
+            stats_text += f"\n\n🤖 Модели (переключений: {routing['fallbacks']}):"
+            for model, model_stats in routing['models'].items():
+                p95 = f"{model_stats['p95']:.1f} с" if model_stats['p95'] is not None else "нет данных"
+                stats_text += (
+                    f"\n• {model}: {model_stats['requests']} запросов, ошибок {model_stats['errors']}, "
+                    f"p95 {p95}, предохранитель {model_stats['breaker']}"
+                )
+            
+            precheck = self.llm_service.precheck.get_stats()
+            if precheck['checked']:
+                stats_text += (
+                    f"\n\n📖 Предпроверка /check: {precheck['checked']} текстов"
+                    f"\n• Без запроса к модели: {precheck['skip_rate']:.0%}"
+                    f"\n• Пропущено предложений: {precheck['sentence_skip_rate']:.0%}"
+                )
+            
+            reused = self.llm_service.reused_paragraphs
+            if reused:
+                stats_text += (
+                    f"\n\n♻️ Абзацы /check: взято из кэша {reused}, "
+                    f"проверено заново {self.llm_service.checked_paragraphs}"
+                )
+            
             await update.message.reply_text(stats_text)
             
         except Exception as e:
@@ -351,7 +472,7 @@ class TextBot:
             await query.edit_message_text("🌐 Для перевода используйте команду:\n\n/translate [язык] [текст]\n\nПоддерживаемые языки:\n• en - английский\n• uz - узбекский\n• am - армянский\n• ru - русский (автоопределение языка)\n\nПримеры:\n/translate en Привет мир\n/translate ru Hello world\n/translate uz Как дела\n/translate ru Salom dunyo")
         
         elif query.data == "help":
-            help_text = """
+            help_text = f"""
 📚 **Как использовать бота:**
 
 1️⃣ **Проверить грамотность** - исправляет орфографические и пунктуационные ошибки, сохраняя стиль текста
@@ -367,6 +488,7 @@ class TextBot:
 /help - Эта справка
 /check [текст] - Проверить грамотность
 /check [текст] nodot - Проверить грамотность без точек в конце абзацев
+/check diff [текст] - Показать только исправленные фрагменты
 /improve [текст] - Улучшить текст  
 /improve [текст] nodot - Улучшить текст без точек в конце абзацев
 /shorten [текст] - Сократить текст
@@ -382,6 +504,7 @@ class TextBot:
 **Примеры:**
 /check Привет как дела
 /check Привет как дела nodot
+/check diff Привет как дела
 /improve Текст с ошибками
 /improve Текст с ошибками nodot
 /shorten Очень длинный текст который нужно сократить
@@ -391,7 +514,7 @@ class TextBot:
 /translate uz Как дела
 /translate ru Salom dunyo
 
-Максимальная длина текста: 4000 символов
+Максимальная длина текста: {MAX_LONG_TEXT_LENGTH} символов
             """
             await query.edit_message_text(help_text, parse_mode='Markdown')
     
@@ -400,45 +523,64 @@ class TextBot:
         user_id = update.effective_user.id
         message = update.message
         
-        # Извлекаем текст и форматирование
-        text, entities = TelegramFormatter.extract_text_and_entities(message)
-        
-        # Обрабатываем многострочные сообщения
-        if text and '\n' in text:
-            # Нормализуем переносы строк
-            text = text.replace('\r\n', '\n').replace('\r', '\n')
+        with span("state_lookup"):
+            # Извлекаем текст и форматирование
+            text, entities = TelegramFormatter.extract_text_and_entities(message)
+            
+            # Обрабатываем многострочные сообщения
+            if text and '\n' in text:
+                # Нормализуем переносы строк
+                text = text.replace('\r\n', '\n').replace('\r', '\n')
+            
+            state = self.user_states.get(user_id)
         
-        if user_id not in self.user_states:
+        if state is None:
             # Если пользователь не в состоянии ожидания, показываем главное меню
             await self.start(update, context)
             return
         
-        state = self.user_states[user_id]
+        # В режиме diff ответ показывается только целиком, без потокового вывода
+        changes_only = state == "waiting_for_text_check_diff"
         
         # Отправляем сообщение о начале обработки
         processing_msg = await update.message.reply_text("🔄 Обрабатываю текст...")
+        on_queued = self.make_queue_notifier(processing_msg, "🔄 Обрабатываю текст...")
+        stream = None if changes_only else self.make_stream(processing_msg, "🔄 Обрабатываю текст...")
+        on_partial = stream.update if stream else None
         
         try:
             # Очищаем текст от форматирования для LLM
-            clean_text = TelegramFormatter.clean_formatting_for_llm(text)
+            with span("clean_formatting"):
+                clean_text = TelegramFormatter.clean_formatting_for_llm(text)
             
-            if state == "waiting_for_text_check":
+            if state in ("waiting_for_text_check", "waiting_for_text_check_diff"):
                 # Записываем запрос
                 self.user_manager.record_request(user_id, "check_grammar")
-                result = await self.llm_service.check_grammar(clean_text)
-                await self.send_result_message(update, result, "check", processing_msg)
+                result = await self.llm_service.check_grammar(
+                    clean_text, user_id=user_id, on_queued=on_queued, on_partial=on_partial,
+                    changes_only=changes_only
+                )
+                await self.send_result_message(update, result, "check", processing_msg, await self.finish_stream(stream))
             
             elif state == "waiting_for_text_improve":
                 # Записываем запрос
                 self.user_manager.record_request(user_id, "improve_text")
-                result = await self.llm_service.improve_text(clean_text)
-                await self.send_result_message(update, result, "improve", processing_msg)
+                if await self.submit_background_job(update, clean_text, "improve_text", False, processing_msg):
+                    return
+                result = await self.llm_service.improve_text(
+                    clean_text, user_id=user_id, on_queued=on_queued, on_partial=on_partial
+                )
+                await self.send_result_message(update, result, "improve", processing_msg, await self.finish_stream(stream))
             
             elif state == "waiting_for_text_shorten":
                 # Записываем запрос
                 self.user_manager.record_request(user_id, "shorten_text")
-                result = await self.llm_service.shorten_text(clean_text)
-                await self.send_result_message(update, result, "shorten", processing_msg)
+                if await self.submit_background_job(update, clean_text, "shorten_text", False, processing_msg):
+                    return
+                result = await self.llm_service.shorten_text(
+                    clean_text, user_id=user_id, on_queued=on_queued, on_partial=on_partial
+                )
+                await self.send_result_message(update, result, "shorten", processing_msg, await self.finish_stream(stream))
             
             elif state == "waiting_for_text_translate":
                 # Записываем запрос
@@ -447,6 +589,7 @@ class TextBot:
                 await processing_msg.edit_text("🌐 Для перевода используйте команду:\n/translate [язык] [текст]\n\nПоддерживаемые языки:\n• en - английский\n• uz - узбекский\n• am - армянский\n• ru - русский (автоопределение языка)\n\nПримеры:\n/translate en Привет мир\n/translate ru Hello world")
         
         except Exception as e:
+            await self.finish_stream(stream)
             await processing_msg.edit_text(f"❌ Произошла ошибка: {str(e)}")
             logger.error(f"Ошибка при обработке текста: {e}")
         
@@ -455,22 +598,112 @@ class TextBot:
             if user_id in self.user_states:
                 del self.user_states[user_id]
     
-    async def send_result_message(self, update: Update, result: str, operation: str, processing_msg=None):
-        """Отправляет результат отдельным сообщением"""
+    def make_queue_notifier(self, processing_msg, processing_text: str):
+        """Создает колбэк, который показывает позицию в очереди в сообщении о обработке"""
+        async def on_queued(position: int):
+            await processing_msg.edit_text(f"{processing_text}\n⏳ Место в очереди: {position}")
+        return on_queued
+    
+    async def submit_background_job(self, update: Update, text: str, task_type: str, no_dot: bool,
+                                    processing_msg) -> bool:
+        """
+        Отправляет длинный текст на фоновую обработку
+        
+        Returns:
+            True, если ответ уже отправлен или придет отдельным сообщением;
+            False - текст нужно обработать обычным запросом
+        """
+        if not self.jobs.accepts(text, task_type):
+            return False
+        
         try:
-            # Удаляем сообщение о обработке
-            if processing_msg:
-                await processing_msg.delete()
+            cached_result = await self.jobs.submit(
+                text, task_type, no_dot, update.effective_chat.id, update.message.message_id,
+                update.effective_user.id
+            )
+        except LLMServiceError as e:
+            logger.warning(f"Не удалось создать фоновую задачу, обрабатываем обычным запросом: {e}")
+            return False
+        
+        if cached_result is not None:
+            await self.send_result_message(update, cached_result, task_type, processing_msg)
+        else:
+            await processing_msg.edit_text(
+                "⏳ Текст длинный, обработка займет некоторое время.\n"
+                "Пришлю результат отдельным сообщением."
+            )
+        return True
+    
+    async def deliver_job_result(self, bot, job: dict, result: str):
+        """Отправляет результат фоновой задачи в чат пользователя"""
+        header = JOB_RESULT_HEADERS.get(job["task_type"], "✅ Результат:")
+        parts = TelegramFormatter.split_long_message(result)
+        
+        for i, part in enumerate(parts, 1):
+            if len(parts) == 1:
+                text = f"{header}\n\n{part}"
+            else:
+                text = f"{header}\n📄 Часть {i}/{len(parts)}:\n\n{part}"
             
+            message_kwargs = {
+                "chat_id": job["chat_id"],
+                "reply_to_message_id": job.get("reply_to_message_id"),
+                "allow_sending_without_reply": True,
+            }
+            try:
+                await bot.send_message(text=text, parse_mode='Markdown', **message_kwargs)
+            except Exception as parse_error:
+                # Если Markdown не работает, отправляем как обычный текст
+                logger.warning(f"Ошибка Markdown парсинга, отправляем как обычный текст: {parse_error}")
+                await bot.send_message(text=text, **message_kwargs)
+    
+    def make_stream(self, processing_msg, processing_text: str):
+        """Создает потоковое обновление сообщения о обработке (None, если потоковый вывод выключен)"""
+        if not STREAM_RESPONSES:
+            return None
+        return StreamingMessage(processing_msg, processing_text, STREAM_EDIT_INTERVAL)
+    
+    @staticmethod
+    async def finish_stream(stream) -> bool:
+        """Останавливает потоковое обновление; возвращает, показывался ли в сообщении частичный ответ"""
+        if stream is None:
+            return False
+        await stream.close()
+        return stream.started
+    
+    @traced("send_result")
+    async def send_result_message(self, update: Update, result: str, operation: str, processing_msg=None,
+                                  edit_processing: bool = False):
+        """
+        Отправляет результат отдельным сообщением
+        
+        Если в сообщении о обработке уже показывался частичный ответ (edit_processing),
+        короткий результат заменяет его на месте, чтобы текст не прыгал в чате.
+        """
+        try:
             # Разбиваем длинное сообщение на части
             parts = TelegramFormatter.split_long_message(result)
             
+            if edit_processing and processing_msg and len(parts) == 1:
+                try:
+                    await processing_msg.edit_text(result, parse_mode='Markdown')
+                except Exception as parse_error:
+                    MARKDOWN_FALLBACKS.inc()
+                    logger.warning(f"Ошибка Markdown парсинга, отправляем как обычный текст: {parse_error}")
+                    await processing_msg.edit_text(result)
+                return
+            
+            # Удаляем сообщение о обработке
+            if processing_msg:
+                await processing_msg.delete()
+            
             if len(parts) == 1:
                 # Отправляем одно сообщение с Markdown форматированием
                 try:
                     await update.message.reply_text(result, parse_mode='Markdown')
                 except Exception as parse_error:
                     # Если Markdown не работает, отправляем как обычный текст
+                    MARKDOWN_FALLBACKS.inc()
                     logger.warning(f"Ошибка Markdown парсинга, отправляем как обычный текст: {parse_error}")
                     await update.message.reply_text(result)
             else:
@@ -483,6 +716,7 @@ class TextBot:
                             await update.message.reply_text(f"📄 Часть {i}/{len(parts)}:\n\n{part}", parse_mode='Markdown')
                     except Exception as parse_error:
                         # Если Markdown не работает, отправляем как обычный текст
+                        MARKDOWN_FALLBACKS.inc()
                         logger.warning(f"Ошибка Markdown парсинга для части {i}, отправляем как обычный текст: {parse_error}")
                         if i == 1:
                             await update.message.reply_text(f"📄 Часть {i}/{len(parts)}:\n\n{part}")
@@ -567,7 +801,7 @@ class TextBot:
         # Сохраняем полный текст для обработки
         self.user_states[user_id] = f"forwarded_text:{text}"
     
-    async def process_check_text(self, update: Update, text: str, no_dot: bool = False):
+    async def process_check_text(self, update: Update, text: str, no_dot: bool = False, changes_only: bool = False):
         """Обрабатывает текст для проверки грамотности"""
         user_id = update.effective_user.id
         
@@ -575,10 +809,16 @@ class TextBot:
         self.user_manager.record_request(user_id, "check_grammar")
         
         processing_msg = await update.message.reply_text("🔄 Проверяю грамотность...")
+        on_queued = self.make_queue_notifier(processing_msg, "🔄 Проверяю грамотность...")
+        # Список исправлений строится по готовому ответу, поэтому весь текст по мере генерации не показываем
+        stream = None if changes_only else self.make_stream(processing_msg, "🔄 Проверяю грамотность...")
         try:
-            result = await self.llm_service.check_grammar(text, no_dot)
-            await self.send_result_message(update, result, "check", processing_msg)
+            result = await self.llm_service.check_grammar(
+                text, no_dot, user_id, on_queued, stream.update if stream else None, changes_only
+            )
+            await self.send_result_message(update, result, "check", processing_msg, await self.finish_stream(stream))
         except Exception as e:
+            await self.finish_stream(stream)
             await processing_msg.edit_text(f"❌ Произошла ошибка: {str(e)}")
             logger.error(f"Ошибка при проверке грамотности: {e}")
     
@@ -590,10 +830,15 @@ class TextBot:
         self.user_manager.record_request(user_id, "improve_text")
         
         processing_msg = await update.message.reply_text("🔄 Улучшаю текст...")
+        on_queued = self.make_queue_notifier(processing_msg, "🔄 Улучшаю текст...")
+        stream = self.make_stream(processing_msg, "🔄 Улучшаю текст...")
         try:
-            result = await self.llm_service.improve_text(text, no_dot)
-            await self.send_result_message(update, result, "improve", processing_msg)
+            if await self.submit_background_job(update, text, "improve_text", no_dot, processing_msg):
+                return
+            result = await self.llm_service.improve_text(text, no_dot, user_id, on_queued, stream.update if stream else None)
+            await self.send_result_message(update, result, "improve", processing_msg, await self.finish_stream(stream))
         except Exception as e:
+            await self.finish_stream(stream)
             await processing_msg.edit_text(f"❌ Произошла ошибка: {str(e)}")
             logger.error(f"Ошибка при улучшении текста: {e}")
     
@@ -605,10 +850,15 @@ class TextBot:
         self.user_manager.record_request(user_id, "shorten_text")
         
         processing_msg = await update.message.reply_text("🔄 Сокращаю текст...")
+        on_queued = self.make_queue_notifier(processing_msg, "🔄 Сокращаю текст...")
+        stream = self.make_stream(processing_msg, "🔄 Сокращаю текст...")
         try:
-            result = await self.llm_service.shorten_text(text, no_dot)
-            await self.send_result_message(update, result, "shorten", processing_msg)
+            if await self.submit_background_job(update, text, "shorten_text", no_dot, processing_msg):
+                return
+            result = await self.llm_service.shorten_text(text, no_dot, user_id, on_queued, stream.update if stream else None)
+            await self.send_result_message(update, result, "shorten", processing_msg, await self.finish_stream(stream))
         except Exception as e:
+            await self.finish_stream(stream)
             await processing_msg.edit_text(f"❌ Произошла ошибка: {str(e)}")
             logger.error(f"Ошибка при сокращении текста: {e}")
     
@@ -639,10 +889,16 @@ class TextBot:
             result_text = f"🌐 **Перевод {direction}:**"
         
         processing_msg = await update.message.reply_text(processing_text)
+        on_queued = self.make_queue_notifier(processing_msg, processing_text)
+        stream = self.make_stream(processing_msg, processing_text)
         try:
-            result = await self.llm_service.translate_text(text, target_language, no_dot)
+            result = await self.llm_service.translate_text(
+                text, target_language, no_dot, user_id, on_queued, stream.update if stream else None
+            )
+            await self.finish_stream(stream)
             await processing_msg.edit_text(f"{result_text}\n\n{result}", parse_mode='Markdown')
         except Exception as e:
+            await self.finish_stream(stream)
             await processing_msg.edit_text(f"❌ Произошла ошибка: {str(e)}")
             logger.error(f"Ошибка при переводе текста: {e}")
     
@@ -652,40 +908,83 @@ class TextBot:
         if update and update.effective_message:
             await update.effective_message.reply_text("❌ Произошла ошибка. Попробуйте позже.")
 
-def main():
-    """Основная функция запуска бота"""
-    if not TELEGRAM_TOKEN:
-        logger.error("TELEGRAM_TOKEN не найден в переменных окружения")
-        return
+def build_application(bot: TextBot, base_url: Optional[str] = None) -> Application:
+    """
+    Создает приложение Telegram с обработчиками бота
     
-    # Создаем экземпляр бота
-    bot = TextBot()
+    Args:
+        bot: Экземпляр TextBot
+        base_url: Адрес Bot API (по умолчанию api.telegram.org; бенчмарки подставляют локальный сервер)
+    """
+    builder = (
+        Application.builder()
+        .token(TELEGRAM_TOKEN)
+        .post_init(bot.post_init)
+        .post_shutdown(bot.post_shutdown)
+        .rate_limiter(bot.rate_limiter)
+    )
+    if base_url:
+        builder = builder.base_url(base_url)
+    
+    # Параллельная обработка обновлений с сохранением порядка для каждого пользователя
+    if CONCURRENT_UPDATES > 1:
+        builder = builder.concurrent_updates(PerUserUpdateProcessor(CONCURRENT_UPDATES))
+    
+    application = builder.build()
     
-    # Создаем приложение
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+    # Добавляем обработчики; время работы каждого попадает в метрику bot_handler_seconds,
+    # а часть обновлений (TRACE_SAMPLE_RATE) трассируется
+    def timed(callback):
+        name = callback.__name__
+        
+        @HANDLER_LATENCY.time(name)
+        @wraps(callback)
+        async def handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            user = update.effective_user if isinstance(update, Update) else None
+            with bot.tracer.trace(name, update_id=getattr(update, "update_id", None), user_id=user.id if user else None):
+                return await callback(update, context)
+        return handler
     
-    # Добавляем обработчики
-    application.add_handler(CommandHandler("start", bot.start))
-    application.add_handler(CommandHandler("help", bot.help_command))
-    application.add_handler(CommandHandler("check", bot.check_command))
-    application.add_handler(CommandHandler("improve", bot.improve_command))
-    application.add_handler(CommandHandler("shorten", bot.shorten_command))
-    application.add_handler(CommandHandler("translate", bot.translate_command))
-    application.add_handler(CommandHandler("stats", bot.stats_command))
+    application.add_handler(CommandHandler("start", timed(bot.start)))
+    application.add_handler(CommandHandler("help", timed(bot.help_command)))
+    application.add_handler(CommandHandler("check", timed(bot.check_command)))
+    application.add_handler(CommandHandler("improve", timed(bot.improve_command)))
+    application.add_handler(CommandHandler("shorten", timed(bot.shorten_command)))
+    application.add_handler(CommandHandler("translate", timed(bot.translate_command)))
+    application.add_handler(CommandHandler("stats", timed(bot.stats_command)))
     
     # Обработчики для кнопок и текста
-    application.add_handler(CallbackQueryHandler(bot.button_callback))
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, bot.handle_text))
+    application.add_handler(CallbackQueryHandler(timed(bot.button_callback)))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, timed(bot.handle_text)))
     
     # Обработчик пересланных сообщений
-    application.add_handler(MessageHandler(filters.FORWARDED & filters.TEXT, bot.handle_forwarded_message))
+    application.add_handler(MessageHandler(filters.FORWARDED & filters.TEXT, timed(bot.handle_forwarded_message)))
     
     # Обработчик ошибок
     application.add_error_handler(bot.error_handler)
     
+    return application
+
+def main():
+    """Основная функция запуска бота"""
+    if not TELEGRAM_TOKEN:
+        logger.error("TELEGRAM_TOKEN не найден в переменных окружения")
+        return
+    
+    # Создаем экземпляр бота и приложение
+    bot = TextBot()
+    application = build_application(bot)
+    
     # Запускаем бота
-    logger.info("Бот запущен...")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if BOT_MODE == "webhook":
+        if not WEBHOOK_SECRET:
+            logger.warning("WEBHOOK_SECRET не задан, webhook-запросы не проверяются")
+        server = WebhookServer(application, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET)
+        logger.info("Бот запущен в режиме webhook...")
+        asyncio.run(run_webhook(application, server, WEBHOOK_URL, ALLOWED_UPDATES))
+    else:
+        logger.info("Бот запущен...")
+        application.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 if __name__ == '__main__':
     main() 
\ No newline at end of file
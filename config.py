@@ -6,16 +6,156 @@ load_dotenv()
 # Telegram Bot Token
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
 
+# Режим получения обновлений: "polling" (по умолчанию) или "webhook"
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+
+# Настройки webhook-режима
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')  # публичный адрес, например https://bot.example.com
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')  # секретный токен для проверки запросов от Telegram
+
+# Метрики в формате Prometheus: GET http://METRICS_LISTEN:METRICS_PORT/metrics (0 - не запускать)
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+METRICS_LISTEN = os.getenv('METRICS_LISTEN', '127.0.0.1')
+
+# Трассировка обновлений: доля трассируемых обновлений (0 - выключена, 1 - все);
+# трассы дольше TRACE_SLOW_THRESHOLD секунд дописываются в TRACE_FILE (JSONL)
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', '0'))
+TRACE_SLOW_THRESHOLD = float(os.getenv('TRACE_SLOW_THRESHOLD', '5'))
+TRACE_FILE = os.getenv('TRACE_FILE', 'slow_traces.jsonl')
+# Статистический профилировщик для трассируемых обновлений: стек снимается раз в TRACE_PROFILE_INTERVAL секунд
+TRACE_PROFILE = os.getenv('TRACE_PROFILE', 'false').lower() in ('1', 'true', 'yes')
+TRACE_PROFILE_INTERVAL = float(os.getenv('TRACE_PROFILE_INTERVAL', '0.005'))
+
 # Yandex Cloud API Key (более дешевый и качественный для русского языка)
 YANDEX_API_KEY = os.getenv('YANDEX_API_KEY')
 YANDEX_FOLDER_ID = os.getenv('YANDEX_FOLDER_ID')
 
 # YandexGPT Model (лучше работает с русским языком)
-YANDEX_MODEL = "yandexgpt-lite"  # или "yandexgpt" для более качественной модели
+YANDEX_MODEL = os.getenv('YANDEX_MODEL', 'yandexgpt-lite')  # или "yandexgpt" для более качественной модели
+
+# Выбор модели для каждого запроса: задачи из ROUTER_PRO_TASKS (через запятую) с текстом
+# не длиннее ROUTER_PRO_MAX_LENGTH идут в YANDEX_MODEL_PRO, остальные - в YANDEX_MODEL.
+# Если модель недоступна, часто ошибается или отвечает медленнее ROUTER_LATENCY_TARGET (p95, секунд),
+# запрос направляется в другую модель. Решения и результаты пишутся в ROUTER_LOG_FILE (JSONL)
+MODEL_ROUTING = os.getenv('MODEL_ROUTING', 'true').lower() in ('1', 'true', 'yes')
+YANDEX_MODEL_PRO = os.getenv('YANDEX_MODEL_PRO', 'yandexgpt')
+ROUTER_PRO_TASKS = [task.strip() for task in os.getenv('ROUTER_PRO_TASKS', '').split(',') if task.strip()]
+ROUTER_PRO_MAX_LENGTH = int(os.getenv('ROUTER_PRO_MAX_LENGTH', '2000'))
+ROUTER_LATENCY_TARGET = float(os.getenv('ROUTER_LATENCY_TARGET', '10'))
+ROUTER_MAX_ERROR_RATE = float(os.getenv('ROUTER_MAX_ERROR_RATE', '0.3'))
+ROUTER_LOG_FILE = os.getenv('ROUTER_LOG_FILE', '')
+
+# Адрес API (можно указать локальную заглушку для тестов)
+YANDEX_API_URL = os.getenv('YANDEX_API_URL', 'https://llm.api.cloud.yandex.net/foundationModels/v1/completion')
+YANDEX_ASYNC_API_URL = os.getenv(
+    'YANDEX_ASYNC_API_URL', 'https://llm.api.cloud.yandex.net/foundationModels/v1/completionAsync'
+)
+YANDEX_OPERATIONS_URL = os.getenv('YANDEX_OPERATIONS_URL', 'https://operation.api.cloud.yandex.net/operations')
+YANDEX_TOKENIZE_URL = os.getenv('YANDEX_TOKENIZE_URL', 'https://llm.api.cloud.yandex.net/foundationModels/v1/tokenize')
 
-# Максимальная длина текста для обработки
+# Максимальная длина текста для обработки одним запросом
 MAX_TEXT_LENGTH = 4000
 
+# Более длинные тексты делятся на части и обрабатываются параллельно
+MAX_LONG_TEXT_LENGTH = int(os.getenv('MAX_LONG_TEXT_LENGTH', '40000'))
+CHUNK_MAX_TOKENS = int(os.getenv('CHUNK_MAX_TOKENS', '1000'))  # бюджет токенов на одну часть
+CHUNK_CONCURRENCY = int(os.getenv('CHUNK_CONCURRENCY', '5'))  # сколько частей одного текста обрабатывать одновременно
+
+# Бюджет токенов: maxTokens рассчитывается по числу токенов текста и ожидаемой длине ответа
+# Точный подсчет токенов через API (по умолчанию выключен: лишний запрос перед ответом модели);
+# даже включенный, используется только когда локальная оценка близка к размеру контекста
+LLM_TOKENIZER = os.getenv('LLM_TOKENIZER', 'false').lower() in ('1', 'true', 'yes')
+LLM_TOKENIZER_TIMEOUT = float(os.getenv('LLM_TOKENIZER_TIMEOUT', '2'))  # секунд, затем локальная оценка
+LLM_CONTEXT_TOKENS = int(os.getenv('LLM_CONTEXT_TOKENS', '8000'))  # размер контекста модели
+LLM_MIN_OUTPUT_TOKENS = int(os.getenv('LLM_MIN_OUTPUT_TOKENS', '100'))
+LLM_MAX_OUTPUT_TOKENS = int(os.getenv('LLM_MAX_OUTPUT_TOKENS', '8000'))
+TOKEN_STATS_FILE = os.getenv('TOKEN_STATS_FILE', '')  # файл для сохранения статистики токенов между перезапусками
+
+# Локальная предпроверка /check: текст, в котором все слова есть в словаре и не сработали
+# правила пунктуации, возвращается без запроса к YandexGPT. Словарь собирается командой
+# python spell_precheck.py build words.txt ru_words.dic; пустое значение отключает предпроверку
+SPELL_DICT_FILE = os.getenv('SPELL_DICT_FILE', '')
+# Если подозрительных предложений больше этой доли текста (по символам), текст целиком уходит одним запросом
+SPELL_PRECHECK_MAX_SHARE = float(os.getenv('SPELL_PRECHECK_MAX_SHARE', '0.5'))
+
+# Пул HTTP-соединений к YandexGPT (общий для всех задач)
+LLM_POOL_SIZE = int(os.getenv('LLM_POOL_SIZE', '20'))  # максимум одновременных соединений
+LLM_POOL_WARMUP = int(os.getenv('LLM_POOL_WARMUP', '2'))  # сколько соединений открыть при старте
+LLM_KEEPALIVE_TIMEOUT = int(os.getenv('LLM_KEEPALIVE_TIMEOUT', '60'))  # секунд держать простаивающее соединение
+LLM_REQUEST_TIMEOUT = int(os.getenv('LLM_REQUEST_TIMEOUT', '30'))  # таймаут запроса в секундах
+
+# Повторы после временных ошибок (429, 5xx, таймаут, сеть) с экспоненциальной задержкой
+LLM_RETRY_ATTEMPTS = int(os.getenv('LLM_RETRY_ATTEMPTS', '3'))  # всего попыток (1 - без повторов)
+LLM_RETRY_BASE_DELAY = float(os.getenv('LLM_RETRY_BASE_DELAY', '0.5'))
+LLM_RETRY_MAX_DELAY = float(os.getenv('LLM_RETRY_MAX_DELAY', '8'))
+
+# Предохранитель: после LLM_BREAKER_THRESHOLD ошибок подряд запросы отклоняются сразу,
+# через LLM_BREAKER_RESET секунд отправляется пробный запрос
+LLM_BREAKER_THRESHOLD = int(os.getenv('LLM_BREAKER_THRESHOLD', '5'))
+LLM_BREAKER_RESET = float(os.getenv('LLM_BREAKER_RESET', '30'))
+
+# Дублирующий запрос, если ответ задерживается дольше p95 (но не раньше LLM_HEDGE_MIN_DELAY секунд)
+LLM_HEDGE_REQUESTS = os.getenv('LLM_HEDGE_REQUESTS', 'false').lower() in ('1', 'true', 'yes')
+LLM_HEDGE_MIN_DELAY = float(os.getenv('LLM_HEDGE_MIN_DELAY', '1'))
+
+# Фоновые задачи (по умолчанию выключены): длинные тексты для улучшения и сокращения
+# отправляются в асинхронный режим YandexGPT (completionAsync), результат приходит отдельным
+# сообщением. Для генераций, которые не укладываются в таймаут обычного запроса; такие
+# запросы не показываются потоково и не объединяются с одинаковыми.
+# Незавершенные операции сохраняются в LLM_JOBS_FILE и не теряются при перезапуске
+LLM_ASYNC_JOBS = os.getenv('LLM_ASYNC_JOBS', 'false').lower() in ('1', 'true', 'yes')
+LLM_ASYNC_MIN_LENGTH = int(os.getenv('LLM_ASYNC_MIN_LENGTH', '2000'))  # с какой длины текста (символов)
+LLM_JOBS_FILE = os.getenv('LLM_JOBS_FILE', 'llm_jobs.json')
+LLM_JOBS_POLL_INTERVAL = float(os.getenv('LLM_JOBS_POLL_INTERVAL', '1'))  # первая проверка операции, секунд
+LLM_JOBS_MAX_POLL_INTERVAL = float(os.getenv('LLM_JOBS_MAX_POLL_INTERVAL', '15'))
+# Операция, результат которой не получен за это время (например, удаленная на стороне YandexGPT),
+# завершается с ошибкой, а не проверяется бесконечно
+LLM_JOBS_MAX_AGE = float(os.getenv('LLM_JOBS_MAX_AGE', '3600'))  # секунд с создания задачи
+
+# Параллельная обработка обновлений: сообщения разных пользователей обрабатываются
+# одновременно, сообщения одного пользователя - по очереди (1 - последовательный режим)
+CONCURRENT_UPDATES = int(os.getenv('CONCURRENT_UPDATES', '32'))
+
+# Максимум одновременных запросов к YandexGPT (по квоте облака);
+# остальные запросы ждут в очереди, которая обходит пользователей по кругу
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '10'))
+
+# Кэш результатов YandexGPT
+LLM_CACHE_SIZE = int(os.getenv('LLM_CACHE_SIZE', '1000'))  # максимум записей (0 - кэш отключен)
+LLM_CACHE_TTL = int(os.getenv('LLM_CACHE_TTL', '86400'))  # срок жизни записи в секундах
+LLM_CACHE_FILE = os.getenv('LLM_CACHE_FILE', '')  # файл для сохранения кэша между перезапусками
+# Кэш /check по абзацам: при повторной отправке текста в YandexGPT уходят только измененные абзацы
+LLM_PARAGRAPH_CACHE = os.getenv('LLM_PARAGRAPH_CACHE', 'true').lower() in ('1', 'true', 'yes')
+
+# Версия промптов: увеличьте при изменении SYSTEM_PROMPTS, чтобы сбросить кэш
+PROMPT_VERSION = os.getenv('PROMPT_VERSION', '1')
+
+# Хранилище данных пользователей: "json" (users.json) или "sqlite" (USER_DB_FILE, режим WAL).
+# При переходе на sqlite данные из users.json переносятся автоматически
+USER_STORAGE = os.getenv('USER_STORAGE', 'json')
+USER_DB_FILE = os.getenv('USER_DB_FILE', 'users.db')
+
+# Отложенная запись (users.json и SQLite): изменения сбрасываются фоновым потоком раз в
+# USERS_FLUSH_INTERVAL секунд или после USERS_FLUSH_EVERY изменений
+USERS_FLUSH_INTERVAL = float(os.getenv('USERS_FLUSH_INTERVAL', '5'))
+USERS_FLUSH_EVERY = int(os.getenv('USERS_FLUSH_EVERY', '100'))
+
+# Потоковый вывод: ответ модели показывается по мере генерации,
+# сообщение редактируется не чаще раза в STREAM_EDIT_INTERVAL секунд
+STREAM_RESPONSES = os.getenv('STREAM_RESPONSES', 'true').lower() in ('1', 'true', 'yes')
+STREAM_EDIT_INTERVAL = float(os.getenv('STREAM_EDIT_INTERVAL', '1.5'))
+
+# Лимиты исходящих запросов к Telegram: сообщений в секунду на бота и на личный чат,
+# сообщений в минуту на группу; запросы сверх лимита ждут в очереди
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', '30'))
+TELEGRAM_CHAT_RATE = float(os.getenv('TELEGRAM_CHAT_RATE', '1'))
+TELEGRAM_GROUP_RATE = float(os.getenv('TELEGRAM_GROUP_RATE', '20'))
+TELEGRAM_CHAT_BURST = int(os.getenv('TELEGRAM_CHAT_BURST', '3'))  # сколько сообщений чат может отправить подряд
+TELEGRAM_MAX_RETRIES = int(os.getenv('TELEGRAM_MAX_RETRIES', '3'))  # повторы после ответа 429 (retry_after)
+
 # Системные промпты для разных задач (оптимизированы для русского языка)
 SYSTEM_PROMPTS = {
     "check_grammar": """Ты - эксперт по русскому языку. Проверь текст на грамотность, исправь ТОЛЬКО орфографические и пунктуационные ошибки.
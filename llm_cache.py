@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import time
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class ResultCache:
+    """
+    Кэш результатов LLM с вытеснением по LRU и сроку жизни (TTL)
+
+    Ключ - хэш содержимого запроса, поэтому одинаковые тексты с одной и той же
+    задачей, моделью и версией промпта обслуживаются без обращения к YandexGPT.
+    При указании persist_file кэш сохраняется на диск и переживает перезапуск.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 86400, persist_file: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.persist_file = persist_file or None
+        # key -> (время истечения, результат); порядок элементов - порядок использования
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.persist_file:
+            self.load()
+
+    @staticmethod
+    def make_key(*parts: str) -> str:
+        """Строит ключ кэша из частей запроса"""
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\x00')
+        return digest.hexdigest()
+
+    def get(self, key: str, count: bool = True) -> Optional[str]:
+        """
+        Возвращает результат из кэша или None
+
+        С count=False обращение не учитывается в hits/misses (поиск готовых абзацев
+        ведет собственные счетчики и не должен искажать hit_rate запросов)
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            if count:
+                self.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            if count:
+                self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        if count:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: str):
+        """Сохраняет результат в кэш, вытесняя самые давно использованные записи"""
+        if self.max_entries <= 0:
+            return
+
+        self._entries[key] = (time.time() + self.ttl, value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def load(self):
+        """Загружает кэш с диска, пропуская устаревшие записи"""
+        if not self.persist_file or not os.path.exists(self.persist_file):
+            return
+
+        try:
+            with open(self.persist_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+
+            now = time.time()
+            # Записи сохранены в порядке LRU, поэтому последние - самые свежие
+            for key, expires_at, value in data.get("entries", [])[-self.max_entries:]:
+                if expires_at > now:
+                    self._entries[key] = (expires_at, value)
+
+            logger.info(f"Загружено {len(self._entries)} записей кэша LLM")
+        except Exception as e:
+            logger.error(f"Ошибка загрузки кэша LLM: {e}")
+
+    def save(self):
+        """Сохраняет кэш на диск (через временный файл, чтобы не повредить старую копию)"""
+        if not self.persist_file:
+            return
+
+        now = time.time()
+        entries = [
+            [key, expires_at, value]
+            for key, (expires_at, value) in self._entries.items()
+            if expires_at > now
+        ]
+
+        tmp_file = f"{self.persist_file}.tmp"
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump({"entries": entries}, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_file, self.persist_file)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения кэша LLM: {e}")
+
+    def get_stats(self) -> Dict:
+        """Возвращает счетчики попаданий и промахов"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
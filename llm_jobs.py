@@ -0,0 +1,220 @@
+import asyncio
+import json
+import os
+import time
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+from llm_service import LLMService, LLMServiceError, RetryableError
+
+logger = logging.getLogger(__name__)
+
+# Доставка результата: (задача, текст результата или сообщение об ошибке)
+DeliverCallback = Callable[[Dict, str], Awaitable[None]]
+
+class BackgroundJobs:
+    """
+    Фоновые задачи в асинхронном режиме YandexGPT (completionAsync)
+
+    Вместо HTTP-запроса, открытого на все время генерации, текст отправляется
+    как операция, и бот сразу отвечает пользователю. Один общий поллер проверяет
+    все незавершенные операции; интервал проверки каждой операции растет
+    от poll_interval до max_poll_interval. Готовый результат передается в deliver.
+    Незавершенные операции сохраняются в файл и после перезапуска проверяются дальше,
+    но не дольше max_age секунд с создания задачи: затем пользователь получает ошибку.
+    """
+
+    def __init__(self, llm_service: LLMService, persist_file: Optional[str] = "llm_jobs.json",
+                 tasks=("improve_text", "shorten_text"), min_length: int = 2000, max_length: int = 4000,
+                 poll_interval: float = 1.0, max_poll_interval: float = 15.0, max_age: float = 3600.0,
+                 enabled: bool = True):
+        self.llm_service = llm_service
+        self.persist_file = persist_file or None
+        self.tasks = tasks
+        self.min_length = min_length
+        self.max_length = max_length
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.max_age = max_age
+        self.enabled = enabled
+        self.deliver: Optional[DeliverCallback] = None
+
+        # operation_id -> задача; время следующей проверки хранится только в памяти
+        self.jobs: Dict[str, Dict] = {}
+        self._next_poll: Dict[str, float] = {}
+        self._wakeup = asyncio.Event()
+        self._poller: Optional[asyncio.Task] = None
+
+        self.completed = 0
+        self.failed = 0
+
+        if self.persist_file:
+            self.load()
+
+    def accepts(self, text: str, task_type: str) -> bool:
+        """Подходит ли текст для фоновой обработки"""
+        if not self.enabled or task_type not in self.tasks:
+            return False
+        # Более длинные тексты делятся на части и обрабатываются обычными запросами
+        return self.min_length <= len(self.llm_service.preserve_paragraphs(text)) <= self.max_length
+
+    async def submit(self, text: str, task_type: str, no_dot: bool, chat_id: int,
+                     reply_to_message_id: Optional[int] = None, user_id: Optional[int] = None) -> Optional[str]:
+        """
+        Создает фоновую задачу
+
+        Returns:
+            Результат из кэша, если текст уже обрабатывался (задача не создается), иначе None
+
+        Raises:
+            LLMServiceError: если операцию не удалось создать
+        """
+        model_uri, route_reason = self.llm_service.route(self.llm_service.preserve_paragraphs(text), task_type)
+        cache_key = self.llm_service.get_cache_key(text, task_type, model_uri)
+        cached_result = self.llm_service.cache.get(cache_key)
+        if cached_result is not None:
+            return self.llm_service.remove_paragraph_dots(cached_result) if no_dot else cached_result
+
+        operation_id, model_uri = await self.llm_service.submit_operation(
+            text, task_type, model_uri, user_id, route_reason
+        )
+        # Результат кэшируется под моделью, которая выполняла операцию
+        cache_key = self.llm_service.get_cache_key(text, task_type, model_uri)
+        self.jobs[operation_id] = {
+            "operation_id": operation_id,
+            "task_type": task_type,
+            "no_dot": no_dot,
+            "chat_id": chat_id,
+            "reply_to_message_id": reply_to_message_id,
+            "cache_key": cache_key,
+            "created": time.time(),
+            "interval": self.poll_interval,
+        }
+        self._next_poll[operation_id] = time.monotonic() + self.poll_interval
+        self.save()
+        self._wakeup.set()
+        return None
+
+    def start(self):
+        """Запускает общий поллер (после того, как задан deliver)"""
+        if self._poller is None:
+            self._poller = asyncio.ensure_future(self._poll_loop())
+            if self.jobs:
+                logger.info(f"Восстановлено фоновых задач: {len(self.jobs)}")
+
+    async def stop(self):
+        """Останавливает поллер; незавершенные задачи остаются в файле"""
+        if self._poller is not None:
+            self._poller.cancel()
+            try:
+                await self._poller
+            except asyncio.CancelledError:
+                pass
+            self._poller = None
+        self.save()
+
+    async def _poll_loop(self):
+        while True:
+            now = time.monotonic()
+            due = [operation_id for operation_id, at in self._next_poll.items() if at <= now]
+            if due:
+                await asyncio.gather(*(self._poll(operation_id) for operation_id in due))
+
+            self._wakeup.clear()
+            timeout = None
+            if self._next_poll:
+                timeout = max(0.0, min(self._next_poll.values()) - time.monotonic())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _poll(self, operation_id: str):
+        job = self.jobs[operation_id]
+        try:
+            result = await self.llm_service.get_operation_result(operation_id, job["task_type"])
+        except RetryableError as e:
+            logger.warning(f"Временная ошибка проверки операции {operation_id}: {e}")
+            await self._retry_later(job)
+            return
+        except LLMServiceError as e:
+            self.failed += 1
+            await self._finish(job, f"❌ {e}")
+            return
+        except Exception as e:
+            logger.error(f"Ошибка проверки операции {operation_id}: {e}")
+            await self._retry_later(job)
+            return
+
+        if result is None:
+            await self._retry_later(job)
+            return
+
+        # Результат попадает в кэш так же, как при обычном запросе
+        self.llm_service.cache.set(job["cache_key"], result)
+        if job["no_dot"]:
+            result = self.llm_service.remove_paragraph_dots(result)
+        self.completed += 1
+        await self._finish(job, result)
+
+    async def _retry_later(self, job: Dict):
+        """Откладывает проверку или, если задача старше max_age, завершает ее с ошибкой"""
+        if time.time() - job["created"] <= self.max_age:
+            self._schedule(job)
+            return
+        logger.error(f"Операция {job['operation_id']} не завершилась за {self.max_age:.0f} с, задача снята")
+        self.failed += 1
+        await self._finish(job, "❌ Не удалось получить результат обработки. Попробуйте отправить текст еще раз.")
+
+    def _schedule(self, job: Dict):
+        """Откладывает следующую проверку, увеличивая интервал"""
+        job["interval"] = min(self.max_poll_interval, job["interval"] * 1.5)
+        self._next_poll[job["operation_id"]] = time.monotonic() + job["interval"]
+
+    async def _finish(self, job: Dict, text: str):
+        operation_id = job["operation_id"]
+        try:
+            if self.deliver:
+                await self.deliver(job, text)
+        except Exception as e:
+            logger.error(f"Не удалось доставить результат операции {operation_id}: {e}")
+        finally:
+            self.jobs.pop(operation_id, None)
+            self._next_poll.pop(operation_id, None)
+            self.save()
+
+    def load(self):
+        """Загружает незавершенные задачи с диска"""
+        if not self.persist_file or not os.path.exists(self.persist_file):
+            return
+        try:
+            with open(self.persist_file, 'r', encoding='utf-8') as f:
+                jobs: List[Dict] = json.load(f).get("jobs", [])
+        except Exception as e:
+            logger.error(f"Ошибка загрузки фоновых задач: {e}")
+            return
+
+        now = time.monotonic()
+        for job in jobs:
+            self.jobs[job["operation_id"]] = job
+            # После перезапуска проверяем сразу: операция могла завершиться, пока бот не работал
+            self._next_poll[job["operation_id"]] = now
+
+    def save(self):
+        """Сохраняет незавершенные задачи (через временный файл, чтобы не повредить старую копию)"""
+        if not self.persist_file:
+            return
+
+        tmp_file = f"{self.persist_file}.tmp"
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump({"jobs": list(self.jobs.values())}, f, ensure_ascii=False)
+            os.replace(tmp_file, self.persist_file)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения фоновых задач: {e}")
+
+    def get_stats(self) -> Dict:
+        return {
+            "pending": len(self.jobs),
+            "completed": self.completed,
+            "failed": self.failed,
+        }
@@ -0,0 +1,109 @@
+import random
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+class RetryPolicy:
+    """
+    Экспоненциальная задержка между повторами со случайным разбросом (full jitter)
+
+    Если сервис сам сообщил, через сколько повторить (Retry-After), ждем
+    не меньше этого времени.
+    """
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def get_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Задержка перед повтором номер attempt (1 - первый повтор)"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+class CircuitBreaker:
+    """
+    Предохранитель: после failure_threshold ошибок подряд запросы отклоняются
+    сразу, не дожидаясь таймаута
+
+    Через reset_timeout секунд пропускается один пробный запрос: успех закрывает
+    предохранитель, ошибка снова размыкает его на reset_timeout.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_started = 0.0
+
+        # Метрики
+        self.opened_count = 0
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        """Можно ли сейчас отправить запрос"""
+        if self.state == self.CLOSED:
+            return True
+
+        now = time.monotonic()
+        if self.state == self.OPEN and now - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self.trial_started = 0.0
+
+        # В полуоткрытом состоянии пропускаем один пробный запрос; если он завис
+        # или был отменен, через reset_timeout пропускаем следующий
+        if self.state == self.HALF_OPEN and now - self.trial_started >= self.reset_timeout:
+            self.trial_started = now
+            return True
+
+        self.rejected += 1
+        return False
+
+    def is_open(self) -> bool:
+        """Разомкнут ли предохранитель (без учета пробного запроса, который уже можно отправить)"""
+        return self.state == self.OPEN and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.opened_count += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def get_stats(self) -> Dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "opened": self.opened_count,
+            "rejected": self.rejected,
+        }
+
+class LatencyTracker:
+    """Время последних успешных запросов: задержка дублирующего запроса и выбор модели"""
+
+    def __init__(self, samples: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples: Deque[float] = deque(maxlen=samples)
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Перцентиль времени ответа или None, пока данных мало"""
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
@@ -0,0 +1,176 @@
+import asyncio
+import time
+import logging
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Deque, Dict, Hashable, Optional
+from metrics import QUEUE_WAIT
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Колбэк, которому сообщается позиция запроса в очереди (1 - следующий)
+QueueCallback = Callable[[int], Awaitable[None]]
+
+class _Ticket:
+    """Запрос, ожидающий свободного слота"""
+    __slots__ = ("key", "future", "enqueued_at")
+
+    def __init__(self, key: Hashable, future: asyncio.Future):
+        self.key = key
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+class FairScheduler:
+    """
+    Планировщик запросов к YandexGPT с глобальным лимитом и справедливой очередью
+
+    Одновременно выполняется не больше max_concurrency запросов. Ожидающие
+    запросы хранятся в отдельной очереди для каждого пользователя, а слоты
+    раздаются по кругу (round-robin): пользователь, отправивший десять текстов
+    подряд, не задерживает остальных дольше, чем на один свой запрос.
+    """
+
+    def __init__(self, max_concurrency: int, wait_samples: int = 1000):
+        self.max_concurrency = max(1, max_concurrency)
+        self._active = 0
+        # Очереди пользователей в порядке обхода: первый ключ обслуживается следующим
+        self._queues: "OrderedDict[Hashable, Deque[_Ticket]]" = OrderedDict()
+
+        # Метрики ожидания в очереди
+        self._wait_times: Deque[float] = deque(maxlen=wait_samples)
+        self.total_requests = 0
+        self.queued_requests = 0
+        self.max_wait = 0.0
+
+    @asynccontextmanager
+    async def slot(self, user_id: Optional[Hashable] = None, on_queued: Optional[QueueCallback] = None):
+        """Занимает слот на время запроса к YandexGPT"""
+        with span("queue_wait"):
+            await self.acquire(user_id, on_queued)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, user_id: Optional[Hashable] = None, on_queued: Optional[QueueCallback] = None):
+        """Ждет свободного слота; о постановке в очередь сообщает через on_queued"""
+        self.total_requests += 1
+
+        if self._active < self.max_concurrency and not self._queues:
+            self._active += 1
+            self._record_wait(0.0)
+            return
+
+        key = user_id if user_id is not None else "__anonymous__"
+        ticket = _Ticket(key, asyncio.get_running_loop().create_future())
+        self._queues.setdefault(key, deque()).append(ticket)
+        self.queued_requests += 1
+
+        # Сообщение о позиции отправляется отдельной задачей: медленное редактирование
+        # сообщения в Telegram не задерживает ожидание и не мешает отмене
+        notify = asyncio.ensure_future(self._notify(on_queued, self.get_position(ticket))) if on_queued else None
+
+        try:
+            await ticket.future
+        except BaseException:
+            if ticket.future.done() and not ticket.future.cancelled():
+                # Слот уже выдан, но ждать его больше некому - возвращаем
+                self.release()
+            else:
+                self._remove(ticket)
+            raise
+        finally:
+            # Когда слот получен, позиция в очереди уже неактуальна
+            if notify is not None and not notify.done():
+                notify.cancel()
+
+        self._record_wait(time.monotonic() - ticket.enqueued_at)
+
+    @staticmethod
+    async def _notify(on_queued: QueueCallback, position: int):
+        try:
+            await on_queued(position)
+        except Exception as e:
+            logger.warning(f"Не удалось сообщить позицию в очереди: {e}")
+
+    def release(self):
+        """Освобождает слот и передает его следующему пользователю по кругу"""
+        self._active -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self._active < self.max_concurrency and self._queues:
+            key, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            if queue:
+                # Пользователь уходит в конец круга
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+
+            if ticket.future.done():
+                continue
+
+            self._active += 1
+            ticket.future.set_result(True)
+
+    def _remove(self, ticket: _Ticket):
+        queue = self._queues.get(ticket.key)
+        if queue is None:
+            return
+        try:
+            queue.remove(ticket)
+        except ValueError:
+            return
+        if not queue:
+            del self._queues[ticket.key]
+
+    def get_position(self, ticket: _Ticket) -> int:
+        """
+        Вычисляет позицию запроса в очереди с учетом обхода по кругу
+
+        Перед k-м запросом пользователя будут обслужены его собственные k запросов
+        и до k (или k + 1, если пользователь раньше в круге) запросов каждого другого.
+        """
+        queue = self._queues.get(ticket.key)
+        if queue is None or ticket not in queue:
+            return 0
+
+        index = queue.index(ticket)
+        position = index + 1
+        before_in_round = True
+        for key, other_queue in self._queues.items():
+            if key == ticket.key:
+                before_in_round = False
+                continue
+            position += min(len(other_queue), index + 1 if before_in_round else index)
+        return position
+
+    def get_queue_position(self, user_id: Hashable) -> int:
+        """Возвращает позицию ближайшего запроса пользователя в очереди (0 - не в очереди)"""
+        queue = self._queues.get(user_id)
+        if not queue:
+            return 0
+        return self.get_position(queue[0])
+
+    def _record_wait(self, wait: float):
+        self._wait_times.append(wait)
+        QUEUE_WAIT.observe(wait)
+        if wait > self.max_wait:
+            self.max_wait = wait
+
+    def get_stats(self) -> Dict:
+        """Возвращает метрики планировщика"""
+        waits = sorted(self._wait_times)
+        return {
+            "active": self._active,
+            "max_concurrency": self.max_concurrency,
+            "queued": sum(len(queue) for queue in self._queues.values()),
+            "users_waiting": len(self._queues),
+            "total_requests": self.total_requests,
+            "queued_requests": self.queued_requests,
+            "avg_wait": sum(waits) / len(waits) if waits else 0.0,
+            "p95_wait": waits[int(len(waits) * 0.95)] if waits else 0.0,
+            "max_wait": self.max_wait
+        }
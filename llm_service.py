@@ -1,13 +1,94 @@
-import requests
+import asyncio
+import ssl
 import json
 import logging
-import re
-from config import YANDEX_API_KEY, YANDEX_FOLDER_ID, YANDEX_MODEL, SYSTEM_PROMPTS, MAX_TEXT_LENGTH
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import aiohttp
+from config import (
+    YANDEX_API_KEY, YANDEX_FOLDER_ID, YANDEX_MODEL, YANDEX_MODEL_PRO, YANDEX_API_URL, SYSTEM_PROMPTS,
+    YANDEX_ASYNC_API_URL, YANDEX_OPERATIONS_URL, YANDEX_TOKENIZE_URL, MAX_TEXT_LENGTH,
+    LLM_POOL_SIZE, LLM_POOL_WARMUP, LLM_KEEPALIVE_TIMEOUT, LLM_REQUEST_TIMEOUT,
+    LLM_CACHE_SIZE, LLM_CACHE_TTL, LLM_CACHE_FILE, PROMPT_VERSION,
+    MAX_LONG_TEXT_LENGTH, CHUNK_MAX_TOKENS, CHUNK_CONCURRENCY, LLM_MAX_CONCURRENCY,
+    LLM_RETRY_ATTEMPTS, LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY,
+    LLM_BREAKER_THRESHOLD, LLM_BREAKER_RESET, LLM_HEDGE_REQUESTS, LLM_HEDGE_MIN_DELAY,
+    LLM_TOKENIZER, LLM_TOKENIZER_TIMEOUT, LLM_CONTEXT_TOKENS, LLM_MIN_OUTPUT_TOKENS, LLM_MAX_OUTPUT_TOKENS,
+    TOKEN_STATS_FILE, MODEL_ROUTING, ROUTER_PRO_TASKS, ROUTER_PRO_MAX_LENGTH, ROUTER_LATENCY_TARGET,
+    ROUTER_MAX_ERROR_RATE, ROUTER_LOG_FILE, SPELL_DICT_FILE, SPELL_PRECHECK_MAX_SHARE, LLM_PARAGRAPH_CACHE
+)
+from llm_cache import ResultCache
+from llm_resilience import RetryPolicy
+from metrics import LLM_LATENCY, LLM_RESPONSES
+from model_router import ModelRouter
+from llm_scheduler import FairScheduler, QueueCallback
+from spell_precheck import SpellPrecheck
+from text_chunker import split_into_chunks, join_chunks
+from text_diff import format_changes
+from text_normalizer import fix_dashes, normalize, preserve_paragraphs, remove_paragraph_dots
+from token_budget import TokenBudget
+from tracing import span, traced
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Колбэк для потокового режима: получает накопленный на данный момент текст ответа.
+# Обычная функция, а не корутина: чтение ответа модели не должно ждать ее (например, Telegram)
+PartialCallback = Callable[[str], None]
+
+# Сообщение пользователя в запросе к модели
+USER_PROMPT_PREFIX = "Обработай следующий текст:\n\n"
+
+# Ответ обрезан по maxTokens
+TRUNCATED_STATUS = "ALTERNATIVE_STATUS_TRUNCATED_FINAL"
+
+# Ответы YandexGPT, после которых запрос имеет смысл повторить
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+class LLMServiceError(Exception):
+    """Ошибка обращения к YandexGPT; текст исключения показывается пользователю"""
+
+class RetryableError(LLMServiceError):
+    """
+    Временная ошибка (перегрузка, таймаут, сеть): запрос можно повторить
+    
+    upstream_failure=False - сервис отвечает, но ограничивает частоту запросов (429),
+    такая ошибка не размыкает предохранитель.
+    """
+    
+    def __init__(self, message: str, retry_after: Optional[float] = None, upstream_failure: bool = True):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.upstream_failure = upstream_failure
+
+class CircuitOpenError(LLMServiceError):
+    """YandexGPT недоступен: предохранитель разомкнут, запрос не отправлялся"""
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Разбирает заголовок Retry-After (в секундах)"""
+    try:
+        return max(0.0, float(value)) if value else None
+    except ValueError:
+        return None
+
+class _InFlight:
+    """Выполняющийся запрос к YandexGPT, результат которого ждут один или несколько вызовов"""
+    __slots__ = ("task", "waiters", "listeners")
+
+    def __init__(self):
+        self.task: Optional[asyncio.Future] = None
+        self.waiters = 0
+        self.listeners: List[PartialCallback] = []
+
+    def publish(self, partial_text: str):
+        """Передает частичный ответ всем ожидающим в потоковом режиме"""
+        for listener in list(self.listeners):
+            try:
+                listener(partial_text)
+            except Exception as e:
+                logger.warning(f"Ошибка при передаче частичного ответа: {e}")
+
 class LLMService:
     def __init__(self):
         if not YANDEX_API_KEY:
@@ -18,8 +99,114 @@ class LLMService:
         self.api_key = YANDEX_API_KEY
         self.folder_id = YANDEX_FOLDER_ID
         self.model = YANDEX_MODEL
-        self.base_url = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion"
+        self.base_url = YANDEX_API_URL
+        self.async_url = YANDEX_ASYNC_API_URL
+        self.operations_url = YANDEX_OPERATIONS_URL
+        self.tokenize_url = YANDEX_TOKENIZE_URL
+        
+        # Общий пул соединений для всех задач (создается лениво или в start())
+        self.session: Optional[aiohttp.ClientSession] = None
+        
+        # Кэш результатов по содержимому запроса
+        self.cache = ResultCache(
+            max_entries=LLM_CACHE_SIZE,
+            ttl=LLM_CACHE_TTL,
+            persist_file=LLM_CACHE_FILE
+        )
+        
+        # Глобальный лимит одновременных запросов со справедливой очередью по пользователям
+        self.scheduler = FairScheduler(LLM_MAX_CONCURRENCY)
+        
+        # Выполняющиеся запросы по ключу кэша: одинаковые одновременные запросы
+        # (например, одно сообщение, пересланное многими пользователями) ждут один ответ
+        self._inflight: Dict[str, _InFlight] = {}
+        self.coalesced_requests = 0
+        
+        # Повторы с задержкой и дублирующие запросы при медленном ответе
+        self.retry_policy = RetryPolicy(LLM_RETRY_ATTEMPTS, LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY)
+        
+        # Выбор модели для запроса; у каждой модели свой предохранитель и статистика времени ответа
+        self.router = ModelRouter(
+            self.model,
+            YANDEX_MODEL_PRO if MODEL_ROUTING else None,
+            pro_tasks=ROUTER_PRO_TASKS,
+            pro_max_length=ROUTER_PRO_MAX_LENGTH,
+            latency_target=ROUTER_LATENCY_TARGET,
+            max_error_rate=ROUTER_MAX_ERROR_RATE,
+            breaker_threshold=LLM_BREAKER_THRESHOLD,
+            breaker_reset=LLM_BREAKER_RESET,
+            log_file=ROUTER_LOG_FILE
+        )
+        self.retried_requests = 0
+        self.hedged_requests = 0
+        
+        # Учет токенов: maxTokens и размер частей длинного текста по реальному числу токенов
+        self.token_budget = TokenBudget(
+            self._tokenize if LLM_TOKENIZER else None,
+            context_tokens=LLM_CONTEXT_TOKENS,
+            min_output_tokens=LLM_MIN_OUTPUT_TOKENS,
+            max_output_tokens=LLM_MAX_OUTPUT_TOKENS,
+            persist_file=TOKEN_STATS_FILE
+        )
+        
+        # Локальная проверка по словарю: чистый текст /check не отправляется в YandexGPT
+        self.precheck = SpellPrecheck(SPELL_DICT_FILE)
+        
+        # Результаты /check по отдельным абзацам: при повторной отправке текста проверяются только измененные
+        self.paragraph_cache = LLM_PARAGRAPH_CACHE
+        self.reused_paragraphs = 0
+        self.checked_paragraphs = 0
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Возвращает общую HTTP-сессию, создавая ее при первом обращении"""
+        if self.session is None or self.session.closed:
+            # Один SSL-контекст на весь пул: соединения переиспользуются через keep-alive,
+            # поэтому TLS-рукопожатие выполняется один раз на соединение, а не на запрос
+            ssl_context = ssl.create_default_context()
+            connector = aiohttp.TCPConnector(
+                limit=LLM_POOL_SIZE,
+                limit_per_host=LLM_POOL_SIZE,
+                keepalive_timeout=LLM_KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=300,
+                ssl=ssl_context
+            )
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=LLM_REQUEST_TIMEOUT),
+                headers={
+                    "Authorization": f"Api-Key {self.api_key}",
+                    "Content-Type": "application/json"
+                }
+            )
+        return self.session
+    
+    async def start(self):
+        """
+        Создает пул соединений и прогревает его, чтобы первые запросы
+        пользователей не тратили время на DNS и TLS-рукопожатие
+        """
+        session = self._get_session()
+        
+        async def warmup_connection():
+            try:
+                async with session.head(self.base_url) as response:
+                    await response.read()
+            except Exception as e:
+                logger.warning(f"Не удалось прогреть соединение с YandexGPT: {e}")
+        
+        if LLM_POOL_WARMUP > 0:
+            await asyncio.gather(*(warmup_connection() for _ in range(LLM_POOL_WARMUP)))
+            logger.info(f"Пул соединений с YandexGPT прогрет ({LLM_POOL_WARMUP} соед.)")
+    
+    async def close(self):
+        """Закрывает пул соединений и сохраняет кэш и статистику токенов на диск"""
+        self.cache.save()
+        self.token_budget.save()
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
     
+    @traced("fix_dashes")
     def fix_dashes(self, text: str) -> str:
         """
         Заменяет длинные тире (—) на средние тире (–)
@@ -30,12 +217,9 @@ class LLMService:
         Returns:
             Текст с исправленными тире
         """
-        # Заменяем длинные тире (em dash) на средние тире (en dash)
-        text = re.sub(r'—', '–', text)
-        # Также заменяем обычные тире на средние тире для единообразия
-        text = re.sub(r'(?<![\w])-(?![\w])', '–', text)
-        return text
+        return fix_dashes(text)
     
+    @traced("preserve_paragraphs")
     def preserve_paragraphs(self, text: str) -> str:
         """
         Сохраняет структуру абзацев в тексте
@@ -46,25 +230,53 @@ class LLMService:
         Returns:
             Текст с сохраненной структурой абзацев
         """
-        # Нормализуем переносы строк
-        text = re.sub(r'\r\n', '\n', text)  # Windows -> Unix
-        text = re.sub(r'\r', '\n', text)    # Mac -> Unix
+        return preserve_paragraphs(text)
+    
+    @traced("remove_paragraph_dots")
+    def remove_paragraph_dots(self, text: str) -> str:
+        """
+        Убирает точки в конце абзацев (параметр nodot)
         
-        # Убираем лишние пробелы в начале и конце
-        text = text.strip()
+        Args:
+            text: Исходный текст
         
-        # Заменяем множественные переносы строк на двойные
-        text = re.sub(r'\n{3,}', '\n\n', text)
+        Returns:
+            Текст без точек в конце абзацев
+        """
+        return remove_paragraph_dots(text)
+    
+    def get_model_uri(self, model: Optional[str] = None) -> str:
+        """Возвращает URI модели YandexGPT (по умолчанию - основной модели)"""
+        return f"gpt://{self.folder_id}/{model or self.model}"
+    
+    def get_model_name(self, model_uri: str) -> str:
+        """Возвращает название модели по ее URI"""
+        prefix = f"gpt://{self.folder_id}/"
+        return model_uri[len(prefix):] if model_uri.startswith(prefix) else model_uri
+    
+    def route(self, text: str, task_type: str) -> Tuple[str, str]:
+        """
+        Выбирает модель для текста и задачи
         
-        return text
+        Returns:
+            (URI модели, причина выбора для record_route)
+        """
+        model, reason = self.router.route(task_type, len(text))
+        return self.get_model_uri(model), reason
     
-    async def process_text(self, text: str, task_type: str) -> str:
+    async def process_text(self, text: str, task_type: str, user_id: Optional[int] = None,
+                           on_queued: Optional[QueueCallback] = None,
+                           on_partial: Optional[PartialCallback] = None) -> str:
         """
         Обрабатывает текст с помощью YandexGPT в зависимости от типа задачи
         
         Args:
             text: Исходный текст
             task_type: Тип задачи ('check_grammar', 'improve_text', 'shorten_text')
+            user_id: ID пользователя для справедливой очереди запросов
+            on_queued: Колбэк, получающий позицию в очереди, если запрос ждет слота
+            on_partial: Колбэк для потокового режима, получающий частичный ответ модели
+                (для длинных текстов, обрабатываемых частями, не вызывается)
         
         Returns:
             Обработанный текст
@@ -72,132 +284,695 @@ class LLMService:
         # Обрабатываем структуру абзацев
         text = self.preserve_paragraphs(text)
         
+        error = self._validate_text(text, task_type)
+        if error:
+            return error
+        
+        try:
+            return await self._process(text, task_type, user_id, on_queued, on_partial)
+        except LLMServiceError as e:
+            return str(e)
+    
+    def _validate_text(self, text: str, task_type: str) -> Optional[str]:
+        """Проверяет текст после preserve_paragraphs; возвращает сообщение об ошибке или None"""
         if not text.strip():
             return "Пожалуйста, предоставьте текст для обработки."
         
-        if len(text) > MAX_TEXT_LENGTH:
-            return f"Текст слишком длинный. Максимальная длина: {MAX_TEXT_LENGTH} символов."
+        if len(text) > MAX_LONG_TEXT_LENGTH:
+            return f"Текст слишком длинный. Максимальная длина: {MAX_LONG_TEXT_LENGTH} символов."
         
         if task_type not in SYSTEM_PROMPTS:
             return "Неизвестный тип задачи."
         
+        return None
+    
+    async def _process(self, text: str, task_type: str, user_id: Optional[int] = None,
+                       on_queued: Optional[QueueCallback] = None,
+                       on_partial: Optional[PartialCallback] = None) -> str:
+        """Обрабатывает проверенный текст; ошибки YandexGPT выбрасываются как LLMServiceError"""
+        # Длинный текст, разбитый на части, целиком обрабатывается одной моделью
+        model_uri, route_reason = self.route(text, task_type)
+        
+        if len(text) > MAX_TEXT_LENGTH:
+            # Длинный текст обрабатываем частями параллельно
+            return await self._process_chunked(text, task_type, model_uri, user_id, on_queued, route_reason)
+        return await self._complete_cached(text, task_type, model_uri, user_id, on_queued, on_partial, route_reason)
+    
+    async def _complete_cached(self, text: str, task_type: str, model_uri: str,
+                               user_id: Optional[int] = None,
+                               on_queued: Optional[QueueCallback] = None,
+                               on_partial: Optional[PartialCallback] = None,
+                               route_reason: str = "default") -> str:
+        """Возвращает результат из кэша или запрашивает его у YandexGPT"""
+        # Одинаковые тексты обслуживаем из кэша без обращения к YandexGPT
+        cache_key = ResultCache.make_key(task_type, model_uri, PROMPT_VERSION, text)
+        cached_result = self.cache.get(cache_key)
+        if cached_result is not None:
+            logger.info(f"Результат для задачи {task_type} взят из кэша")
+            return cached_result
+        
+        flight = self._inflight.get(cache_key)
+        if flight is None:
+            flight = _InFlight()
+            flight.task = asyncio.ensure_future(self._request_shared(
+                cache_key, text, task_type, model_uri, user_id, on_queued,
+                flight.publish if on_partial else None, route_reason
+            ))
+            flight.task.add_done_callback(lambda task: self._finish_flight(cache_key, flight))
+            self._inflight[cache_key] = flight
+        else:
+            self.coalesced_requests += 1
+            logger.info(f"Запрос для задачи {task_type} присоединен к уже выполняющемуся")
+        
+        return await self._wait_flight(flight, on_partial)
+    
+    async def _request_shared(self, cache_key: str, text: str, task_type: str, model_uri: str,
+                              user_id: Optional[int], on_queued: Optional[QueueCallback],
+                              on_partial: Optional[PartialCallback], route_reason: str = "default") -> str:
+        """Запрос, общий для всех одинаковых вызовов; выполняется отдельной задачей"""
+        # В статистику и журнал маршрутизации попадают только запросы, которые уходят в YandexGPT
+        self.router.record_route(self.get_model_name(model_uri), task_type, len(text), route_reason)
+        # Ждем своей очереди: общий лимит запросов распределяется между пользователями по кругу
+        async with self.scheduler.slot(user_id, on_queued):
+            text_result, used_model_uri = await self._request_with_retries(text, task_type, model_uri, on_partial)
+        
+        # В кэш попадают только успешные ответы модели, под ключом модели, которая ответила
+        # (при недоступности выбранной модели запрос уходит в другую)
+        if used_model_uri != model_uri:
+            cache_key = ResultCache.make_key(task_type, used_model_uri, PROMPT_VERSION, text)
+        self.cache.set(cache_key, text_result)
+        return text_result
+    
+    async def _wait_flight(self, flight: _InFlight, on_partial: Optional[PartialCallback]) -> str:
+        """
+        Ждет результата общего запроса
+        
+        Отмена одного ожидающего не отменяет запрос, пока его результат нужен другим;
+        запрос отменяется вместе с последним ожидающим.
+        """
+        flight.waiters += 1
+        if on_partial:
+            flight.listeners.append(on_partial)
         try:
-            system_prompt = SYSTEM_PROMPTS[task_type]
-            
-            # Формируем запрос к YandexGPT
-            headers = {
-                "Authorization": f"Api-Key {self.api_key}",
-                "Content-Type": "application/json"
-            }
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+            if on_partial:
+                flight.listeners.remove(on_partial)
+    
+    def _finish_flight(self, cache_key: str, flight: _InFlight):
+        if self._inflight.get(cache_key) is flight:
+            del self._inflight[cache_key]
+        if not flight.task.cancelled():
+            # Забираем исключение, чтобы asyncio не предупреждал о нем, если ждать было некому
+            flight.task.exception()
+    
+    async def _process_chunked(self, text: str, task_type: str, model_uri: str,
+                               user_id: Optional[int] = None,
+                               on_queued: Optional[QueueCallback] = None,
+                               route_reason: str = "default") -> str:
+        """
+        Обрабатывает длинный текст: делит на части по абзацам и предложениям,
+        отправляет части параллельно и собирает результаты в исходном порядке
+        """
+        chunks = split_into_chunks(text, CHUNK_MAX_TOKENS, self.token_budget.estimate)
+        logger.info(f"Текст разбит на {len(chunks)} частей для задачи: {task_type}")
+        
+        async def process_chunk(chunk: str, notify: Optional[QueueCallback]) -> str:
+            return await self._complete_cached(chunk, task_type, model_uri, user_id, notify, route_reason=route_reason)
+        
+        results = await self._gather_parts([chunk for chunk, _ in chunks], process_chunk, on_queued)
+        return join_chunks(results, chunks)
+    
+    async def _gather_parts(self, parts: List, process: Callable[[Any, Optional[QueueCallback]], Awaitable[Any]],
+                            on_queued: Optional[QueueCallback] = None) -> List:
+        """Обрабатывает части текста параллельно (не больше CHUNK_CONCURRENCY сразу), сохраняя порядок"""
+        semaphore = asyncio.Semaphore(CHUNK_CONCURRENCY)
+        
+        async def process_part(part, notify: Optional[QueueCallback]):
+            async with semaphore:
+                return await process(part, notify)
+        
+        # О позиции в очереди сообщаем только для первой части, чтобы не дублировать уведомления
+        tasks = [
+            asyncio.ensure_future(process_part(part, on_queued if i == 0 else None))
+            for i, part in enumerate(parts)
+        ]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            # Если одна часть не обработалась, остальные запросы не нужны
+            for task in tasks:
+                task.cancel()
+            raise
+    
+    async def _precheck_grammar(self, text: str, user_id: Optional[int] = None,
+                                on_queued: Optional[QueueCallback] = None) -> Optional[str]:
+        """
+        Проверка грамотности с локальной предпроверкой по словарю (для текста после preserve_paragraphs)
+        
+        Returns:
+            Исправленный текст, если предпроверка нашла в нем чистые предложения:
+            они остаются как есть, в YandexGPT уходят только подозрительные.
+            None, если предпроверка недоступна или подозрительна большая часть текста
+            (SPELL_PRECHECK_MAX_SHARE): тогда дешевле и точнее проверить текст целиком
+        """
+        with span("precheck"):
+            segments = self.precheck.check(text)
+        if segments is None:
+            return None
+        
+        suspicious_parts = [segment for segment, _, suspicious in segments if suspicious]
+        if not suspicious_parts:
+            logger.info("Текст прошел локальную проверку, запрос к YandexGPT не нужен")
+            return self.fix_dashes(text)
+        if sum(len(segment) for segment in suspicious_parts) > SPELL_PRECHECK_MAX_SHARE * len(text):
+            return None
+        
+        # Подозрительные фрагменты объединяем в запросы не длиннее MAX_TEXT_LENGTH,
+        # как измененные абзацы в _check_incremental: системный промпт повторяется реже,
+        # а модель видит соседние предложения
+        batches: List[List[str]] = []
+        for segment in suspicious_parts:
+            if batches and len("\n\n".join(batches[-1] + [segment])) <= MAX_TEXT_LENGTH:
+                batches[-1].append(segment)
+            else:
+                batches.append([segment])
+        logger.info(f"В YandexGPT отправляется {len(suspicious_parts)} из {len(segments)} фрагментов текста "
+                    f"({len(batches)} запросов)")
+        
+        async def process_batch(batch: List[str], notify: Optional[QueueCallback]) -> List[str]:
+            result = await self._process("\n\n".join(batch), "check_grammar", user_id, notify)
+            # Фрагменты разделены пустой строкой; фрагмент и сам может состоять из нескольких абзацев
+            pieces = result.split("\n\n")
+            if len(pieces) == sum(segment.count("\n\n") + 1 for segment in batch):
+                corrected = []
+                for segment in batch:
+                    count = segment.count("\n\n") + 1
+                    corrected.append("\n\n".join(pieces[:count]))
+                    pieces = pieces[count:]
+                return corrected
+            # Модель объединила или разделила абзацы - проверяем каждый фрагмент отдельно
+            logger.warning("Число абзацев в ответе не совпало с запросом, фрагменты проверяются по отдельности")
+            return list(await asyncio.gather(*(
+                self._process(segment, "check_grammar", user_id) for segment in batch
+            )))
+        
+        corrected = iter([
+            segment
+            for batch_results in await self._gather_parts(batches, process_batch, on_queued)
+            for segment in batch_results
+        ])
+        results = [next(corrected) if suspicious else segment for segment, _, suspicious in segments]
+        result = join_chunks(results, [(segment, separator) for segment, separator, _ in segments])
+        with span("normalize"):
+            return normalize(result, dashes=True, paragraphs=True)
+    
+    async def _check_text(self, text: str, user_id: Optional[int] = None,
+                          on_queued: Optional[QueueCallback] = None,
+                          on_partial: Optional[PartialCallback] = None) -> str:
+        """Проверка грамотности: предпроверка по словарю, затем YandexGPT"""
+        result = await self._precheck_grammar(text, user_id, on_queued)
+        if result is None:
+            result = await self._process(text, "check_grammar", user_id, on_queued, on_partial)
+        return result
+    
+    def _paragraph_key(self, paragraph: str) -> str:
+        """
+        Ключ кэша результата проверки одного абзаца
+        
+        Модель в ключ не входит: исправления абзаца не зависят от того,
+        какая модель проверяла текст.
+        """
+        return ResultCache.make_key("check_grammar:paragraph", PROMPT_VERSION, paragraph)
+    
+    def _remember_paragraphs(self, paragraphs: List[str], result: str) -> bool:
+        """
+        Сохраняет результат проверки по абзацам
+        
+        Returns:
+            False, если число абзацев в ответе не совпало с исходным (тогда ничего не сохраняется)
+        """
+        corrected = result.split("\n\n")
+        if len(corrected) != len(paragraphs):
+            return False
+        for paragraph, paragraph_result in zip(paragraphs, corrected):
+            self.cache.set(self._paragraph_key(paragraph), paragraph_result)
+        return True
+    
+    async def _check_incremental(self, paragraphs: List[str], user_id: Optional[int] = None,
+                                 on_queued: Optional[QueueCallback] = None) -> Optional[str]:
+        """
+        Проверяет текст, часть абзацев которого уже проверялась
+        
+        Готовые абзацы берутся из кэша, новые и измененные отправляются в YandexGPT
+        одним запросом (несколькими, если не помещаются в MAX_TEXT_LENGTH).
+        
+        Returns:
+            Исправленный текст или None, если ни одного абзаца нет в кэше
+        """
+        results: List[Optional[str]] = [
+            self.cache.get(self._paragraph_key(paragraph), count=False) for paragraph in paragraphs
+        ]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if len(missing) == len(paragraphs):
+            return None
+        
+        self.reused_paragraphs += len(paragraphs) - len(missing)
+        self.checked_paragraphs += len(missing)
+        logger.info(f"Абзацев из кэша: {len(paragraphs) - len(missing)}, на проверку: {len(missing)}")
+        
+        # Измененные абзацы объединяем в запросы не длиннее MAX_TEXT_LENGTH
+        batches: List[List[int]] = []
+        for i in missing:
+            if batches and len("\n\n".join(paragraphs[j] for j in batches[-1] + [i])) <= MAX_TEXT_LENGTH:
+                batches[-1].append(i)
+            else:
+                batches.append([i])
+        
+        async def process_batch(batch: List[int], notify: Optional[QueueCallback]) -> List[str]:
+            batch_paragraphs = [paragraphs[i] for i in batch]
+            result = await self._check_text("\n\n".join(batch_paragraphs), user_id, notify)
+            if self._remember_paragraphs(batch_paragraphs, result):
+                return result.split("\n\n")
+            # Модель объединила или разделила абзацы - проверяем каждый абзац отдельно
+            logger.warning("Число абзацев в ответе не совпало с запросом, абзацы проверяются по отдельности")
+            separate = await asyncio.gather(*(self._check_text(paragraph, user_id) for paragraph in batch_paragraphs))
+            for paragraph, paragraph_result in zip(batch_paragraphs, separate):
+                self.cache.set(self._paragraph_key(paragraph), paragraph_result)
+            return list(separate)
+        
+        for batch, batch_results in zip(batches, await self._gather_parts(batches, process_batch, on_queued)):
+            for i, paragraph_result in zip(batch, batch_results):
+                results[i] = paragraph_result
+        
+        return "\n\n".join(results)
+    
+    async def _request_with_retries(self, text: str, task_type: str, model_uri: str,
+                                    on_partial: Optional[PartialCallback] = None) -> Tuple[str, str]:
+        """
+        Выполняет запрос, повторяя его после временных ошибок с экспоненциальной задержкой
+        
+        Если предохранитель модели разомкнут, запрос отправляется в другую модель.
+        
+        Returns:
+            (обработанный текст, URI модели, которая ответила)
+        """
+        attempt = 0
+        while True:
+            model_uri = self._get_available_model_uri(model_uri)
+            try:
+                return await self._request_hedged(text, task_type, model_uri, on_partial), model_uri
+            except RetryableError as e:
+                attempt += 1
+                if attempt >= self.retry_policy.max_attempts:
+                    raise
+                delay = self.retry_policy.get_delay(attempt, e.retry_after)
+                self.retried_requests += 1
+                logger.warning(f"Повтор запроса к YandexGPT через {delay:.2f} с (попытка {attempt + 1}): {e}")
+                await asyncio.sleep(delay)
+    
+    def _get_available_model_uri(self, model_uri: str) -> str:
+        """
+        Возвращает URI модели, которой можно отправить запрос
+        
+        Raises:
+            CircuitOpenError: обе модели недоступны
+        """
+        model = self.get_model_name(model_uri)
+        if self.router.get(model).breaker.allow():
+            return model_uri
+        
+        alternative = self.router.alternative(model)
+        if alternative is not None and self.router.get(alternative).breaker.allow():
+            self.router.fallbacks += 1
+            logger.warning(f"Модель {model} недоступна, запрос отправлен в {alternative}")
+            return self.get_model_uri(alternative)
+        
+        raise CircuitOpenError("YandexGPT временно недоступен. Попробуйте через минуту.")
+    
+    async def _request_hedged(self, text: str, task_type: str, model_uri: str,
+                              on_partial: Optional[PartialCallback] = None) -> str:
+        """
+        Если ответ задерживается дольше обычного (p95), отправляет дублирующий
+        запрос и возвращает первый успешный ответ
+        
+        В потоковом режиме запрос не дублируется: частичные ответы двух
+        генераций перемешались бы в сообщении.
+        """
+        hedge_delay = None
+        if LLM_HEDGE_REQUESTS and on_partial is None:
+            p95 = self.router.get(self.get_model_name(model_uri)).latency.percentile(0.95)
+            if p95 is not None:
+                hedge_delay = max(p95, LLM_HEDGE_MIN_DELAY)
+        
+        if hedge_delay is None:
+            return await self._attempt(text, task_type, model_uri, on_partial)
+        
+        pending = {asyncio.ensure_future(self._attempt(text, task_type, model_uri))}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=hedge_delay)
+            if done:
+                return done.pop().result()
             
-            payload = {
-                "modelUri": f"gpt://{self.folder_id}/{self.model}",
-                "completionOptions": {
-                    "temperature": 0.3,
-                    "maxTokens": 2000
-                },
-                "messages": [
-                    {
-                        "role": "system",
-                        "text": system_prompt
-                    },
-                    {
-                        "role": "user",
-                        "text": f"Обработай следующий текст:\n\n{text}"
-                    }
-                ]
-            }
+            self.hedged_requests += 1
+            logger.info(f"Ответ YandexGPT дольше {hedge_delay:.2f} с, отправляем дублирующий запрос")
+            pending.add(asyncio.ensure_future(self._attempt(text, task_type, model_uri)))
             
-            # Отправляем запрос
-            response = requests.post(
-                self.base_url,
-                headers=headers,
-                json=payload,
-                timeout=30
-            )
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Оставшийся запрос больше не нужен
+            for task in pending:
+                task.cancel()
+    
+    async def _attempt(self, text: str, task_type: str, model_uri: str,
+                       on_partial: Optional[PartialCallback] = None) -> str:
+        """Одна попытка запроса с учетом в предохранителе и статистике модели"""
+        model = self.get_model_name(model_uri)
+        breaker = self.router.get(model).breaker
+        started = time.monotonic()
+        try:
+            with span("llm_request", task=task_type, model=model):
+                text_result = await self._request_completion(text, task_type, model_uri, on_partial)
+        except RetryableError as e:
+            if e.upstream_failure:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            self.router.record(model, False, error=str(e))
+            raise
+        except LLMServiceError as e:
+            # Сервис ответил (например, ошибкой в запросе) - он доступен
+            breaker.record_success()
+            self.router.record(model, False, error=str(e))
+            raise
+        
+        latency = time.monotonic() - started
+        breaker.record_success()
+        self.router.record(model, True, latency)
+        LLM_LATENCY.observe(latency, task_type, model)
+        return text_result
+    
+    async def _request_completion(self, text: str, task_type: str, model_uri: str,
+                                  on_partial: Optional[PartialCallback] = None) -> str:
+        """
+        Выполняет один запрос к YandexGPT
+        
+        Если передан on_partial, ответ запрашивается в потоковом режиме и колбэк
+        получает накопленный текст по мере генерации.
+        
+        Returns:
+            Обработанный текст
+        
+        Raises:
+            LLMServiceError: с сообщением для пользователя, если запрос не удался
+        """
+        try:
+            max_tokens = await self.token_budget.plan(text, task_type, SYSTEM_PROMPTS[task_type], model_uri)
+            payload = self._build_payload(text, task_type, model_uri, max_tokens, stream=on_partial is not None)
             
-            if response.status_code == 200:
-                result = response.json()
-                if "result" in result and "alternatives" in result["result"]:
-                    text_result = result["result"]["alternatives"][0]["message"]["text"].strip()
-                    # Исправляем тире в результате
-                    text_result = self.fix_dashes(text_result)
-                    # Сохраняем структуру абзацев в результате
-                    text_result = self.preserve_paragraphs(text_result)
-                    logger.info(f"Успешно обработан текст для задачи: {task_type}")
-                    return text_result
+            # Отправляем запрос через общий пул соединений
+            session = self._get_session()
+            async with session.post(self.base_url, json=payload) as response:
+                status = response.status
+                LLM_RESPONSES.inc(status)
+                if status == 200 and on_partial is not None:
+                    result = await self._read_stream(response, on_partial)
+                elif status == 200:
+                    result = await response.json(content_type=None)
                 else:
-                    logger.error(f"Неожиданная структура ответа: {result}")
-                    return "Ошибка при обработке ответа от модели."
+                    error_text = await response.text()
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            
+            if status == 200:
+                return self._extract_text(result.get("result"), task_type, text)
             else:
-                logger.error(f"Ошибка API: {response.status_code} - {response.text}")
-                return f"Ошибка API: {response.status_code}"
+                logger.error(f"Ошибка API: {status} - {error_text}")
+                if status == 429:
+                    raise RetryableError(
+                        "Слишком много запросов к YandexGPT. Попробуйте позже.",
+                        retry_after, upstream_failure=False
+                    )
+                if status in RETRYABLE_STATUSES:
+                    raise RetryableError(f"Ошибка API: {status}", retry_after)
+                raise LLMServiceError(f"Ошибка API: {status}")
             
-        except requests.exceptions.Timeout:
+        except LLMServiceError:
+            raise
+        except asyncio.TimeoutError:
+            LLM_RESPONSES.inc("timeout")
             logger.error("Таймаут при запросе к YandexGPT")
-            return "Превышено время ожидания ответа. Попробуйте позже."
-        except requests.exceptions.RequestException as e:
+            raise RetryableError("Превышено время ожидания ответа. Попробуйте позже.")
+        except aiohttp.ClientError as e:
+            LLM_RESPONSES.inc("network")
             logger.error(f"Ошибка сети при запросе к YandexGPT: {e}")
-            return f"Ошибка сети: {str(e)}"
+            raise RetryableError(f"Ошибка сети: {str(e)}")
         except Exception as e:
             logger.error(f"Ошибка при обработке текста: {e}")
-            return f"Произошла ошибка при обработке текста: {str(e)}"
+            raise LLMServiceError(f"Произошла ошибка при обработке текста: {str(e)}")
+    
+    def _build_payload(self, text: str, task_type: str, model_uri: str, max_tokens: int,
+                       stream: bool = False) -> dict:
+        """Формирует запрос к YandexGPT"""
+        system_prompt = SYSTEM_PROMPTS[task_type]
+        return {
+            "modelUri": model_uri,
+            "completionOptions": {
+                "stream": stream,
+                "temperature": 0.3,
+                "maxTokens": max_tokens
+            },
+            "messages": [
+                {
+                    "role": "system",
+                    "text": system_prompt
+                },
+                {
+                    "role": "user",
+                    "text": f"{USER_PROMPT_PREFIX}{text}"
+                }
+            ]
+        }
     
-    async def check_grammar(self, text: str, no_dot: bool = False) -> str:
-        """Проверяет грамотность текста"""
-        result = await self.process_text(text, "check_grammar")
+    def _extract_text(self, result: Optional[dict], task_type: str, text: Optional[str] = None) -> str:
+        """
+        Достает текст из ответа модели (result обычного запроса или response операции)
+        
+        Если известен исходный текст, фактический расход токенов (usage) учитывается в бюджете.
+        """
+        if result and "alternatives" in result:
+            alternative = result["alternatives"][0]
+            if text is not None:
+                self.token_budget.record(
+                    task_type,
+                    len(SYSTEM_PROMPTS[task_type]) + len(USER_PROMPT_PREFIX) + len(text),
+                    len(text),
+                    result.get("usage"),
+                    truncated=alternative.get("status") == TRUNCATED_STATUS
+                )
+            text_result = alternative["message"]["text"].strip()
+            # Исправляем тире и сохраняем структуру абзацев в результате
+            with span("normalize"):
+                text_result = normalize(text_result, dashes=True, paragraphs=True)
+            logger.info(f"Успешно обработан текст для задачи: {task_type}")
+            return text_result
+        
+        logger.error(f"Неожиданная структура ответа: {result}")
+        raise LLMServiceError("Ошибка при обработке ответа от модели.")
+    
+    async def submit_operation(self, text: str, task_type: str, model_uri: Optional[str] = None,
+                               user_id: Optional[int] = None, route_reason: str = "default") -> Tuple[str, str]:
+        """
+        Отправляет текст на асинхронную обработку (completionAsync)
+        
+        Создание операции занимает слот в общей очереди запросов, как и обычный запрос.
+        
+        Returns:
+            ID операции, результат которой получают через get_operation_result,
+            и URI модели, которая ее выполняет (при недоступности выбранной - другая)
+        
+        Raises:
+            LLMServiceError: если операцию не удалось создать
+        """
+        model_uri = self._get_available_model_uri(model_uri or self.get_model_uri())
+        breaker = self.router.get(self.get_model_name(model_uri)).breaker
+        
+        text = self.preserve_paragraphs(text)
+        self.router.record_route(self.get_model_name(model_uri), task_type, len(text), route_reason)
+        max_tokens = await self.token_budget.plan(text, task_type, SYSTEM_PROMPTS[task_type], model_uri)
+        payload = self._build_payload(text, task_type, model_uri, max_tokens)
+        try:
+            async with self.scheduler.slot(user_id):
+                session = self._get_session()
+                async with session.post(self.async_url, json=payload) as response:
+                    status = response.status
+                    result = await response.json(content_type=None) if status == 200 else await response.text()
+        except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+            breaker.record_failure()
+            logger.error(f"Ошибка при создании асинхронной операции: {e}")
+            raise RetryableError(f"Ошибка сети: {str(e)}")
+        
+        if status != 200 or "id" not in result:
+            if status in RETRYABLE_STATUSES and status != 429:
+                breaker.record_failure()
+            logger.error(f"Не удалось создать асинхронную операцию: {status} - {result}")
+            raise LLMServiceError(f"Ошибка API: {status}")
+        
+        breaker.record_success()
+        logger.info(f"Создана асинхронная операция {result['id']} для задачи: {task_type}")
+        return result["id"], model_uri
+    
+    async def get_operation_result(self, operation_id: str, task_type: str) -> Optional[str]:
+        """
+        Проверяет асинхронную операцию
+        
+        Returns:
+            Обработанный текст или None, если операция еще выполняется
+        
+        Raises:
+            RetryableError: временная ошибка, проверку стоит повторить позже
+            LLMServiceError: операция завершилась ошибкой или не найдена
+        """
+        try:
+            session = self._get_session()
+            async with session.get(f"{self.operations_url}/{operation_id}") as response:
+                status = response.status
+                result = await response.json(content_type=None) if status == 200 else await response.text()
+        except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+            raise RetryableError(f"Ошибка сети: {str(e)}")
+        
+        if status in RETRYABLE_STATUSES:
+            raise RetryableError(f"Ошибка API: {status}")
+        if status != 200:
+            logger.error(f"Ошибка проверки операции {operation_id}: {status} - {result}")
+            raise LLMServiceError(f"Ошибка API: {status}")
+        
+        if not result.get("done"):
+            return None
+        if "error" in result:
+            logger.error(f"Операция {operation_id} завершилась ошибкой: {result['error']}")
+            raise LLMServiceError(f"Ошибка модели: {result['error'].get('message', 'неизвестная ошибка')}")
+        return self._extract_text(result.get("response"), task_type)
+    
+    @traced("tokenize")
+    async def _tokenize(self, text: str, model_uri: Optional[str] = None) -> int:
+        """Считает токены текста для модели через эндпоинт токенизации YandexGPT"""
+        session = self._get_session()
+        payload = {"modelUri": model_uri or self.get_model_uri(), "text": text}
+        timeout = aiohttp.ClientTimeout(total=LLM_TOKENIZER_TIMEOUT)
+        async with session.post(self.tokenize_url, json=payload, timeout=timeout) as response:
+            if response.status != 200:
+                raise LLMServiceError(f"Ошибка API токенизации: {response.status}")
+            result = await response.json(content_type=None)
+        return len(result["tokens"])
+    
+    def get_cache_key(self, text: str, task_type: str, model_uri: Optional[str] = None) -> str:
+        """Ключ кэша для текста и задачи (текст нормализуется так же, как в process_text)"""
+        return ResultCache.make_key(
+            task_type, model_uri or self.get_model_uri(), PROMPT_VERSION, self.preserve_paragraphs(text)
+        )
+    
+    async def _read_stream(self, response: aiohttp.ClientResponse, on_partial: PartialCallback) -> dict:
+        """
+        Читает потоковый ответ: каждая строка - JSON с накопленным текстом ответа
+        
+        Returns:
+            Последний полученный фрагмент (содержит полный текст ответа)
+        """
+        result = {}
+        async for line in response.content:
+            line = line.strip()
+            if not line:
+                continue
+            result = json.loads(line)
+            try:
+                partial_text = result["result"]["alternatives"][0]["message"]["text"]
+            except (KeyError, IndexError, TypeError):
+                continue
+            try:
+                on_partial(partial_text)
+            except Exception as e:
+                # Ошибка отображения промежуточного текста не должна прерывать генерацию
+                logger.warning(f"Ошибка при передаче частичного ответа: {e}")
+        return result
+    
+    async def check_grammar(self, text: str, no_dot: bool = False, user_id: Optional[int] = None,
+                            on_queued: Optional[QueueCallback] = None,
+                            on_partial: Optional[PartialCallback] = None,
+                            changes_only: bool = False) -> str:
+        """
+        Проверяет грамотность текста
+        
+        При changes_only возвращает не весь исправленный текст, а только
+        измененные фрагменты с контекстом (параметр diff); no_dot в этом режиме
+        не применяется, иначе удаленные точки попали бы в список исправлений
+        """
+        text = self.preserve_paragraphs(text)
+        error = self._validate_text(text, "check_grammar")
+        if error:
+            return error
+        
+        paragraphs = text.split("\n\n") if self.paragraph_cache else []
+        try:
+            result = None
+            if len(paragraphs) > 1:
+                result = await self._check_incremental(paragraphs, user_id, on_queued)
+            if result is None:
+                result = await self._check_text(text, user_id, on_queued, on_partial)
+                if len(paragraphs) > 1:
+                    self._remember_paragraphs(paragraphs, result)
+        except LLMServiceError as e:
+            return str(e)
+        
+        if changes_only:
+            with span("diff"):
+                return format_changes(text, result)
         
         # Если указан параметр nodot, убираем точки только в конце абзацев
         if no_dot:
-            # Разбиваем на абзацы и убираем точки только в конце каждого абзаца
-            paragraphs = result.split('\n')
-            processed_paragraphs = []
-            for paragraph in paragraphs:
-                if paragraph.strip():  # Если абзац не пустой
-                    processed_paragraphs.append(paragraph.rstrip('.'))
-                else:
-                    processed_paragraphs.append(paragraph)  # Сохраняем пустые строки
-            result = '\n'.join(processed_paragraphs)
+            result = self.remove_paragraph_dots(result)
         
         return result
     
-    async def improve_text(self, text: str, no_dot: bool = False) -> str:
+    async def improve_text(self, text: str, no_dot: bool = False, user_id: Optional[int] = None,
+                           on_queued: Optional[QueueCallback] = None,
+                           on_partial: Optional[PartialCallback] = None) -> str:
         """Улучшает текст"""
-        result = await self.process_text(text, "improve_text")
+        result = await self.process_text(text, "improve_text", user_id, on_queued, on_partial)
         
         # Если указан параметр nodot, убираем точки только в конце абзацев
         if no_dot:
-            # Разбиваем на абзацы и убираем точки только в конце каждого абзаца
-            paragraphs = result.split('\n')
-            processed_paragraphs = []
-            for paragraph in paragraphs:
-                if paragraph.strip():  # Если абзац не пустой
-                    processed_paragraphs.append(paragraph.rstrip('.'))
-                else:
-                    processed_paragraphs.append(paragraph)  # Сохраняем пустые строки
-            result = '\n'.join(processed_paragraphs)
+            result = self.remove_paragraph_dots(result)
         
         return result
     
-    async def shorten_text(self, text: str, no_dot: bool = False) -> str:
+    async def shorten_text(self, text: str, no_dot: bool = False, user_id: Optional[int] = None,
+                           on_queued: Optional[QueueCallback] = None,
+                           on_partial: Optional[PartialCallback] = None) -> str:
         """Сокращает текст"""
-        result = await self.process_text(text, "shorten_text")
+        result = await self.process_text(text, "shorten_text", user_id, on_queued, on_partial)
         
         # Если указан параметр nodot, убираем точки только в конце абзацев
         if no_dot:
-            # Разбиваем на абзацы и убираем точки только в конце каждого абзаца
-            paragraphs = result.split('\n')
-            processed_paragraphs = []
-            for paragraph in paragraphs:
-                if paragraph.strip():  # Если абзац не пустой
-                    processed_paragraphs.append(paragraph.rstrip('.'))
-                else:
-                    processed_paragraphs.append(paragraph)  # Сохраняем пустые строки
-            result = '\n'.join(processed_paragraphs)
+            result = self.remove_paragraph_dots(result)
         
         return result
     
-    async def translate_text(self, text: str, target_language: str, no_dot: bool = False) -> str:
+    async def translate_text(self, text: str, target_language: str, no_dot: bool = False,
+                             user_id: Optional[int] = None,
+                             on_queued: Optional[QueueCallback] = None,
+                             on_partial: Optional[PartialCallback] = None) -> str:
         """Переводит текст на указанный язык"""
         # Определяем промпт в зависимости от языка
         if target_language == "ru":
@@ -207,22 +982,25 @@ class LLMService:
             if prompt_key not in ["translate_en", "translate_uz", "translate_am"]:
                 return f"❌ Неподдерживаемый язык: {target_language}. Поддерживаемые языки: en, uz, am, ru"
         
-        result = await self.process_text(text, prompt_key)
+        result = await self.process_text(text, prompt_key, user_id, on_queued, on_partial)
         
         # Если указан параметр nodot, убираем точки только в конце абзацев
         if no_dot:
-            # Разбиваем на абзацы и убираем точки только в конце каждого абзаца
-            paragraphs = result.split('\n')
-            processed_paragraphs = []
-            for paragraph in paragraphs:
-                if paragraph.strip():  # Если абзац не пустой
-                    processed_paragraphs.append(paragraph.rstrip('.'))
-                else:
-                    processed_paragraphs.append(paragraph)  # Сохраняем пустые строки
-            result = '\n'.join(processed_paragraphs)
+            result = self.remove_paragraph_dots(result)
         
         return result
     
+    def get_stats(self) -> Dict:
+        """Возвращает счетчики запросов к YandexGPT"""
+        return {
+            "in_flight": len(self._inflight),
+            "coalesced_requests": self.coalesced_requests,
+            "retried_requests": self.retried_requests,
+            "hedged_requests": self.hedged_requests,
+            "reused_paragraphs": self.reused_paragraphs,
+            "checked_paragraphs": self.checked_paragraphs,
+        }
+    
     def get_cost_estimate(self, text_length: int) -> dict:
         """
         Оценивает стоимость обработки текста
@@ -233,8 +1011,8 @@ class LLMService:
         Returns:
             Словарь с оценкой стоимости
         """
-        # Примерная оценка: 1 символ ≈ 0.25 токена
-        estimated_tokens = text_length * 0.25
+        # Оценка по среднему числу токенов на символ, уточняемому по ответам модели
+        estimated_tokens = self.token_budget.estimate_chars(text_length)
         
         costs = {
             "yandexgpt_lite": estimated_tokens * 0.001,
@@ -0,0 +1,254 @@
+import logging
+import math
+import time
+from bisect import bisect_left
+from functools import wraps
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм времени (секунды): от обращений к Telegram до долгих ответов модели
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+class Counter:
+    """Монотонный счетчик"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels, amount: float = 1.0):
+        key = tuple(str(label) for label in labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in self._values.items()
+        ]
+
+class Gauge(Counter):
+    """Текущее значение; вместо set можно передать функцию, которая вызывается при сборе метрик"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 function: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def set(self, value: float, *labels):
+        self._values[tuple(str(label) for label in labels)] = value
+
+    def render(self) -> List[str]:
+        if self.function is not None:
+            try:
+                self._values[()] = self.function()
+            except Exception as e:
+                logger.warning(f"Не удалось получить значение метрики {self.name}: {e}")
+        return super().render()
+
+class Histogram:
+    """Распределение значений по корзинам; observe - поиск корзины и два сложения"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # Метки -> [счетчики по корзинам (последняя - +Inf), сумма]
+        self._series: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, *labels):
+        key = tuple(str(label) for label in labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def time(self, *labels):
+        """Декоратор корутины: время выполнения попадает в гистограмму"""
+        def decorator(function):
+            @wraps(function)
+            async def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - started, *labels)
+            return wrapper
+        return decorator
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    """
+    Метрики в текстовом формате Prometheus
+
+    Счетчики и гистограммы обновляются на горячем пути (словарь и сложение),
+    а все, что уже считают компоненты бота в get_stats(), читается только
+    при запросе /metrics через зарегистрированные функции.
+    """
+
+    def __init__(self, prefix: str = "bot"):
+        self.prefix = prefix
+        self._metrics: Dict[str, object] = {}
+        self._stats: Dict[str, Callable[[], Dict]] = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(f"{self.prefix}_{name}", documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+              function: Optional[Callable[[], float]] = None) -> Gauge:
+        return self._register(Gauge(f"{self.prefix}_{name}", documentation, labelnames, function))
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(f"{self.prefix}_{name}", documentation, labelnames, buckets))
+
+    def register_stats(self, name: str, get_stats: Callable[[], Dict]):
+        """
+        Публикует числовые значения get_stats() компонента как метрики <prefix>_<name>_<ключ>
+
+        Вложенные словари (например, статистика по моделям) становятся метками key.
+        Повторная регистрация с тем же именем заменяет источник.
+        """
+        self._stats[name] = get_stats
+
+    def _render_stats(self, name: str, stats: Dict, labels: Tuple[Tuple[str, str], ...],
+                      series: Dict[str, List[str]]):
+        """Раскладывает словарь статистики по метрикам: имя метрики -> строки значений"""
+        for key, value in stats.items():
+            metric = f"{name}_{key}"
+            if isinstance(value, dict):
+                label = "key" if not labels else f"key{len(labels) + 1}"
+                for sub_key, sub_value in value.items():
+                    sub_labels = labels + ((label, sub_key),)
+                    if isinstance(sub_value, dict):
+                        self._render_stats(metric, sub_value, sub_labels, series)
+                    elif isinstance(sub_value, (int, float)):
+                        series.setdefault(metric, []).append(self._stat_line(metric, sub_labels, sub_value))
+            elif isinstance(value, (int, float)):
+                series.setdefault(metric, []).append(self._stat_line(metric, labels, value))
+
+    @staticmethod
+    def _stat_line(metric: str, labels: Tuple[Tuple[str, str], ...], value: float) -> str:
+        names = [label for label, _ in labels]
+        values = [label_value for _, label_value in labels]
+        return f"{metric}{_format_labels(names, values)} {_format_value(float(value))}"
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+
+        for name, get_stats in self._stats.items():
+            try:
+                stats = get_stats()
+            except Exception as e:
+                logger.warning(f"Не удалось получить статистику {name}: {e}")
+                continue
+            series: Dict[str, List[str]] = {}
+            self._render_stats(f"{self.prefix}_{name}", stats, (), series)
+            # Значения get_stats бывают и счетчиками, и текущими значениями - тип не указываем
+            for metric, metric_lines in series.items():
+                lines.append(f"# TYPE {metric} untyped")
+                lines.extend(metric_lines)
+        return "\n".join(lines) + "\n"
+
+class MetricsServer:
+    """HTTP-сервер метрик: GET /metrics в текстовом формате Prometheus"""
+
+    def __init__(self, registry: MetricsRegistry, listen: str = "127.0.0.1", port: int = 9100):
+        self.registry = registry
+        self.listen = listen
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+        self.web_app = web.Application()
+        self.web_app.router.add_get("/metrics", self.handle_metrics)
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.registry.render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    async def start(self):
+        self._runner = web.AppRunner(self.web_app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.listen, self.port)
+        await site.start()
+        logger.info(f"Метрики доступны на http://{self.listen}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+# Общий реестр метрик бота
+REGISTRY = MetricsRegistry()
+
+QUEUE_WAIT = REGISTRY.histogram(
+    "llm_queue_wait_seconds", "Ожидание слота в очереди запросов к YandexGPT"
+)
+LLM_LATENCY = REGISTRY.histogram(
+    "llm_request_seconds", "Время попытки запроса к YandexGPT", ("task", "model")
+)
+LLM_RESPONSES = REGISTRY.counter(
+    "llm_responses_total", "Ответы YandexGPT по коду статуса (timeout и network - без ответа)", ("status",)
+)
+TELEGRAM_LATENCY = REGISTRY.histogram(
+    "telegram_request_seconds", "Время запроса к Telegram Bot API (без ожидания лимитов)", ("method",)
+)
+HANDLER_LATENCY = REGISTRY.histogram(
+    "handler_seconds", "Время обработки обновления обработчиком бота", ("handler",)
+)
+MARKDOWN_FALLBACKS = REGISTRY.counter(
+    "markdown_fallbacks_total", "Ответы, отправленные без Markdown после ошибки разбора"
+)
+USER_STATES = REGISTRY.gauge(
+    "user_states", "Пользователи в состоянии ожидания текста (размер user_states)"
+)
@@ -0,0 +1,195 @@
+import asyncio
+import json
+import threading
+import time
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+from llm_resilience import CircuitBreaker, LatencyTracker
+
+logger = logging.getLogger(__name__)
+
+class ModelStats:
+    """Состояние одной модели: предохранитель, время ответа и доля ошибок"""
+
+    __slots__ = ("model", "breaker", "latency", "error_rate", "samples", "updated", "requests", "errors", "routed")
+
+    def __init__(self, model: str, breaker: CircuitBreaker):
+        self.model = model
+        self.breaker = breaker
+        self.latency = LatencyTracker()
+        # Экспоненциальное скользящее среднее доли неудачных попыток
+        self.error_rate = 0.0
+        self.samples = 0
+        self.updated = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.routed = 0
+
+class ModelRouter:
+    """
+    Выбор модели YandexGPT для каждого запроса
+
+    Задачи из pro_tasks с текстом не длиннее pro_max_length идут в pro_model,
+    остальные - в основную модель: длинные тексты дешевле и быстрее обрабатывает lite.
+    Если выбранная модель деградировала (разомкнут предохранитель или доля ошибок
+    выше max_error_rate) или ее p95 времени ответа выше latency_target, а другая
+    модель отвечает быстрее, запрос направляется в другую модель. Доля ошибок и время
+    ответа учитываются, только если модель отвечала в последние stats_window секунд:
+    модель, от которой отказались, через это время снова получает запросы и проверяется.
+    Решения и результаты запросов, ушедших в YandexGPT, пишутся в JSONL-журнал
+    для настройки политики; запись идет в фоновом потоке, а не в цикле событий.
+    """
+
+    def __init__(self, model: str, pro_model: Optional[str] = None, pro_tasks: Iterable[str] = (),
+                 pro_max_length: int = 2000, latency_target: float = 10.0, max_error_rate: float = 0.3,
+                 breaker_threshold: int = 5, breaker_reset: float = 30.0,
+                 log_file: Optional[str] = None, min_samples: int = 10, smoothing: float = 0.1,
+                 stats_window: float = 300.0):
+        self.model = model
+        self.pro_model = pro_model if pro_model and pro_model != model else None
+        self.pro_tasks = set(pro_tasks)
+        self.pro_max_length = pro_max_length
+        self.latency_target = latency_target
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.smoothing = smoothing
+        self.stats_window = stats_window
+        self.log_file = log_file or None
+
+        self._models: Dict[str, ModelStats] = {}
+        for name in filter(None, (self.model, self.pro_model)):
+            self._models[name] = ModelStats(name, CircuitBreaker(breaker_threshold, breaker_reset))
+        self._breaker_params = (breaker_threshold, breaker_reset)
+
+        # Записи журнала копятся в буфере и дописываются в файл в потоке исполнителя
+        self._log_buffer: List[str] = []
+        self._log_lock = threading.Lock()
+        self._log_writing = False
+
+        self.fallbacks = 0
+
+    def get(self, model: str) -> ModelStats:
+        """Состояние модели (для неизвестной модели создается)"""
+        stats = self._models.get(model)
+        if stats is None:
+            stats = ModelStats(model, CircuitBreaker(*self._breaker_params))
+            self._models[model] = stats
+        return stats
+
+    def alternative(self, model: str) -> Optional[str]:
+        """Другая модель, на которую можно переключиться"""
+        if self.pro_model is None:
+            return None
+        return self.pro_model if model == self.model else self.model
+
+    def _is_recent(self, stats: ModelStats) -> bool:
+        return time.monotonic() - stats.updated <= self.stats_window
+
+    def is_healthy(self, model: str) -> bool:
+        stats = self.get(model)
+        if stats.breaker.is_open():
+            return False
+        if stats.samples < self.min_samples or not self._is_recent(stats):
+            return True
+        return stats.error_rate <= self.max_error_rate
+
+    def route(self, task_type: str, text_length: int) -> Tuple[str, str]:
+        """
+        Выбирает модель для запроса
+
+        Выбор ничего не учитывает: запрос может быть обслужен из кэша или присоединен
+        к уже выполняющемуся. Ушедший в YandexGPT запрос учитывается в record_route.
+
+        Returns:
+            (модель, причина выбора)
+        """
+        if task_type in self.pro_tasks and self.pro_model and text_length <= self.pro_max_length:
+            model, reason = self.pro_model, "task"
+        else:
+            model, reason = self.model, "default"
+
+        alternative = self.alternative(model)
+        if alternative is not None:
+            if not self.is_healthy(model) and self.is_healthy(alternative):
+                model, reason = alternative, "degraded"
+            elif self.is_healthy(alternative) and self._is_recent(self.get(model)):
+                p95 = self.get(model).latency.percentile(0.95)
+                alternative_stats = self.get(alternative)
+                alternative_p95 = alternative_stats.latency.percentile(0.95)
+                # Без свежих замеров другой модели переключение ничем не обосновано
+                has_evidence = alternative_stats.samples >= self.min_samples and self._is_recent(alternative_stats)
+                if p95 is not None and p95 > self.latency_target and has_evidence \
+                        and alternative_p95 is not None and alternative_p95 < p95:
+                    model, reason = alternative, "latency"
+
+        return model, reason
+
+    def record_route(self, model: str, task_type: str, text_length: int, reason: str):
+        """Учитывает запрос, отправленный в модель по решению route"""
+        self.get(model).routed += 1
+        self._log({"event": "route", "task": task_type, "chars": text_length, "model": model, "reason": reason})
+
+    def record(self, model: str, ok: bool, latency: Optional[float] = None, error: Optional[str] = None):
+        """Учитывает результат попытки запроса к модели"""
+        stats = self.get(model)
+        stats.requests += 1
+        stats.samples += 1
+        stats.updated = time.monotonic()
+        stats.error_rate += self.smoothing * ((0.0 if ok else 1.0) - stats.error_rate)
+        if ok:
+            if latency is not None:
+                stats.latency.add(latency)
+        else:
+            stats.errors += 1
+
+        record = {"event": "result", "model": model, "ok": ok}
+        if latency is not None:
+            record["latency"] = round(latency, 3)
+        if error:
+            record["error"] = error
+        self._log(record)
+
+    def _log(self, record: Dict):
+        if not self.log_file:
+            return
+        record["ts"] = round(time.time(), 3)
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._log_lock:
+            self._log_buffer.append(line)
+            if self._log_writing:
+                return
+            self._log_writing = True
+        try:
+            asyncio.get_running_loop().run_in_executor(None, self._write_log)
+        except RuntimeError:
+            self._write_log()
+
+    def _write_log(self):
+        """Дописывает накопленные записи журнала в файл"""
+        while True:
+            with self._log_lock:
+                lines, self._log_buffer = self._log_buffer, []
+                if not lines:
+                    self._log_writing = False
+                    return
+            try:
+                with open(self.log_file, 'a', encoding='utf-8') as f:
+                    f.writelines(lines)
+            except Exception as e:
+                logger.error(f"Ошибка записи журнала маршрутизации: {e}")
+
+    def get_stats(self) -> Dict:
+        return {
+            "fallbacks": self.fallbacks,
+            "models": {
+                name: {
+                    "routed": stats.routed,
+                    "requests": stats.requests,
+                    "errors": stats.errors,
+                    "error_rate": round(stats.error_rate, 3),
+                    "p95": stats.latency.percentile(0.95),
+                    "breaker": stats.breaker.state,
+                }
+                for name, stats in self._models.items()
+            },
+        }
@@ -0,0 +1,198 @@
+import asyncio
+import time
+import logging
+from typing import Any, Callable, Coroutine, Dict, Hashable, List, Optional, Union
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+from metrics import TELEGRAM_LATENCY
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Редактирования одного сообщения, которые можно схлопнуть: важен только последний текст
+COALESCED_ENDPOINTS = ("editMessageText",)
+
+class TokenBucket:
+    """
+    Корзина токенов с резервированием
+
+    reserve() сразу забирает токен, даже если его еще нет, и возвращает время
+    ожидания. Так ожидающие запросы выстраиваются в очередь в порядке вызова
+    без блокировок и фоновых задач.
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, now: float) -> float:
+        """Забирает токен; возвращает, сколько секунд нужно подождать до отправки"""
+        self._refill(now)
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+    def refund(self):
+        """Возвращает неиспользованный токен"""
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def pause(self, now: float, seconds: float):
+        """Не выдает токены ближайшие seconds секунд (ответ Telegram retry_after)"""
+        self._refill(now)
+        self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+    def is_idle(self, now: float) -> bool:
+        """Корзина полна - ее можно удалить и создать заново при следующем запросе"""
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+class TelegramRateLimiter(BaseRateLimiter):
+    """
+    Ограничитель исходящих запросов к Telegram Bot API
+
+    Все запросы бота (reply_text, edit_text, delete и т.д.) проходят через общую
+    корзину (~30 сообщений в секунду на бота) и корзину чата (~1 сообщение
+    в секунду в личном чате, ~20 в минуту в группе). Запрос, для которого нет
+    токена, ждет своей очереди вместо ошибки 429. Если Telegram все же ответил
+    RetryAfter, чат приостанавливается на retry_after секунд и запрос повторяется.
+    Ожидающее редактирование сообщения отменяется, если за ним в очереди уже
+    стоит более новое редактирование того же сообщения.
+    """
+
+    def __init__(self, global_rate: float = 30.0, chat_rate: float = 1.0, group_rate: float = 20 / 60,
+                 chat_burst: int = 3, max_retries: int = 3):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats: Dict[Hashable, TokenBucket] = {}
+        self._prune_at = 1024
+
+        # (chat_id, message_id) -> номер последнего поставленного в очередь редактирования
+        self._latest_edit: Dict[Hashable, int] = {}
+        self._edit_seq = 0
+
+        # Метрики
+        self.queued = 0
+        self.max_queued = 0
+        self.sent = 0
+        self.throttled = 0
+        self.retries = 0
+        self.coalesced = 0
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        self._chats.clear()
+        self._latest_edit.clear()
+
+    def _chat_bucket(self, chat_id: Hashable, now: float) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self._prune_at:
+                self._prune(now)
+            # Отрицательные id - группы и каналы, для них лимит строже
+            is_group = isinstance(chat_id, int) and chat_id < 0 or isinstance(chat_id, str)
+            bucket = TokenBucket(self.group_rate if is_group else self.chat_rate, self.chat_burst)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def _prune(self, now: float):
+        """Удаляет корзины чатов, которые давно ничего не отправляли"""
+        self._chats = {chat_id: bucket for chat_id, bucket in self._chats.items() if not bucket.is_idle(now)}
+        self._prune_at = max(1024, len(self._chats) * 2)
+
+    async def _wait(self, delay: float):
+        if delay <= 0:
+            return
+        self.throttled += 1
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+        try:
+            with span("telegram_rate_wait"):
+                await asyncio.sleep(delay)
+        finally:
+            self.queued -= 1
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], List[Dict[str, Any]]]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[Any],
+    ) -> Union[bool, Dict[str, Any], List[Dict[str, Any]]]:
+        chat_id = data.get("chat_id")
+
+        edit_key = None
+        if endpoint in COALESCED_ENDPOINTS and chat_id is not None and data.get("message_id") is not None:
+            edit_key = (chat_id, data["message_id"])
+            self._edit_seq += 1
+            edit_seq = self._edit_seq
+            self._latest_edit[edit_key] = edit_seq
+
+        try:
+            attempt = 0
+            while True:
+                if chat_id is not None:
+                    bucket = self._chat_bucket(chat_id, time.monotonic())
+                    await self._wait(bucket.reserve(time.monotonic()))
+
+                    if edit_key is not None and self._latest_edit.get(edit_key) != edit_seq:
+                        # Пока ждали, пришло более новое редактирование - это уже не нужно
+                        bucket.refund()
+                        self.coalesced += 1
+                        return True
+
+                await self._wait(self._global.reserve(time.monotonic()))
+
+                started = time.perf_counter()
+                try:
+                    with span("telegram", method=endpoint):
+                        result = await callback(*args, **kwargs)
+                    self.sent += 1
+                    return result
+                except RetryAfter as e:
+                    attempt += 1
+                    self.retries += 1
+                    retry_after = float(e.retry_after)
+                    if attempt > self.max_retries:
+                        raise
+                    logger.warning(
+                        f"Telegram ограничил запросы ({endpoint}, чат {chat_id}): повтор через {retry_after} с"
+                    )
+                    now = time.monotonic()
+                    if chat_id is not None:
+                        self._chat_bucket(chat_id, now).pause(now, retry_after)
+                    else:
+                        self._global.pause(now, retry_after)
+                finally:
+                    TELEGRAM_LATENCY.observe(time.perf_counter() - started, endpoint)
+        finally:
+            if edit_key is not None and self._latest_edit.get(edit_key) == edit_seq:
+                del self._latest_edit[edit_key]
+
+    def get_stats(self) -> Dict:
+        """Возвращает метрики исходящей очереди"""
+        return {
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "sent": self.sent,
+            "throttled": self.throttled,
+            "retries": self.retries,
+            "coalesced": self.coalesced,
+            "chats": len(self._chats),
+        }
@@ -0,0 +1,243 @@
+"""
+Локальная предварительная проверка текста перед обращением к YandexGPT
+
+Словарь - отсортированный список слов в одном файле, который отображается
+в память (mmap) при первой проверке и ищется двоичным поиском. Собрать словарь
+из списка слов (по одному слову в строке, например выгрузки OpenCorpora):
+
+    python spell_precheck.py build words.txt ru_words.dic
+"""
+import mmap
+import os
+import re
+import sys
+import logging
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+from text_chunker import split_sentences
+
+logger = logging.getLogger(__name__)
+
+DICTIONARY_MAGIC = b"SPDICT1\n"
+
+# Слово: буквы, возможно через дефис (кое-что, по-моему)
+WORD_RE = re.compile(r"[^\W\d_]+(?:-[^\W\d_]+)*")
+CYRILLIC_WORD_RE = re.compile(r"[а-яё]+(?:-[а-яё]+)*")
+
+# Признаки возможных ошибок, которые словарь не ловит: такое предложение проверяет модель
+SUSPICIOUS_PATTERNS = [
+    re.compile(r"\s[,.!?;:]"),                      # пробел перед знаком препинания
+    re.compile(r"[,;:!?](?=[^\W\d_])"),             # нет пробела после знака препинания
+    re.compile(r"\.(?=[А-ЯЁA-Z])"),                 # нет пробела после точки
+    re.compile(r"[,;:]{2,}|\s{2,}"),                # повторы знаков и пробелов
+    re.compile(r"(?i)[а-яё]ть?ся\b"),               # -тся / -ться
+    re.compile(                                     # слитное и раздельное написание
+        r"(?i)\b(?:так же|также|то же|тоже|что бы|чтобы|за то|зато|при том|притом|"
+        r"в течении|в течение|не смотря|несмотря|в следствии|вследствие|в место|вместо)\b"
+    ),
+]
+
+# Союзы и союзные слова, перед которыми обычно нужна запятая
+CONJUNCTION_RE = re.compile(r"(?i)([^\W\d_]+)\s+(но|а|что|чтобы|котор[а-яё]+|если|когда|хотя|будто|пока|чем)\b")
+# Слова, после которых запятая перед союзом не ставится (потому что, так что, и если...)
+NO_COMMA_BEFORE = {
+    "потому", "так", "то", "не", "для", "после", "прежде", "вместо", "тем", "и", "или", "да",
+    "ни", "либо", "лишь", "только", "даже", "что", "чем", "ли", "а", "но", "в", "на", "о", "об",
+    "при", "из", "по", "с", "со", "у", "к", "от", "до", "за", "под", "над", "через", "про",
+}
+
+SENTENCE_END_RE = re.compile(r"[.!?…][»\"')\]]*$")
+FIRST_LETTER_RE = re.compile(r"[^\W\d_]")
+
+class WordDictionary:
+    """
+    Словарь слов в файле, отображенном в память
+
+    Формат: DICTIONARY_MAGIC, число слов (uint32), смещения слов (uint32, на одно
+    больше числа слов), затем слова в UTF-8 подряд, отсортированные по байтам.
+    Файл не загружается в память целиком: читаются только страницы, которые
+    затрагивает двоичный поиск.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(DICTIONARY_MAGIC)] != DICTIONARY_MAGIC:
+            self.close()
+            raise ValueError(f"{path} не является файлом словаря")
+
+        header = len(DICTIONARY_MAGIC)
+        self.count = int.from_bytes(self._mmap[header:header + 4], 'little')
+        offsets_start = header + 4
+        self._words_start = offsets_start + 4 * (self.count + 1)
+        offsets = memoryview(self._mmap)[offsets_start:self._words_start]
+        if sys.byteorder == 'little':
+            self._offsets = offsets.cast('I')
+        else:
+            self._offsets = array('I', offsets)
+            self._offsets.byteswap()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __contains__(self, word: str) -> bool:
+        key = word.encode('utf-8')
+        offsets = self._offsets
+        data = self._mmap
+        base = self._words_start
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            current = data[base + offsets[mid]:base + offsets[mid + 1]]
+            if current < key:
+                lo = mid + 1
+            elif current > key:
+                hi = mid
+            else:
+                return True
+        return False
+
+    def close(self):
+        if isinstance(self._offsets, memoryview):
+            self._offsets.release()
+        self._mmap.close()
+        self._file.close()
+
+    @staticmethod
+    def build(words: Iterable[str], path: str) -> int:
+        """Собирает файл словаря из списка слов; возвращает число слов"""
+        normalized = {word.strip().lower() for word in words if word.strip()}
+        # Слова с ё находятся и при написании через е
+        normalized |= {word.replace('ё', 'е') for word in normalized if 'ё' in word}
+        encoded = sorted(word.encode('utf-8') for word in normalized)
+        offsets = array('I', [0])
+        for word in encoded:
+            offsets.append(offsets[-1] + len(word))
+        if sys.byteorder != 'little':
+            offsets.byteswap()
+
+        tmp_file = f"{path}.tmp"
+        with open(tmp_file, 'wb') as f:
+            f.write(DICTIONARY_MAGIC)
+            f.write(len(encoded).to_bytes(4, 'little'))
+            f.write(offsets.tobytes())
+            for word in encoded:
+                f.write(word)
+        os.replace(tmp_file, path)
+        return len(encoded)
+
+class SpellPrecheck:
+    """
+    Предварительная проверка для /check
+
+    Предложение считается чистым, если все его слова есть в словаре и не сработало
+    ни одно правило пунктуации. Чистый текст возвращается без обращения к модели,
+    в остальных случаях модели отправляются только подозрительные предложения.
+    Словарь загружается при первой проверке; без словаря проверка отключена.
+    """
+
+    def __init__(self, dictionary_file: Optional[str] = None):
+        self.dictionary_file = dictionary_file or None
+        self._dictionary: Optional[WordDictionary] = None
+        self._load_failed = False
+
+        # Метрики
+        self.checked = 0
+        self.clean = 0
+        self.partial = 0
+        self.sentences = 0
+        self.skipped_sentences = 0
+
+    def _get_dictionary(self) -> Optional[WordDictionary]:
+        if self._dictionary is None and self.dictionary_file and not self._load_failed:
+            try:
+                self._dictionary = WordDictionary(self.dictionary_file)
+                logger.info(f"Словарь {self.dictionary_file} загружен: {len(self._dictionary)} слов")
+            except Exception as e:
+                self._load_failed = True
+                logger.error(f"Не удалось загрузить словарь {self.dictionary_file}, предпроверка отключена: {e}")
+        return self._dictionary
+
+    def is_known(self, word: str) -> bool:
+        """Есть ли слово в словаре (слово через дефис - целиком или по частям)"""
+        dictionary = self._dictionary
+        word = word.lower()
+        if word in dictionary:
+            return True
+        if '-' in word:
+            return all(self.is_known(part) for part in word.split('-'))
+        return False
+
+    def is_sentence_clean(self, sentence: str) -> bool:
+        """Нет ли в предложении признаков ошибок"""
+        stripped = sentence.strip()
+        if not stripped:
+            return True
+
+        first_letter = FIRST_LETTER_RE.search(stripped)
+        if first_letter and first_letter.group().islower():
+            return False
+        if first_letter and not SENTENCE_END_RE.search(stripped):
+            return False
+
+        for pattern in SUSPICIOUS_PATTERNS:
+            if pattern.search(stripped):
+                return False
+        for match in CONJUNCTION_RE.finditer(stripped):
+            if match.group(1).lower() not in NO_COMMA_BEFORE:
+                return False
+
+        for word in WORD_RE.findall(stripped):
+            # Слова не на русском словарем не проверить - их проверяет модель
+            if not CYRILLIC_WORD_RE.fullmatch(word.lower()) or not self.is_known(word):
+                return False
+        return True
+
+    def check(self, text: str) -> Optional[List[Tuple[str, str, bool]]]:
+        """
+        Делит текст на подряд идущие чистые и подозрительные предложения
+
+        Returns:
+            Список (фрагмент, разделитель после него, нужна ли проверка моделью);
+            None, если словарь недоступен
+        """
+        if self._get_dictionary() is None:
+            return None
+
+        segments: List[Tuple[str, str, bool]] = []
+        for sentence, separator in split_sentences(text):
+            suspicious = not self.is_sentence_clean(sentence)
+            self.sentences += 1
+            if not suspicious:
+                self.skipped_sentences += 1
+
+            if segments and segments[-1][2] == suspicious:
+                previous, previous_separator, _ = segments[-1]
+                segments[-1] = (previous + previous_separator + sentence, separator, suspicious)
+            else:
+                segments.append((sentence, separator, suspicious))
+
+        self.checked += 1
+        if not any(suspicious for _, _, suspicious in segments):
+            self.clean += 1
+        elif not all(suspicious for _, _, suspicious in segments):
+            self.partial += 1
+        return segments
+
+    def get_stats(self) -> Dict:
+        return {
+            "checked": self.checked,
+            "clean": self.clean,
+            "partial": self.partial,
+            "skip_rate": self.clean / self.checked if self.checked else 0.0,
+            "sentence_skip_rate": self.skipped_sentences / self.sentences if self.sentences else 0.0,
+        }
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4 or sys.argv[1] != 'build':
+        print("Использование: python spell_precheck.py build words.txt ru_words.dic")
+        sys.exit(1)
+    with open(sys.argv[2], 'r', encoding='utf-8') as source:
+        total = WordDictionary.build(source, sys.argv[3])
+    print(f"Словарь {sys.argv[3]}: {total} слов")
@@ -1,6 +1,11 @@
-import re
-from typing import Tuple, Dict, Any
+import asyncio
+import logging
+import time
+from typing import Tuple, Dict, Any, Optional
 from telegram import Update, MessageEntity
+from text_normalizer import clean_formatting
+
+logger = logging.getLogger(__name__)
 
 class TelegramFormatter:
     """Утилиты для работы с форматированием Telegram сообщений"""
@@ -67,14 +72,7 @@ class TelegramFormatter:
     @staticmethod
     def clean_formatting_for_llm(text: str) -> str:
         """Очищает текст от форматирования для отправки в LLM"""
-        # Убираем Markdown форматирование
-        text = re.sub(r'\*\*(.*?)\*\*', r'\1', text)  # Жирный
-        text = re.sub(r'\*(.*?)\*', r'\1', text)      # Курсив
-        text = re.sub(r'`(.*?)`', r'\1', text)        # Код
-        text = re.sub(r'```(.*?)```', r'\1', text, flags=re.DOTALL)  # Блок кода
-        text = re.sub(r'\[([^\]]+)\]\([^)]+\)', r'\1', text)  # Ссылки
-        
-        return text.strip()
+        return clean_formatting(text)
     
     @staticmethod
     def format_result_message(original_text: str, result_text: str, operation: str) -> str:
@@ -118,3 +116,86 @@ class TelegramFormatter:
             parts.append(current_part.strip())
         
         return parts
+
+
+class StreamingMessage:
+    """
+    Постепенно показывает в сообщении о обработке текст, который генерирует модель
+    
+    update только запоминает последний частичный ответ: сообщение редактирует
+    отдельная задача не чаще min_interval секунд, поэтому чтение ответа модели
+    никогда не ждет Telegram, а промежуточные ответы, пришедшие во время
+    редактирования, заменяются последним.
+    """
+    
+    def __init__(self, message, header: str, min_interval: float = 1.5, max_length: int = 4000):
+        self.message = message
+        self.header = header
+        # Telegram ограничивает частоту редактирования, поэтому правим не чаще min_interval секунд
+        self.min_interval = min_interval
+        self.max_length = max_length
+        self.last_edit = 0.0
+        self.last_text = ""
+        self.edits = 0
+        self.pending: Optional[str] = None
+        self.closed = False
+        self._editing = False
+        self._task: Optional[asyncio.Task] = None
+    
+    @property
+    def started(self) -> bool:
+        """Было ли сообщение хотя бы раз отредактировано частичным ответом"""
+        return self.edits > 0
+    
+    def update(self, partial_text: str):
+        """Запоминает частичный ответ и при необходимости запускает задачу редактирования"""
+        if self.closed:
+            return
+        self.pending = partial_text
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._flush())
+    
+    async def _flush(self):
+        while self.pending is not None and not self.closed:
+            delay = self.min_interval - (time.monotonic() - self.last_edit)
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            
+            partial_text, self.pending = self.pending, None
+            # Промежуточный текст отправляем без Markdown: разметка может быть еще не закрыта
+            text = f"{self.header}\n\n{partial_text.strip()} ▌"
+            if len(text) > self.max_length:
+                text = text[:self.max_length - 1] + "…"
+            if text == self.last_text:
+                continue
+            
+            self.last_edit = time.monotonic()
+            self._editing = True
+            try:
+                await self.message.edit_text(text)
+                self.last_text = text
+                self.edits += 1
+            except Exception as e:
+                logger.warning(f"Не удалось показать частичный ответ: {e}")
+            finally:
+                self._editing = False
+    
+    async def close(self):
+        """
+        Останавливает обновления перед отправкой результата
+        
+        Ожидание интервала прерывается, а уже отправленное редактирование
+        дожидается ответа, чтобы оно не легло поверх итогового сообщения.
+        """
+        self.closed = True
+        self.pending = None
+        task = self._task
+        if task is None or task.done():
+            return
+        if not self._editing:
+            task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
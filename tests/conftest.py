@@ -0,0 +1,22 @@
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+# Настройки задаются до импорта config: тесты не обращаются к настоящему YandexGPT
+# и не пишут файлы состояния
+os.environ.update({
+    "TELEGRAM_TOKEN": "123456:test",
+    "YANDEX_API_KEY": "test",
+    "YANDEX_FOLDER_ID": "test",
+    "LLM_CACHE_FILE": "",
+    "LLM_JOBS_FILE": "",
+    "TOKEN_STATS_FILE": "",
+    "ROUTER_LOG_FILE": "",
+    "SPELL_DICT_FILE": "",
+    "MODEL_ROUTING": "false",
+    "LLM_TOKENIZER": "false",
+    "LLM_POOL_WARMUP": "0",
+})
@@ -0,0 +1,58 @@
+import asyncio
+
+from yandex_stub import running_service
+
+TEXT = "привет мир"
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+async def cancel(task: asyncio.Task):
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+def test_cancelled_waiter_does_not_abort_shared_request():
+    async def scenario():
+        async with running_service([{"delay": 0.3}]) as (service, stub):
+            model_uri = service.get_model_uri()
+            first = asyncio.ensure_future(service._complete_cached(TEXT, "check_grammar", model_uri))
+            second = asyncio.ensure_future(service._complete_cached(TEXT, "check_grammar", model_uri))
+            await asyncio.sleep(0.05)
+            assert len(service._inflight) == 1
+            flight = next(iter(service._inflight.values()))
+            assert flight.waiters == 2
+
+            await cancel(first)
+            assert await second == "Привет мир"
+            assert not flight.task.cancelled()
+            assert stub.requests == 1
+            assert service.coalesced_requests == 1
+            assert not service._inflight
+    run(scenario())
+
+def test_last_waiter_cancels_shared_request():
+    async def scenario():
+        async with running_service([{"delay": 0.3}]) as (service, stub):
+            model_uri = service.get_model_uri()
+            waiters = [
+                asyncio.ensure_future(service._complete_cached(TEXT, "check_grammar", model_uri))
+                for _ in range(2)
+            ]
+            await asyncio.sleep(0.05)
+            flight = next(iter(service._inflight.values()))
+
+            await cancel(waiters[0])
+            assert not flight.task.done()
+            await cancel(waiters[1])
+            await asyncio.sleep(0)
+
+            assert flight.task.cancelled()
+            assert not service._inflight
+            assert service.scheduler.get_stats()["active"] == 0
+
+            # Следующий такой же запрос выполняется заново
+            assert await service._complete_cached(TEXT, "check_grammar", model_uri) == "Привет мир"
+    run(scenario())
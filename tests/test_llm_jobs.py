@@ -0,0 +1,52 @@
+import asyncio
+import time
+
+from llm_jobs import BackgroundJobs
+from llm_service import RetryableError
+
+class UnavailableOperations:
+    """Операции, которые YandexGPT больше не находит: проверка всегда завершается временной ошибкой"""
+
+    def __init__(self):
+        self.polls = 0
+
+    async def get_operation_result(self, operation_id, task_type):
+        self.polls += 1
+        raise RetryableError("Ошибка API: 503")
+
+def make_job(operation_id: str, age: float) -> dict:
+    return {
+        "operation_id": operation_id,
+        "task_type": "improve_text",
+        "no_dot": False,
+        "chat_id": 1,
+        "reply_to_message_id": None,
+        "cache_key": operation_id,
+        "created": time.time() - age,
+        "interval": 1.0,
+    }
+
+def test_job_older_than_max_age_fails_instead_of_polling_forever():
+    async def scenario():
+        service = UnavailableOperations()
+        jobs = BackgroundJobs(service, None, max_age=60)
+        delivered = []
+
+        async def deliver(job, text):
+            delivered.append((job["operation_id"], text))
+        jobs.deliver = deliver
+
+        for operation_id, age in (("fresh", 10), ("stale", 120)):
+            jobs.jobs[operation_id] = make_job(operation_id, age)
+            jobs._next_poll[operation_id] = time.monotonic()
+
+        await jobs._poll("fresh")
+        await jobs._poll("stale")
+
+        assert service.polls == 2
+        assert list(jobs.jobs) == ["fresh"]
+        assert jobs._next_poll["fresh"] > time.monotonic()
+        assert "stale" not in jobs._next_poll
+        assert len(delivered) == 1 and delivered[0][0] == "stale" and delivered[0][1].startswith("❌")
+        assert jobs.get_stats() == {"pending": 1, "completed": 0, "failed": 1}
+    asyncio.run(scenario())
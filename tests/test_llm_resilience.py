@@ -0,0 +1,151 @@
+import asyncio
+import time
+
+import pytest
+
+import llm_service
+from llm_resilience import CircuitBreaker, RetryPolicy
+from llm_service import CircuitOpenError, LLMServiceError, RetryableError
+from yandex_stub import running_service
+
+TEXT = "привет мир"
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+def fast_retries(service, attempts=3):
+    service.retry_policy = RetryPolicy(attempts, base_delay=0.01, max_delay=2.0)
+
+def test_retries_5xx_and_429_until_success():
+    async def scenario():
+        script = [{"status": 500}, {"status": 429}, {"status": 503}]
+        async with running_service(script) as (service, stub):
+            fast_retries(service, attempts=4)
+            result, _ = await service._request_with_retries(TEXT, "check_grammar", service.get_model_uri())
+            assert result == "Привет мир"
+            assert stub.statuses == [500, 429, 503, 200]
+            assert service.retried_requests == 3
+    run(scenario())
+
+def test_retry_waits_for_retry_after():
+    async def scenario():
+        script = [{"status": 429, "headers": {"Retry-After": "1"}}]
+        async with running_service(script) as (service, stub):
+            fast_retries(service)
+            started = time.monotonic()
+            await service._request_with_retries(TEXT, "check_grammar", service.get_model_uri())
+            assert time.monotonic() - started >= 1.0
+            assert stub.statuses == [429, 200]
+    run(scenario())
+
+def test_gives_up_after_max_attempts():
+    async def scenario():
+        async with running_service([{"status": 502}] * 5) as (service, stub):
+            fast_retries(service, attempts=3)
+            with pytest.raises(RetryableError):
+                await service._request_with_retries(TEXT, "check_grammar", service.get_model_uri())
+            assert stub.statuses == [502, 502, 502]
+    run(scenario())
+
+def test_no_retry_on_4xx():
+    async def scenario():
+        async with running_service([{"status": 400}]) as (service, stub):
+            fast_retries(service)
+            with pytest.raises(LLMServiceError) as error:
+                await service._request_with_retries(TEXT, "check_grammar", service.get_model_uri())
+            assert not isinstance(error.value, RetryableError)
+            assert stub.statuses == [400]
+            assert service.retried_requests == 0
+            # Ошибка в запросе не считается отказом сервиса
+            assert service.router.get(service.model).breaker.state == CircuitBreaker.CLOSED
+    run(scenario())
+
+def test_breaker_opens_half_opens_and_closes():
+    async def scenario():
+        async with running_service([{"status": 500}] * 3) as (service, stub):
+            fast_retries(service, attempts=1)
+            model_uri = service.get_model_uri()
+            breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.2)
+            service.router.get(service.model).breaker = breaker
+
+            for _ in range(2):
+                with pytest.raises(RetryableError):
+                    await service._request_with_retries(TEXT, "check_grammar", model_uri)
+            assert breaker.state == CircuitBreaker.OPEN
+
+            # Пока предохранитель разомкнут, запрос не отправляется
+            with pytest.raises(CircuitOpenError):
+                await service._request_with_retries(TEXT, "check_grammar", model_uri)
+            assert len(stub.statuses) == 2
+
+            # Пробный запрос после reset_timeout неудачен - предохранитель снова разомкнут
+            await asyncio.sleep(0.25)
+            with pytest.raises(RetryableError):
+                await service._request_with_retries(TEXT, "check_grammar", model_uri)
+            assert breaker.state == CircuitBreaker.OPEN
+            assert breaker.opened_count == 2
+
+            # Удачный пробный запрос замыкает предохранитель
+            await asyncio.sleep(0.25)
+            assert not breaker.is_open()
+            assert await service._request_with_retries(TEXT, "check_grammar", model_uri) == ("Привет мир", model_uri)
+            assert breaker.state == CircuitBreaker.CLOSED
+            assert stub.statuses == [500, 500, 500, 200]
+    run(scenario())
+
+def test_hedge_after_p95_cancels_slow_attempt(monkeypatch):
+    monkeypatch.setattr(llm_service, "LLM_HEDGE_REQUESTS", True)
+    monkeypatch.setattr(llm_service, "LLM_HEDGE_MIN_DELAY", 0.0)
+
+    async def scenario():
+        async with running_service([{"delay": 1.0}]) as (service, stub):
+            latency = service.router.get(service.model).latency
+            for _ in range(latency.min_samples):
+                latency.add(0.05)
+
+            attempt = service._attempt
+            cancelled = []
+
+            async def tracked_attempt(*args, **kwargs):
+                try:
+                    return await attempt(*args, **kwargs)
+                except asyncio.CancelledError:
+                    cancelled.append(args)
+                    raise
+            service._attempt = tracked_attempt
+
+            started = time.monotonic()
+            result, _ = await service._request_with_retries(TEXT, "check_grammar", service.get_model_uri())
+            assert result == "Привет мир"
+            assert time.monotonic() - started < 0.5
+            assert service.hedged_requests == 1
+            await asyncio.sleep(0)
+            assert len(cancelled) == 1
+    run(scenario())
+
+def test_no_hedge_without_latency_samples(monkeypatch):
+    monkeypatch.setattr(llm_service, "LLM_HEDGE_REQUESTS", True)
+    monkeypatch.setattr(llm_service, "LLM_HEDGE_MIN_DELAY", 0.0)
+
+    async def scenario():
+        async with running_service([{"delay": 0.2}]) as (service, stub):
+            await service._request_with_retries(TEXT, "check_grammar", service.get_model_uri())
+            assert service.hedged_requests == 0
+            assert stub.statuses == [200]
+    run(scenario())
+
+def test_fallback_answer_cached_under_answering_model():
+    async def scenario():
+        async with running_service() as (service, stub):
+            service.router.pro_model = "yandexgpt"
+            breaker = service.router.get(service.model).breaker
+            breaker.state, breaker.opened_at = CircuitBreaker.OPEN, time.monotonic()
+
+            routed_uri = service.get_model_uri()
+            assert await service._complete_cached(TEXT, "check_grammar", routed_uri) == "Привет мир"
+            assert service.router.fallbacks == 1
+            assert service.cache.get(service.get_cache_key(TEXT, "check_grammar", routed_uri)) is None
+            assert service.cache.get(
+                service.get_cache_key(TEXT, "check_grammar", service.get_model_uri("yandexgpt"))
+            ) == "Привет мир"
+    run(scenario())
@@ -0,0 +1,100 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from llm_scheduler import FairScheduler
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+def test_cancel_during_on_queued_releases_ticket():
+    async def scenario():
+        scheduler = FairScheduler(max_concurrency=1)
+        await scheduler.acquire("holder")
+        editing = asyncio.Event()
+
+        async def on_queued(position):
+            # Редактирование сообщения в Telegram, которое не успевает закончиться
+            editing.set()
+            await asyncio.sleep(3600)
+
+        waiter = asyncio.ensure_future(scheduler.acquire("user", on_queued))
+        await editing.wait()
+        waiter.cancel()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            pass
+
+        assert not scheduler._queues
+        scheduler.release()
+        assert scheduler._active == 0
+        assert not scheduler._queues
+    run(scenario())
+
+def test_cancel_after_slot_granted_returns_slot():
+    async def scenario():
+        scheduler = FairScheduler(max_concurrency=1)
+        await scheduler.acquire("holder")
+        waiter = asyncio.ensure_future(scheduler.acquire("user"))
+        await asyncio.sleep(0)
+
+        # Слот передан ожидающему, но тот отменен, не успев его забрать
+        scheduler.release()
+        waiter.cancel()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            pass
+
+        assert scheduler._active == 0
+        assert not scheduler._queues
+    run(scenario())
+
+def test_slow_on_queued_does_not_delay_slot():
+    async def scenario():
+        scheduler = FairScheduler(max_concurrency=1)
+        await scheduler.acquire("holder")
+        cancelled = asyncio.Event()
+
+        async def on_queued(position):
+            assert position == 1
+            try:
+                await asyncio.sleep(3600)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        waiter = asyncio.ensure_future(scheduler.acquire("user", on_queued))
+        await asyncio.sleep(0)
+        scheduler.release()
+        await asyncio.wait_for(waiter, 1)
+        await asyncio.wait_for(cancelled.wait(), 1)
+
+        assert scheduler._active == 1
+        scheduler.release()
+        assert scheduler._active == 0
+    run(scenario())
+
+def test_round_robin_between_users():
+    async def scenario():
+        scheduler = FairScheduler(max_concurrency=1)
+        await scheduler.acquire("holder")
+        order = []
+
+        async def request(user_id, name):
+            await scheduler.acquire(user_id)
+            order.append(name)
+            scheduler.release()
+
+        tasks = [asyncio.ensure_future(request(user_id, name))
+                 for user_id, name in (("a", "a1"), ("a", "a2"), ("a", "a3"), ("b", "b1"))]
+        await asyncio.sleep(0)
+        scheduler.release()
+        await asyncio.gather(*tasks)
+
+        assert order == ["a1", "b1", "a2", "a3"]
+        assert scheduler._active == 0
+    run(scenario())
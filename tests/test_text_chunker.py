@@ -0,0 +1,41 @@
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from text_chunker import join_chunks, split_into_chunks, split_sentences
+from text_normalizer import preserve_paragraphs
+
+# Слова, знаки конца предложения и разные пробельные символы
+ALPHABET = ["Привет", "мир", "нет", "a" * 30, ".", "?", "!", "…", " ", "  ", "\t", "\n", "\n\n", "\n    \n\n"]
+
+def random_text(rng: random.Random, max_tokens: int = 80) -> str:
+    return "".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, max_tokens)))
+
+def test_split_into_chunks_round_trip():
+    rng = random.Random(42)
+    for _ in range(3000):
+        text = preserve_paragraphs(random_text(rng, max_tokens=400))
+        chunks = split_into_chunks(text, max_tokens=100)
+        assert join_chunks([chunk for chunk, _ in chunks], chunks) == text
+
+def test_split_into_chunks_round_trip_unnormalized():
+    rng = random.Random(7)
+    for _ in range(3000):
+        text = random_text(rng)
+        chunks = split_into_chunks(text, max_tokens=rng.choice([5, 20, 100]))
+        assert join_chunks([chunk for chunk, _ in chunks], chunks) == text
+
+def test_split_into_chunks_keeps_trailing_whitespace_of_oversized_paragraph():
+    text = "Привет мир. " * 40 + "нет?\n    \n\nМир."
+    chunks = split_into_chunks(text, max_tokens=100)
+    assert join_chunks([chunk for chunk, _ in chunks], chunks) == text
+
+def test_split_sentences_round_trip():
+    rng = random.Random(13)
+    for text in ["\n\nПривет. Мир.", "\n\n", "", "  Привет.  Мир.\n"]:
+        assert "".join(sentence + separator for sentence, separator in split_sentences(text)) == text
+    for _ in range(3000):
+        text = random_text(rng)
+        assert "".join(sentence + separator for sentence, separator in split_sentences(text)) == text
@@ -0,0 +1,57 @@
+import random
+
+from text_diff import diff_opcodes, format_changes
+
+def lcs_length(a, b) -> int:
+    """Длина наибольшей общей подпоследовательности (динамическое программирование)"""
+    row = [0] * (len(b) + 1)
+    for x in a:
+        previous = 0
+        for j, y in enumerate(b):
+            current = row[j + 1]
+            row[j + 1] = previous + 1 if x == y else max(row[j + 1], row[j])
+            previous = current
+    return row[-1]
+
+def test_diff_opcodes_is_correct_and_minimal():
+    rng = random.Random(42)
+    for _ in range(20000):
+        a = [rng.choice("abc") for _ in range(rng.randint(0, 15))]
+        b = [rng.choice("abc") for _ in range(rng.randint(0, 15))]
+        i = j = 0
+        equal = 0
+        rebuilt = []
+        for tag, i1, i2, j1, j2 in diff_opcodes(a, b):
+            # Операции идут подряд и покрывают обе последовательности
+            assert (i1, j1) == (i, j)
+            i, j = i2, j2
+            if tag == "equal":
+                assert a[i1:i2] == b[j1:j2]
+                equal += i2 - i1
+            rebuilt += b[j1:j2]
+        assert (i, j) == (len(a), len(b))
+        assert rebuilt == b
+        # Совпадений столько же, сколько в наибольшей общей подпоследовательности
+        assert equal == lcs_length(a, b)
+
+def test_format_changes_trims_context_words():
+    original = "один два три четыре пять шесть семь восемь девять"
+    corrected = "один два три четыре ПЯТЬ шесть семь восемь девять"
+    assert format_changes(original, corrected, context_words=2) == (
+        "✏️ Исправлений: 1\n\n1. …три четыре пять шесть семь…\n→ …три четыре ПЯТЬ шесть семь…"
+    )
+
+def test_format_changes_splits_distant_changes():
+    original = "раз ошибка два три четыре пять шесть семь восемь девять десять ошибка"
+    corrected = "раз ОШИБКА два три четыре пять шесть семь восемь девять десять ОШИБКА"
+    assert format_changes(original, corrected, context_words=1) == (
+        "✏️ Исправлений: 2\n\n1. раз ошибка два…\n→ раз ОШИБКА два…\n\n2. …десять ошибка\n→ …десять ОШИБКА"
+    )
+
+def test_format_changes_without_changes():
+    expected = "✅ Ошибок не найдено, текст не изменился."
+    assert format_changes("один два три", "один два три") == expected
+    # Пробелы, переносы строк и выделения модели исправлениями не считаются
+    assert format_changes("один  два\nтри", "один два три") == expected
+    assert format_changes("один два три", "один **два** три") == expected
+    assert format_changes("", "") == expected
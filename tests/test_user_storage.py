@@ -0,0 +1,62 @@
+import os
+import sqlite3
+import time
+
+from user_storage import JsonUserStorage, SqliteUserStorage
+
+def stored_users(db_file: str) -> dict:
+    conn = sqlite3.connect(db_file)
+    try:
+        return dict(conn.execute("SELECT user_id, data FROM users"))
+    finally:
+        conn.close()
+
+def test_sqlite_save_user_is_written_behind(tmp_path):
+    db_file = str(tmp_path / "users.db")
+    storage = SqliteUserStorage(db_file, migrate_from="", flush_interval=60, flush_every=100)
+    storage.load_users()
+
+    storage.save_user("1", {"n": 1})
+    storage.save_user("1", {"n": 2})
+    # Запрос пользователя не пишет в базу, запись делает фоновый поток
+    assert stored_users(db_file) == {}
+
+    storage.close()
+    assert stored_users(db_file) == {"1": '{"n":2}'}
+
+    reopened = SqliteUserStorage(db_file, migrate_from="")
+    assert reopened.load_users() == {"1": {"n": 2}}
+    reopened.close()
+
+def test_sqlite_flushes_after_flush_every_changes(tmp_path):
+    db_file = str(tmp_path / "users.db")
+    storage = SqliteUserStorage(db_file, migrate_from="", flush_interval=60, flush_every=3)
+    storage.load_users()
+
+    for user_id in ("1", "2", "3"):
+        storage.save_user(user_id, {"id": user_id})
+    deadline = time.monotonic() + 2
+    while len(stored_users(db_file)) < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(stored_users(db_file)) == 3
+    storage.close()
+
+def test_sqlite_migrates_users_json(tmp_path):
+    json_file = tmp_path / "users.json"
+    json_file.write_text('{"7": {"name": "Анна"}}', encoding="utf-8")
+    storage = SqliteUserStorage(str(tmp_path / "users.db"), migrate_from=str(json_file))
+    assert storage.load_users() == {"7": {"name": "Анна"}}
+    assert not json_file.exists() and os.path.exists(f"{json_file}.migrated")
+    storage.close()
+
+def test_json_storage_writes_on_close(tmp_path):
+    data_file = str(tmp_path / "users.json")
+    storage = JsonUserStorage(data_file, flush_interval=60)
+    storage.load_users()
+    storage.save_user("1", {"n": 1})
+    assert not os.path.exists(data_file)
+    storage.close()
+
+    reopened = JsonUserStorage(data_file)
+    assert reopened.load_users() == {"1": {"n": 1}}
+    reopened.close()
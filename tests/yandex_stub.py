@@ -0,0 +1,47 @@
+"""Замена YandexGPT для тестов: ответы на completion задаются сценарием"""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, Iterable, List
+
+from aiohttp import web
+
+from fake_yandex import FakeYandex, start_server
+from llm_service import LLMService
+
+class ScriptedYandex(FakeYandex):
+    """
+    Отвечает на запросы completion по шагам сценария, затем сразу успешно
+
+    Шаг - словарь: {"status": 503, "headers": {...}} - ответ с ошибкой,
+    {"delay": 0.5} - успешный ответ через 0.5 с.
+    """
+
+    def __init__(self, script: Iterable[Dict] = ()):
+        super().__init__(latency=0)
+        self.script: List[Dict] = list(script)
+        self.statuses: List[int] = []
+
+    async def completion(self, request: web.Request) -> web.StreamResponse:
+        step = self.script.pop(0) if self.script else {}
+        if "status" in step:
+            self.requests += 1
+            self.errors += 1
+            self.statuses.append(step["status"])
+            return web.Response(status=step["status"], text="error", headers=step.get("headers"))
+        await asyncio.sleep(step.get("delay", 0))
+        self.statuses.append(200)
+        return await super().completion(request)
+
+@asynccontextmanager
+async def running_service(script: Iterable[Dict] = ()):
+    """LLMService, направленный на ScriptedYandex на свободном порту"""
+    stub = ScriptedYandex(script)
+    runner = await start_server(stub.make_app(), "127.0.0.1", 0)
+    port = runner.addresses[0][1]
+    service = LLMService()
+    service.base_url = f"http://127.0.0.1:{port}/foundationModels/v1/completion"
+    try:
+        yield service, stub
+    finally:
+        await service.close()
+        await runner.cleanup()
@@ -0,0 +1,117 @@
+import math
+import re
+from typing import Callable, List, Optional, Tuple
+
+# Начальная оценка: 1 символ ≈ 0.25 токена (TokenBudget уточняет ее по ответам модели)
+TOKENS_PER_CHAR = 0.25
+
+# Граница предложения: знак конца предложения и следующий за ним пробельный символ
+SENTENCE_BOUNDARY_RE = re.compile(r'(?<=[.!?…])(\s+)')
+WORD_BOUNDARY_RE = re.compile(r'(\s+)')
+
+def estimate_tokens(text: str) -> int:
+    """Грубо оценивает количество токенов в тексте"""
+    return math.ceil(len(text) * TOKENS_PER_CHAR)
+
+def _split_with_separators(text: str, pattern: re.Pattern) -> List[Tuple[str, str]]:
+    """Разбивает текст на куски, запоминая разделитель после каждого куска"""
+    parts = pattern.split(text)
+    pieces = []
+    leading = ""
+    for i in range(0, len(parts), 2):
+        separator = parts[i + 1] if i + 1 < len(parts) else ""
+        if parts[i]:
+            pieces.append((leading + parts[i], separator))
+            leading = ""
+        elif pieces:
+            # Пустой кусок между разделителями приклеиваем к предыдущему
+            pieces[-1] = (pieces[-1][0], pieces[-1][1] + separator)
+        else:
+            # Разделитель в начале текста остается в начале первого куска
+            leading += separator
+    if leading:
+        # Текст из одних разделителей
+        pieces.append(("", leading))
+    return pieces
+
+def _split_oversized(text: str, max_tokens: int, estimate: Callable[[str], int]) -> List[Tuple[str, str]]:
+    """Разбивает слишком длинный абзац по предложениям, затем по словам, затем по символам"""
+    for pattern in (SENTENCE_BOUNDARY_RE, WORD_BOUNDARY_RE):
+        pieces = _split_with_separators(text, pattern)
+        if len(pieces) > 1:
+            result = []
+            for piece, separator in pieces:
+                if estimate(piece) > max_tokens:
+                    sub_pieces = _split_oversized(piece, max_tokens, estimate)
+                    sub_pieces[-1] = (sub_pieces[-1][0], sub_pieces[-1][1] + separator)
+                    result.extend(sub_pieces)
+                else:
+                    result.append((piece, separator))
+            return result
+
+    # Одно очень длинное «слово» без пробелов - режем по символам с той же оценкой токенов на символ
+    max_chars = max(1, int(max_tokens * len(text) / max(1, estimate(text))))
+    return [(text[i:i + max_chars], "") for i in range(0, len(text), max_chars)]
+
+def split_into_chunks(text: str, max_tokens: int,
+                      estimate: Callable[[str], int] = estimate_tokens) -> List[Tuple[str, str]]:
+    """
+    Разбивает текст на части не больше max_tokens по границам абзацев и предложений
+
+    Args:
+        text: Текст после LLMService.preserve_paragraphs (абзацы разделены '\\n\\n')
+        max_tokens: Бюджет токенов на одну часть
+        estimate: Функция оценки количества токенов
+
+    Returns:
+        Список пар (часть, разделитель после нее); склейка всех пар дает исходный текст
+    """
+    # Сначала режем на абзацы, слишком длинные абзацы - на предложения
+    pieces: List[Tuple[str, str]] = []
+    for paragraph, separator in _split_with_separators(text, re.compile(r'(\n\n)')):
+        if estimate(paragraph) > max_tokens:
+            sub_pieces = _split_oversized(paragraph, max_tokens, estimate)
+            sub_pieces[-1] = (sub_pieces[-1][0], sub_pieces[-1][1] + separator)
+            pieces.extend(sub_pieces)
+        else:
+            pieces.append((paragraph, separator))
+
+    # Затем жадно упаковываем куски в части, укладываясь в бюджет
+    chunks: List[Tuple[str, str]] = []
+    current: Optional[str] = None
+    current_separator = ""
+    for piece, separator in pieces:
+        if current is None:
+            current = piece
+        else:
+            candidate = current + current_separator + piece
+            if estimate(candidate) > max_tokens:
+                chunks.append((current, current_separator))
+                current = piece
+            else:
+                current = candidate
+        current_separator = separator
+
+    if current is not None:
+        chunks.append((current, current_separator))
+
+    return chunks
+
+def join_chunks(results: List[str], chunks: List[Tuple[str, str]]) -> str:
+    """Собирает результаты обработки частей в исходном порядке с исходными разделителями"""
+    return "".join(result + separator for result, (_, separator) in zip(results, chunks))
+
+def split_sentences(text: str) -> List[Tuple[str, str]]:
+    """
+    Разбивает текст на предложения по абзацам и знакам конца предложения
+
+    Returns:
+        Список пар (предложение, разделитель после него); склейка всех пар дает исходный текст
+    """
+    sentences: List[Tuple[str, str]] = []
+    for line, line_separator in _split_with_separators(text, re.compile(r'(\n+)')):
+        # Пустая строка бывает только в тексте из одних переносов
+        pieces = _split_with_separators(line, SENTENCE_BOUNDARY_RE) or [("", "")]
+        pieces[-1] = (pieces[-1][0], pieces[-1][1] + line_separator)
+        sentences.extend(pieces)
+    return sentences
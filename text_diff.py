@@ -0,0 +1,175 @@
+import re
+from typing import List, Sequence, Tuple
+
+# Операция сравнения: (тип, начало и конец в исходном тексте, начало и конец в исправленном),
+# тип - 'equal', 'replace', 'delete' или 'insert', как в difflib
+Opcode = Tuple[str, int, int, int, int]
+
+# Слова, пробелы и отдельные знаки препинания
+TOKEN_RE = re.compile(r"\w+|\s+|[^\w\s]")
+WHITESPACE_RE = re.compile(r"\s+")
+
+# Выделения исправлений, которые модель добавляет в ответ на /check
+BOLD_RE = re.compile(r"\*\*(.+?)\*\*", re.DOTALL)
+ITALIC_RE = re.compile(r"\*([^*\n]+?)\*")
+
+def tokenize(text: str) -> List[str]:
+    """Разбивает текст на слова, пробелы и знаки препинания; склейка дает исходный текст"""
+    return TOKEN_RE.findall(text)
+
+def strip_highlights(text: str) -> str:
+    """Убирает Markdown-выделения исправлений из ответа модели"""
+    text = BOLD_RE.sub(r"\1", text)
+    return ITALIC_RE.sub(r"\1", text)
+
+def _middle_snake(a: Sequence, b: Sequence, alo: int, ahi: int, blo: int, bhi: int) -> Tuple[int, int, int, int]:
+    """
+    Находит среднюю «змейку» (участок совпадений) кратчайшего пути редактирования
+
+    Поиск идет одновременно от начала и от конца до встречи, поэтому требует
+    O(N + M) памяти. Координаты возвращаются относительно alo и blo.
+    """
+    n, m = ahi - alo, bhi - blo
+    delta = n - m
+    odd = delta % 2 != 0
+    max_d = (n + m + 1) // 2
+    offset = max_d + 1
+    forward = [0] * (2 * max_d + 3)
+    backward = [0] * (2 * max_d + 3)
+
+    for d in range(max_d + 1):
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and forward[offset + k - 1] < forward[offset + k + 1]):
+                x = forward[offset + k + 1]
+            else:
+                x = forward[offset + k - 1] + 1
+            y = x - k
+            start_x, start_y = x, y
+            while x < n and y < m and a[alo + x] == b[blo + y]:
+                x += 1
+                y += 1
+            forward[offset + k] = x
+            if odd and delta - (d - 1) <= k <= delta + (d - 1) and x + backward[offset + delta - k] >= n:
+                return start_x, start_y, x, y
+
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and backward[offset + k - 1] < backward[offset + k + 1]):
+                x = backward[offset + k + 1]
+            else:
+                x = backward[offset + k - 1] + 1
+            y = x - k
+            start_x, start_y = x, y
+            while x < n and y < m and a[ahi - 1 - x] == b[bhi - 1 - y]:
+                x += 1
+                y += 1
+            backward[offset + k] = x
+            if not odd and -d <= delta - k <= d and x + forward[offset + delta - k] >= n:
+                return n - x, m - y, n - start_x, m - start_y
+
+    raise AssertionError("средняя змейка не найдена")
+
+def _collect_matches(a: Sequence, b: Sequence, alo: int, ahi: int, blo: int, bhi: int,
+                     matches: List[Tuple[int, int]]):
+    """Добавляет в matches пары совпадающих позиций (i, j) в порядке возрастания"""
+    # Общие начало и конец не участвуют в поиске
+    while alo < ahi and blo < bhi and a[alo] == b[blo]:
+        matches.append((alo, blo))
+        alo += 1
+        blo += 1
+    suffix = 0
+    while alo < ahi - suffix and blo < bhi - suffix and a[ahi - 1 - suffix] == b[bhi - 1 - suffix]:
+        suffix += 1
+    ahi -= suffix
+    bhi -= suffix
+
+    if alo < ahi and blo < bhi:
+        x, y, u, v = _middle_snake(a, b, alo, ahi, blo, bhi)
+        _collect_matches(a, b, alo, alo + x, blo, blo + y, matches)
+        matches.extend((alo + i, blo + i - x + y) for i in range(x, u))
+        _collect_matches(a, b, alo + u, ahi, blo + v, bhi, matches)
+
+    matches.extend((ahi + i, bhi + i) for i in range(suffix))
+
+def diff_opcodes(a: Sequence, b: Sequence) -> List[Opcode]:
+    """
+    Кратчайшая последовательность правок между a и b (алгоритм Майерса
+    в линейной памяти) в виде операций в стиле difflib.SequenceMatcher.get_opcodes
+    """
+    matches: List[Tuple[int, int]] = []
+    _collect_matches(a, b, 0, len(a), 0, len(b), matches)
+    matches.append((len(a), len(b)))
+
+    opcodes: List[Opcode] = []
+    i = j = 0
+    for mi, mj in matches:
+        if i < mi or j < mj:
+            tag = "replace" if i < mi and j < mj else "delete" if i < mi else "insert"
+            opcodes.append((tag, i, mi, j, mj))
+        if mi < len(a):
+            if opcodes and opcodes[-1][0] == "equal":
+                _, ei, _, ej, _ = opcodes[-1]
+                opcodes[-1] = ("equal", ei, mi + 1, ej, mj + 1)
+            else:
+                opcodes.append(("equal", mi, mi + 1, mj, mj + 1))
+        i, j = mi + 1, mj + 1
+    return opcodes
+
+def group_changes(opcodes: List[Opcode], context: int) -> List[List[Opcode]]:
+    """Группирует правки вместе с context токенами вокруг них; близкие правки попадают в одну группу"""
+    groups: List[List[Opcode]] = []
+    group: List[Opcode] = []
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag != "equal":
+            group.append((tag, i1, i2, j1, j2))
+            continue
+        if not group:
+            # Контекст перед первой правкой
+            group.append((tag, max(i1, i2 - context), i2, max(j1, j2 - context), j2))
+        elif i2 - i1 > 2 * context:
+            group.append((tag, i1, i1 + context, j1, j1 + context))
+            groups.append(group)
+            group = [(tag, i2 - context, i2, j2 - context, j2)]
+        else:
+            group.append((tag, i1, i2, j1, j2))
+
+    if any(tag != "equal" for tag, *_ in group):
+        if group[-1][0] == "equal":
+            tag, i1, i2, j1, j2 = group[-1]
+            group[-1] = (tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context))
+        groups.append(group)
+    return groups
+
+def _fragment(tokens: List[str], start: int, end: int, total: int) -> str:
+    text = WHITESPACE_RE.sub(" ", "".join(tokens[start:end])).strip()
+    return ("…" if start > 0 else "") + text + ("…" if end < total else "")
+
+def format_changes(original: str, corrected: str, context_words: int = 3) -> str:
+    """
+    Ответ в режиме «только исправления»: измененные фрагменты с несколькими
+    словами контекста вместо всего исправленного текста
+
+    Args:
+        original: Текст, отправленный на проверку
+        corrected: Ответ модели (выделения исправлений не учитываются)
+        context_words: Сколько слов контекста показывать с каждой стороны
+    """
+    a = tokenize(original)
+    b = tokenize(strip_highlights(corrected))
+    # Различия в ширине пробелов и переносах строк не показываем
+    a_keys = [" " if token.isspace() else token for token in a]
+    b_keys = [" " if token.isspace() else token for token in b]
+
+    # Слово и пробел после него - два токена
+    groups = group_changes(diff_opcodes(a_keys, b_keys), 2 * context_words)
+    if not groups:
+        return "✅ Ошибок не найдено, текст не изменился."
+
+    lines = [f"✏️ Исправлений: {len(groups)}"]
+    for number, group in enumerate(groups, 1):
+        i1, j1 = group[0][1], group[0][3]
+        i2, j2 = group[-1][2], group[-1][4]
+        lines.append(
+            f"\n{number}. {_fragment(a, i1, i2, len(a)) or '∅'}\n"
+            f"→ {_fragment(b, j1, j2, len(b)) or '∅'}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,73 @@
+import re
+
+# Шаблоны компилируются один раз при импорте. Каждый шаг сначала проверяет
+# (поиском подстроки в C), есть ли в тексте что заменять: для большинства
+# текстов проход регулярным выражением не нужен вовсе
+
+# Одиночный дефис между пробелами или знаками препинания. Шаблон начинается
+# с литерала, поэтому движок ищет дефисы быстрым поиском, а не проверяет
+# условие (?<!\w) в каждой позиции текста
+HYPHEN_RE = re.compile(r'-(?<!\w-)(?!\w)')
+PARAGRAPH_GAP_RE = re.compile(r'\n{3,}')
+
+# Markdown, который убирается перед отправкой текста в модель (в порядке применения)
+BOLD_RE = re.compile(r'\*\*(.*?)\*\*')
+ITALIC_RE = re.compile(r'\*(.*?)\*')
+CODE_RE = re.compile(r'`(.*?)`')
+CODE_BLOCK_RE = re.compile(r'```(.*?)```', re.DOTALL)
+LINK_RE = re.compile(r'\[([^\]]+)\]\([^)]+\)')
+
+def fix_dashes(text: str) -> str:
+    """Заменяет длинные тире (—) и одиночные дефисы между словами на средние тире (–)"""
+    if '—' in text:
+        text = text.replace('—', '–')
+    if '-' in text:
+        text = HYPHEN_RE.sub('–', text)
+    return text
+
+def preserve_paragraphs(text: str) -> str:
+    """Приводит переносы строк к \\n, обрезает пробелы по краям и оставляет между абзацами не больше одной пустой строки"""
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    text = text.strip()
+    if '\n\n\n' in text:
+        text = PARAGRAPH_GAP_RE.sub('\n\n', text)
+    return text
+
+def remove_paragraph_dots(text: str) -> str:
+    """Убирает точки в конце абзацев (параметр nodot)"""
+    if '.' not in text:
+        return text
+    # Строки из одних пробелов rstrip('.') не меняет, отдельная проверка на пустой абзац не нужна.
+    # Разбиение на строки быстрее шаблона \.+$: тот проверяет конец строки после каждой точки
+    return '\n'.join([paragraph.rstrip('.') for paragraph in text.split('\n')])
+
+def normalize(text: str, dashes: bool = False, paragraphs: bool = False, nodot: bool = False) -> str:
+    """
+    Нормализация текста выбранными шагами в фиксированном порядке:
+    тире, абзацы, точки в конце абзацев
+
+    normalize(text, dashes=True, paragraphs=True) дает то же, что
+    preserve_paragraphs(fix_dashes(text)).
+    """
+    if dashes:
+        text = fix_dashes(text)
+    if paragraphs:
+        text = preserve_paragraphs(text)
+    if nodot:
+        text = remove_paragraph_dots(text)
+    return text
+
+def clean_formatting(text: str) -> str:
+    """Убирает Markdown-форматирование (жирный, курсив, код, ссылки) перед отправкой текста в модель"""
+    if '*' in text:
+        if '**' in text:
+            text = BOLD_RE.sub(r'\1', text)
+        text = ITALIC_RE.sub(r'\1', text)
+    if '`' in text:
+        text = CODE_RE.sub(r'\1', text)
+        if '```' in text:
+            text = CODE_BLOCK_RE.sub(r'\1', text)
+    if '](' in text:
+        text = LINK_RE.sub(r'\1', text)
+    return text.strip()
@@ -0,0 +1,208 @@
+import asyncio
+import hashlib
+import json
+import math
+import os
+import time
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+from text_chunker import TOKENS_PER_CHAR
+
+logger = logging.getLogger(__name__)
+
+# Подсчет токенов через API: (текст, URI модели) -> количество токенов
+Tokenizer = Callable[[str, Optional[str]], Awaitable[int]]
+
+# Во сколько раз ответ длиннее исходного текста (в токенах) до накопления статистики.
+# Проверка добавляет Markdown-выделения, перевод на узбекский и армянский заметно длиннее
+DEFAULT_EXPANSION = {
+    "check_grammar": 1.3,
+    "improve_text": 1.4,
+    "shorten_text": 0.8,
+    "translate": 1.8,
+}
+
+class TokenBudget:
+    """
+    Учет токенов: размер maxTokens и частей длинного текста по реальному числу токенов
+
+    Токены считаются локальной оценкой по числу символов. Через tokenizer (эндпоинт
+    токенизации YandexGPT, с кэшем результатов) - только если по оценке запрос
+    занимает больше exact_fraction контекста модели и ошибка оценки может привести
+    к обрезанному ответу или превышению контекста. Оценка
+    и ожидаемое отношение длины ответа к длине текста для каждой задачи уточняются
+    по полю usage каждого ответа модели (экспоненциальное скользящее среднее).
+    """
+
+    def __init__(self, tokenizer: Optional[Tokenizer] = None, context_tokens: int = 8000,
+                 min_output_tokens: int = 100, max_output_tokens: int = 8000, margin: float = 1.25,
+                 persist_file: Optional[str] = None, cache_size: int = 1000, smoothing: float = 0.1,
+                 exact_fraction: float = 0.8):
+        self.tokenizer = tokenizer
+        self.exact_fraction = exact_fraction
+        self.context_tokens = context_tokens
+        self.min_output_tokens = min_output_tokens
+        self.max_output_tokens = max_output_tokens
+        self.margin = margin
+        self.persist_file = persist_file or None
+        self.cache_size = cache_size
+        self.smoothing = smoothing
+
+        self.tokens_per_char = TOKENS_PER_CHAR
+        self.expansion: Dict[str, float] = {}
+        self._counts: "OrderedDict[str, int]" = OrderedDict()
+
+        # Если токенизатор не ответил, какое-то время обходимся локальной оценкой
+        self.tokenizer_retry_after = 60.0
+        self._tokenizer_failed_at = 0.0
+
+        # Метрики
+        self.tokenizer_calls = 0
+        self.tokenizer_errors = 0
+        self.recorded = 0
+        self.truncated = 0
+
+        if self.persist_file:
+            self.load()
+
+    def estimate(self, text: str) -> int:
+        """Быстрая локальная оценка числа токенов (для разбиения длинного текста)"""
+        return self.estimate_chars(len(text))
+
+    async def count_tokens(self, text: str, model_uri: Optional[str] = None) -> int:
+        """Число токенов текста для модели: через токенизатор с кэшем или локальной оценкой"""
+        key = hashlib.sha256(f"{model_uri}\x00{text}".encode('utf-8')).hexdigest()
+        count = self._counts.get(key)
+        if count is not None:
+            self._counts.move_to_end(key)
+            return count
+
+        if self.tokenizer is None or time.monotonic() - self._tokenizer_failed_at < self.tokenizer_retry_after:
+            return self.estimate(text)
+
+        try:
+            self.tokenizer_calls += 1
+            count = await self.tokenizer(text, model_uri)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.tokenizer_errors += 1
+            self._tokenizer_failed_at = time.monotonic()
+            logger.warning(f"Токенизатор недоступен, используем локальную оценку: {e}")
+            return self.estimate(text)
+
+        # Точный подсчет заодно уточняет локальную оценку
+        if text:
+            self._update_tokens_per_char(count / len(text))
+        self._counts[key] = count
+        while len(self._counts) > self.cache_size:
+            self._counts.popitem(last=False)
+        return count
+
+    def get_expansion(self, task_type: str) -> float:
+        """Ожидаемое отношение токенов ответа к токенам текста для задачи"""
+        if task_type in self.expansion:
+            return self.expansion[task_type]
+        if task_type.startswith("translate"):
+            return DEFAULT_EXPANSION["translate"]
+        return DEFAULT_EXPANSION.get(task_type, 1.5)
+
+    async def plan(self, text: str, task_type: str, system_prompt: str, model_uri: Optional[str] = None) -> int:
+        """
+        Рассчитывает maxTokens для запроса к модели model_uri
+
+        Запас на ответ - токены текста, умноженные на ожидаемое расширение задачи
+        и коэффициент запаса, но не больше, чем остается в контексте модели
+        после системного промпта и текста.
+        """
+        prompt_tokens, text_tokens = self.estimate(system_prompt), self.estimate(text)
+        if self.tokenizer is not None and self._plan_tokens(prompt_tokens, text_tokens, task_type) > \
+                self.exact_fraction * self.context_tokens:
+            # Запрос близок к размеру контекста - считаем точно
+            prompt_tokens, text_tokens = await asyncio.gather(
+                self.count_tokens(system_prompt, model_uri), self.count_tokens(text, model_uri)
+            )
+        max_tokens = math.ceil(text_tokens * self.get_expansion(task_type) * self.margin) + self.min_output_tokens
+        max_tokens = min(max_tokens, self.max_output_tokens, self.context_tokens - prompt_tokens - text_tokens)
+        return max(self.min_output_tokens, max_tokens)
+
+    def _plan_tokens(self, prompt_tokens: int, text_tokens: int, task_type: str) -> int:
+        """Сколько токенов контекста займет запрос вместе с желаемым запасом на ответ"""
+        wanted = math.ceil(text_tokens * self.get_expansion(task_type) * self.margin) + self.min_output_tokens
+        return prompt_tokens + text_tokens + min(wanted, self.max_output_tokens)
+
+    def record(self, task_type: str, prompt_chars: int, text_chars: int, usage: Optional[Dict],
+               truncated: bool = False):
+        """
+        Учитывает фактический расход токенов из ответа модели
+
+        Args:
+            prompt_chars: Длина всего запроса (системный промпт + сообщение) в символах
+            text_chars: Длина обрабатываемого текста в символах
+            usage: Поле usage ответа (inputTextTokens, completionTokens)
+            truncated: Ответ обрезан по maxTokens
+        """
+        if not usage or prompt_chars <= 0 or text_chars <= 0:
+            return
+        try:
+            input_tokens = int(usage.get("inputTextTokens", 0))
+            completion_tokens = int(usage.get("completionTokens", 0))
+        except (TypeError, ValueError):
+            return
+        if input_tokens <= 0:
+            return
+
+        self.recorded += 1
+        self._update_tokens_per_char(input_tokens / prompt_chars)
+
+        ratio = completion_tokens / max(1, self.estimate_chars(text_chars))
+        if truncated:
+            # Настоящая длина ответа неизвестна - заметно увеличиваем запас
+            self.truncated += 1
+            ratio = max(ratio, self.get_expansion(task_type)) * 1.5
+            logger.warning(f"Ответ для задачи {task_type} обрезан по maxTokens, увеличиваем запас")
+        current = self.get_expansion(task_type)
+        self.expansion[task_type] = current + self.smoothing * (ratio - current)
+
+    def estimate_chars(self, chars: int) -> int:
+        """Локальная оценка числа токенов по длине в символах"""
+        return math.ceil(chars * self.tokens_per_char)
+
+    def _update_tokens_per_char(self, value: float):
+        self.tokens_per_char += self.smoothing * (value - self.tokens_per_char)
+
+    def load(self):
+        """Загружает накопленную статистику с диска"""
+        if not self.persist_file or not os.path.exists(self.persist_file):
+            return
+        try:
+            with open(self.persist_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.tokens_per_char = float(data.get("tokens_per_char", self.tokens_per_char))
+            self.expansion = {task: float(ratio) for task, ratio in data.get("expansion", {}).items()}
+        except Exception as e:
+            logger.error(f"Ошибка загрузки статистики токенов: {e}")
+
+    def save(self):
+        """Сохраняет накопленную статистику (через временный файл, чтобы не повредить старую копию)"""
+        if not self.persist_file:
+            return
+
+        tmp_file = f"{self.persist_file}.tmp"
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump({"tokens_per_char": self.tokens_per_char, "expansion": self.expansion}, f)
+            os.replace(tmp_file, self.persist_file)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения статистики токенов: {e}")
+
+    def get_stats(self) -> Dict:
+        return {
+            "tokens_per_char": round(self.tokens_per_char, 4),
+            "expansion": {task: round(ratio, 3) for task, ratio in self.expansion.items()},
+            "tokenizer_calls": self.tokenizer_calls,
+            "tokenizer_errors": self.tokenizer_errors,
+            "recorded": self.recorded,
+            "truncated": self.truncated,
+        }
@@ -0,0 +1,328 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime
+from functools import wraps
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Трасса текущего обновления и открытый в ней участок; задачи asyncio наследуют
+# контекст, поэтому участки из параллельных частей текста попадают в ту же трассу
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[int] = ContextVar("current_span", default=-1)
+
+class Trace:
+    """Трасса одного обновления: участки с началом и длительностью относительно начала трассы"""
+
+    def __init__(self, name: str, attrs: Dict, max_spans: int):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = attrs
+        self.started_at = datetime.now()
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self.error: Optional[str] = None
+        self.max_spans = max_spans
+        self.dropped_spans = 0
+        # [имя, родитель, начало, длительность, атрибуты, ошибка]
+        self.spans: List[list] = []
+        # Свернутые стеки профилировщика -> число снимков
+        self.profile: Counter = Counter()
+
+    def open_span(self, name: str, attrs: Dict) -> int:
+        if len(self.spans) >= self.max_spans:
+            self.dropped_spans += 1
+            return -1
+        self.spans.append([name, _current_span.get(), time.perf_counter() - self.started, None, attrs, None])
+        return len(self.spans) - 1
+
+    def close_span(self, index: int, error: Optional[BaseException]):
+        span = self.spans[index]
+        span[3] = time.perf_counter() - self.started - span[2]
+        if error is not None:
+            span[5] = type(error).__name__
+
+    def to_dict(self, profile_top: int = 50) -> Dict:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.started_at.isoformat(timespec="milliseconds"),
+            "duration": round(self.duration, 6),
+            "error": self.error,
+            "attrs": self.attrs,
+            "spans": [
+                {
+                    "name": name,
+                    "parent": parent,
+                    "start": round(start, 6),
+                    # Участок, не закрытый к концу трассы (например, фоновая задача), длится до ее конца
+                    "duration": round(self.duration - start if duration is None else duration, 6),
+                    "attrs": attrs,
+                    "error": error,
+                }
+                for name, parent, start, duration, attrs, error in self.spans
+            ],
+            "dropped_spans": self.dropped_spans,
+            "profile": [
+                {"stack": stack, "samples": samples}
+                for stack, samples in self.profile.most_common(profile_top)
+            ],
+        }
+
+class Span:
+    """
+    Участок трассы: контекстный менеджер или декоратор функции (обычной и корутины)
+
+    Вне трассируемого обновления стоит одного чтения ContextVar.
+    """
+
+    __slots__ = ("name", "attrs", "_trace", "_index", "_token")
+
+    def __init__(self, name: str, **attrs):
+        self.name = name
+        self.attrs = attrs
+        self._trace: Optional[Trace] = None
+
+    def __enter__(self):
+        trace = _current_trace.get()
+        if trace is not None:
+            index = trace.open_span(self.name, self.attrs)
+            if index >= 0:
+                self._trace = trace
+                self._index = index
+                self._token = _current_span.set(index)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._trace is not None:
+            _current_span.reset(self._token)
+            self._trace.close_span(self._index, exc)
+            self._trace = None
+        return False
+
+    def __call__(self, function):
+        name, attrs = self.name, self.attrs
+        if asyncio.iscoroutinefunction(function):
+            @wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                if _current_trace.get() is None:
+                    return await function(*args, **kwargs)
+                with Span(name, **attrs):
+                    return await function(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if _current_trace.get() is None:
+                return function(*args, **kwargs)
+            with Span(name, **attrs):
+                return function(*args, **kwargs)
+        return wrapper
+
+def span(name: str, **attrs) -> Span:
+    """Участок текущей трассы: with span("llm_request", model=model): ..."""
+    return Span(name, **attrs)
+
+def traced(name: str):
+    """Декоратор: каждый вызов функции - участок текущей трассы"""
+    return Span(name)
+
+class SamplingProfiler:
+    """
+    Статистический профилировщик для трассируемых обновлений
+
+    Пока есть хотя бы одна профилируемая трасса, фоновый поток раз в interval
+    секунд снимает стек потока цикла событий и добавляет его ко всем активным
+    трассам. Цикл событий один на все обновления, поэтому при параллельных
+    запросах снимок попадает в каждую активную трассу: по нему видно, чем был
+    занят поток (регулярные выражения, запись на диск), пока запрос ждал.
+    Снимки в selectors.select означают, что поток простаивал в ожидании ввода-вывода.
+    """
+
+    def __init__(self, interval: float = 0.005, max_depth: int = 64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = 0
+        self._traces = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_id: Optional[int] = None
+
+    def attach(self, trace: Trace):
+        with self._lock:
+            self._traces.add(trace)
+            if self._thread is None:
+                self._thread_id = threading.get_ident()
+                self._thread = threading.Thread(target=self._run, name="trace-profiler", daemon=True)
+                self._thread.start()
+
+    def detach(self, trace: Trace):
+        # После detach поток больше не меняет профиль трассы
+        with self._lock:
+            self._traces.discard(trace)
+
+    def _fold(self, frame) -> str:
+        stack = []
+        while frame is not None and len(stack) < self.max_depth:
+            code = frame.f_code
+            stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        return ";".join(reversed(stack))
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            frame = sys._current_frames().get(self._thread_id)
+            stack = self._fold(frame) if frame is not None else None
+            with self._lock:
+                if not self._traces:
+                    self._thread = None
+                    return
+                if stack:
+                    self.samples += 1
+                    for trace in self._traces:
+                        trace.profile[stack] += 1
+
+class _NoTrace:
+    """Заглушка для обновлений, не попавших в выборку"""
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NO_TRACE = _NoTrace()
+
+class _ActiveTrace:
+    def __init__(self, tracer: "Tracer", trace: Trace):
+        self.tracer = tracer
+        self.trace = trace
+
+    def __enter__(self) -> Trace:
+        self._token = _current_trace.set(self.trace)
+        self._span_token = _current_span.set(-1)
+        if self.tracer.profiler:
+            self.tracer.profiler.attach(self.trace)
+        return self.trace
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.tracer.profiler:
+            self.tracer.profiler.detach(self.trace)
+        _current_span.reset(self._span_token)
+        _current_trace.reset(self._token)
+        if exc is not None:
+            self.trace.error = type(exc).__name__
+        self.tracer.finish(self.trace)
+        return False
+
+class Tracer:
+    """
+    Трассировка обновлений по выборке
+
+    Доля sample_rate обновлений получает трассу: участки (span) от получения
+    обновления до отправки ответа. Трассы дольше slow_threshold секунд
+    дописываются в export_file (JSONL) для разбора; с profile=True к трассам
+    добавляются стеки статистического профилировщика.
+    """
+
+    def __init__(self, sample_rate: float = 0.0, slow_threshold: float = 5.0,
+                 export_file: str = "slow_traces.jsonl", profile: bool = False,
+                 profile_interval: float = 0.005, max_spans: int = 1000):
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.export_file = export_file
+        self.max_spans = max_spans
+        self.profiler = SamplingProfiler(profile_interval) if profile and sample_rate > 0 else None
+        self._write_lock = threading.Lock()
+
+        self.traces = 0
+        self.sampled = 0
+        self.slow = 0
+        self.export_errors = 0
+
+    def trace(self, name: str, **attrs):
+        """Контекстный менеджер трассы обновления; вне выборки ничего не записывает"""
+        self.traces += 1
+        if self.sample_rate <= 0 or (self.sample_rate < 1 and random.random() >= self.sample_rate):
+            return _NO_TRACE
+        if _current_trace.get() is not None:
+            # Вложенный обработчик остается частью внешней трассы
+            return span(name, **attrs)
+        self.sampled += 1
+        return _ActiveTrace(self, Trace(name, attrs, self.max_spans))
+
+    def finish(self, trace: Trace):
+        trace.duration = time.perf_counter() - trace.started
+        if trace.duration < self.slow_threshold or not self.export_file:
+            return
+        self.slow += 1
+        line = json.dumps(trace.to_dict(), ensure_ascii=False) + "\n"
+        try:
+            # Запись на диск не задерживает цикл событий
+            asyncio.get_running_loop().run_in_executor(None, self._write, line)
+        except RuntimeError:
+            self._write(line)
+
+    def _write(self, line: str):
+        try:
+            with self._write_lock, open(self.export_file, "a", encoding="utf-8") as f:
+                f.write(line)
+        except OSError as e:
+            self.export_errors += 1
+            logger.error(f"Не удалось записать трассу в {self.export_file}: {e}")
+
+    def get_stats(self) -> Dict:
+        """Возвращает счетчики трассировки"""
+        return {
+            "traces": self.traces,
+            "sampled": self.sampled,
+            "slow": self.slow,
+            "export_errors": self.export_errors,
+            "profile_samples": self.profiler.samples if self.profiler else 0,
+        }
+
+def summarize(path: str, top: int = 20) -> str:
+    """Сводка по файлу медленных трасс: суммарное и среднее время участков, частые стеки профилировщика"""
+    totals: Dict[str, List[float]] = {}
+    stacks: Counter = Counter()
+    count = 0
+    duration = 0.0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            trace = json.loads(line)
+            count += 1
+            duration += trace["duration"]
+            for item in trace["spans"]:
+                totals.setdefault(item["name"], []).append(item["duration"])
+            for item in trace.get("profile", []):
+                stacks[item["stack"]] += item["samples"]
+
+    if not count:
+        return "Трасс нет"
+    lines = [f"Трасс: {count}, среднее время: {duration / count:.3f} с", "", f"{'Участок':<32} {'Вызовов':>8} {'Всего, с':>10} {'Среднее, с':>11}"]
+    for name, values in sorted(totals.items(), key=lambda item: -sum(item[1]))[:top]:
+        lines.append(f"{name:<32} {len(values):>8} {sum(values):>10.3f} {sum(values) / len(values):>11.4f}")
+    if stacks:
+        lines.append("")
+        lines.append("Частые стеки (последние вызовы):")
+        for stack, samples in stacks.most_common(top):
+            lines.append(f"{samples:>6}  {';'.join(stack.split(';')[-4:])}")
+    return "\n".join(lines)
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Использование: python tracing.py slow_traces.jsonl [число строк]")
+        sys.exit(1)
+    print(summarize(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 20))
@@ -0,0 +1,77 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Dict, Optional
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Параллельная обработка обновлений с сохранением порядка для каждого пользователя
+
+    Обновления разных пользователей обрабатываются одновременно (не больше
+    max_concurrent_updates за раз), а обновления одного пользователя - строго
+    по очереди, чтобы переходы в TextBot.user_states не перемешивались.
+    """
+
+    def __init__(self, max_concurrent_updates: int, max_pending_updates: Optional[int] = None):
+        # Семафор базового класса ограничивает число принятых обновлений, включая
+        # ожидающие своей очереди у пользователя. Поэтому он шире, чем лимит
+        # одновременно выполняемых обработчиков, иначе один активный пользователь
+        # мог бы занять все слоты ожиданием собственной блокировки
+        if max_pending_updates is None:
+            max_pending_updates = max_concurrent_updates * 8
+        super().__init__(max(max_pending_updates, max_concurrent_updates))
+        self.max_running_updates = max_concurrent_updates
+        self._running = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._user_locks: Dict[int, asyncio.Lock] = {}
+        self._user_waiters: Dict[int, int] = {}
+
+    @staticmethod
+    def get_update_key(update: object) -> Optional[int]:
+        """Определяет ключ сериализации: id пользователя, иначе id чата"""
+        if isinstance(update, Update):
+            if update.effective_user:
+                return update.effective_user.id
+            if update.effective_chat:
+                return update.effective_chat.id
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        """Выполняет обработчик после предыдущих обновлений того же пользователя"""
+        key = self.get_update_key(update)
+        if key is None:
+            async with self._running:
+                await coroutine
+            return
+
+        lock = self._user_locks.get(key)
+        if lock is None:
+            lock = self._user_locks[key] = asyncio.Lock()
+        self._user_waiters[key] = self._user_waiters.get(key, 0) + 1
+
+        try:
+            async with lock:
+                async with self._running:
+                    await coroutine
+        finally:
+            # Удаляем блокировку, когда у пользователя не осталось обновлений в очереди
+            self._user_waiters[key] -= 1
+            if self._user_waiters[key] == 0:
+                del self._user_waiters[key]
+                del self._user_locks[key]
+
+    async def initialize(self) -> None:
+        """Ничего не требуется"""
+
+    async def shutdown(self) -> None:
+        """Ничего не требуется"""
+
+    def get_stats(self) -> Dict:
+        """Возвращает текущую загрузку обработчика обновлений"""
+        return {
+            "users_in_progress": len(self._user_locks),
+            "updates_pending": sum(self._user_waiters.values()),
+            "max_running_updates": self.max_running_updates
+        }
@@ -0,0 +1,152 @@
+import heapq
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+from user_record import DAY_SECONDS, WEEK_SECONDS, UserRecord
+
+# Сколько пользователей показывать в рейтинге /stats
+TOP_USERS_LIMIT = 5
+
+class UserAggregates:
+    """
+    Общая статистика по всем пользователям, обновляемая инкрементально
+
+    Запрос за сегодня или за 7 дней учитывается, пока он хранится в истории
+    пользователя - так же, как при суммировании счетчиков пользователей.
+    Поэтому, кроме новых запросов, учитываются и запросы, вытесненные из истории.
+    Рейтинг топ-k хранится отсортированным: total только растет, поэтому
+    пользователь может войти в рейтинг, лишь обогнав последнего в нем.
+    """
+
+    def __init__(self, top_limit: int = TOP_USERS_LIMIT):
+        self.top_limit = top_limit
+        self.total_requests = 0
+
+        # Запросы сегодняшнего дня, еще хранящиеся в истории пользователей
+        self._day = 0
+        self._today = 0
+
+        # Время всех запросов в окне 7 дней (по возрастанию) и время вытесненных
+        # из истории запросов, которые еще попадают в окно
+        self._recent: Deque[int] = deque()
+        self._evicted: List[int] = []
+        self._last_now = 0
+
+        # Порядок добавления пользователей: при равном числе запросов выше тот, кто раньше
+        self._order: Dict[str, int] = {}
+        self._top: List[str] = []
+
+    def rebuild(self, users: Dict[str, UserRecord], now: int):
+        """Пересчитывает все агрегаты по данным пользователей"""
+        self.total_requests = sum(user.total for user in users.values())
+
+        timestamps = sorted(
+            seconds
+            for user in users.values()
+            for seconds, _ in user.history.items()
+            if now - seconds <= WEEK_SECONDS
+        )
+        self._recent = deque(timestamps)
+        self._evicted = []
+        self._day = now // DAY_SECONDS
+        self._today = sum(1 for seconds in timestamps if seconds // DAY_SECONDS == self._day)
+        self._last_now = now
+
+        self._order = {user_id_str: i for i, user_id_str in enumerate(users)}
+        self._top = sorted(users, key=lambda user_id_str: self._rank(users, user_id_str))[:self.top_limit]
+
+    def _rank(self, users: Dict[str, UserRecord], user_id_str: str) -> Tuple[int, int]:
+        return -users[user_id_str].total, self._order[user_id_str]
+
+    def add_user(self, users: Dict[str, UserRecord], user_id_str: str):
+        """Учитывает нового пользователя"""
+        self._order[user_id_str] = len(self._order)
+        if len(self._top) < self.top_limit:
+            # Новый пользователь без запросов - последний среди равных
+            self._top.append(user_id_str)
+
+    def add_request(self, users: Dict[str, UserRecord], user_id_str: str, now: int, evicted: Optional[int]):
+        """Учитывает новый запрос пользователя (evicted - время вытесненного из истории запроса)"""
+        self.total_requests += 1
+
+        if now < self._last_now:
+            # Часы перевели назад - надежнее пересчитать все заново
+            self.rebuild(users, now)
+        else:
+            self._advance(now)
+            self._recent.append(now)
+            self._today += 1
+            if evicted is not None:
+                if evicted // DAY_SECONDS == self._day:
+                    self._today -= 1
+                if now - evicted <= WEEK_SECONDS:
+                    heapq.heappush(self._evicted, evicted)
+
+        self._update_top(users, user_id_str)
+
+    def _advance(self, now: int):
+        """Сдвигает окна дня и недели к моменту now"""
+        self._last_now = now
+
+        day = now // DAY_SECONDS
+        if day != self._day:
+            # Наступил новый день: сегодняшних запросов еще не было
+            self._day = day
+            self._today = 0
+
+        recent = self._recent
+        while recent and now - recent[0] > WEEK_SECONDS:
+            recent.popleft()
+        evicted = self._evicted
+        while evicted and now - evicted[0] > WEEK_SECONDS:
+            heapq.heappop(evicted)
+
+    def _update_top(self, users: Dict[str, UserRecord], user_id_str: str):
+        top = self._top
+        rank = self._rank(users, user_id_str)
+
+        if user_id_str in top:
+            index = top.index(user_id_str)
+        elif len(top) < self.top_limit:
+            top.append(user_id_str)
+            index = len(top) - 1
+        elif rank < self._rank(users, top[-1]):
+            top[-1] = user_id_str
+            index = len(top) - 1
+        else:
+            return
+
+        # Поднимаем пользователя на его место в рейтинге
+        while index > 0 and rank < self._rank(users, top[index - 1]):
+            top[index], top[index - 1] = top[index - 1], top[index]
+            index -= 1
+
+    def get_period_requests(self, now: int) -> Tuple[int, int]:
+        """Возвращает (запросов сегодня, запросов за 7 дней) на момент now"""
+        if now < self._last_now:
+            return self._today, len(self._recent) - len(self._evicted)
+        self._advance(now)
+        return self._today, len(self._recent) - len(self._evicted)
+
+    def get_top(self) -> List[str]:
+        """Возвращает id пользователей с наибольшим числом запросов"""
+        return list(self._top)
+
+    def check(self, users: Dict[str, UserRecord], now: int) -> Dict[str, Tuple]:
+        """
+        Сверяет агрегаты с полным пересчетом по данным пользователей
+
+        Returns:
+            Расхождения {название: (инкрементальное значение, пересчитанное значение)}
+        """
+        expected = UserAggregates(self.top_limit)
+        expected.rebuild(users, now)
+
+        today, week = self.get_period_requests(now)
+        expected_today, expected_week = expected.get_period_requests(now)
+        values = {
+            "total_requests": (self.total_requests, expected.total_requests),
+            "today_requests": (today, expected_today),
+            "week_requests": (week, expected_week),
+            "top_users": (self.get_top(), expected.get_top()),
+        }
+        return {name: pair for name, pair in values.items() if pair[0] != pair[1]}
@@ -1,15 +1,31 @@
 import json
 import os
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import Dict, List, Optional
 import logging
+from config import USER_STORAGE, USER_DB_FILE, USERS_FLUSH_INTERVAL, USERS_FLUSH_EVERY
+from user_storage import UserStorage, create_user_storage
+from user_record import UserRecord, to_seconds
+from user_aggregates import UserAggregates
+from tracing import traced
 
 logger = logging.getLogger(__name__)
 
 class UserManager:
-    def __init__(self, data_file: str = "users.json"):
+    def __init__(self, data_file: str = "users.json", storage: Optional[UserStorage] = None):
         self.data_file = data_file
-        self.users = self.load_users()
+        
+        # Хранилище данных: JSON-файл или SQLite (см. USER_STORAGE)
+        self.storage = storage or create_user_storage(
+            USER_STORAGE, data_file, USER_DB_FILE,
+            flush_interval=USERS_FLUSH_INTERVAL,
+            flush_every=USERS_FLUSH_EVERY
+        )
+        self.users: Dict[str, UserRecord] = self.load_users()
+        
+        # Общая статистика и рейтинг для /stats обновляются при каждом запросе
+        self.aggregates = UserAggregates()
+        self.aggregates.rebuild(self.users, to_seconds(datetime.now()))
         
         # Загружаем список администраторов из файла
         self.admins = self.load_admins()
@@ -28,94 +44,70 @@ class UserManager:
             logger.error(f"Ошибка загрузки списка администраторов: {e}")
             return []
     
-    def load_users(self) -> Dict:
-        """Загружает данные пользователей из файла"""
-        if os.path.exists(self.data_file):
+    def load_users(self) -> Dict[str, UserRecord]:
+        """Загружает данные пользователей из хранилища (компактный или прежний формат)"""
+        users = {}
+        for user_id_str, data in self.storage.load_users().items():
             try:
-                with open(self.data_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                users[user_id_str] = UserRecord.from_data(data)
             except Exception as e:
-                logger.error(f"Ошибка загрузки данных пользователей: {e}")
-                return {}
-        return {}
+                logger.error(f"Ошибка загрузки пользователя {user_id_str}: {e}")
+        return users
     
+    @traced("save_users")
     def save_users(self):
-        """Сохраняет данные пользователей в файл"""
-        try:
-            with open(self.data_file, 'w', encoding='utf-8') as f:
-                json.dump(self.users, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            logger.error(f"Ошибка сохранения данных пользователей: {e}")
+        """Сохраняет данные всех пользователей"""
+        self.storage.save_all({
+            user_id_str: user.to_data() for user_id_str, user in self.users.items()
+        })
+    
+    @traced("save_user")
+    def save_user(self, user_id_str: str):
+        """Сохраняет данные одного пользователя"""
+        self.storage.save_user(user_id_str, self.users[user_id_str].to_data())
+    
+    def close(self):
+        """Закрывает хранилище (для JSON - с финальной записью на диск)"""
+        self.storage.close()
     
     def get_or_create_user(self, user_id: int, username: str = None, first_name: str = None) -> Dict:
         """Получает или создает пользователя"""
         user_id_str = str(user_id)
         
         if user_id_str not in self.users:
-            self.users[user_id_str] = {
-                "user_id": user_id,
-                "username": username,
-                "first_name": first_name,
-                "joined_date": datetime.now().isoformat(),
-                "requests": {
-                    "total": 0,
-                    "today": 0,
-                    "week": 0,
-                    "last_request": None
-                },
-                "requests_history": []
-            }
-            self.save_users()
+            self.users[user_id_str] = UserRecord(
+                user_id,
+                username,
+                first_name,
+                to_seconds(datetime.now())
+            )
+            self.aggregates.add_user(self.users, user_id_str)
+            self.save_user(user_id_str)
         
-        return self.users[user_id_str]
+        return self.users[user_id_str].to_dict()
     
+    @traced("record_request")
     def record_request(self, user_id: int, request_type: str):
         """Записывает запрос пользователя"""
         user_id_str = str(user_id)
-        now = datetime.now()
+        now = to_seconds(datetime.now())
         
         if user_id_str not in self.users:
             return
         
+        # Обновляем общую статистику и историю (хранятся последние HISTORY_LIMIT запросов)
         user = self.users[user_id_str]
-        
-        # Обновляем общую статистику
-        user["requests"]["total"] += 1
-        user["requests"]["last_request"] = now.isoformat()
-        
-        # Добавляем в историю
-        user["requests_history"].append({
-            "type": request_type,
-            "timestamp": now.isoformat()
-        })
-        
-        # Ограничиваем историю последними 100 запросами
-        if len(user["requests_history"]) > 100:
-            user["requests_history"] = user["requests_history"][-100:]
+        evicted = user.add_request(now, request_type)
+        self.aggregates.add_request(self.users, user_id_str, now, evicted)
         
         # Обновляем дневную и недельную статистику
-        self.update_period_stats(user_id_str)
+        user.update_period_stats(now)
         
-        self.save_users()
+        self.save_user(user_id_str)
     
     def update_period_stats(self, user_id_str: str):
         """Обновляет дневную и недельную статистику"""
-        user = self.users[user_id_str]
-        now = datetime.now()
-        
-        # Сбрасываем счетчики
-        user["requests"]["today"] = 0
-        user["requests"]["week"] = 0
-        
-        # Подсчитываем запросы за день и неделю
-        for request in user["requests_history"]:
-            request_time = datetime.fromisoformat(request["timestamp"])
-            
-            if now.date() == request_time.date():
-                user["requests"]["today"] += 1
-            
-            if now - request_time <= timedelta(days=7):
-                user["requests"]["week"] += 1
+        self.users[user_id_str].update_period_stats(to_seconds(datetime.now()))
     
     def is_admin(self, user_id: int) -> bool:
         """Проверяет, является ли пользователь админом"""
@@ -124,36 +116,18 @@ class UserManager:
     def get_stats(self) -> Dict:
         """Получает общую статистику по всем пользователям"""
         try:
-            total_users = len(self.users)
-            total_requests = 0
-            today_requests = 0
-            week_requests = 0
-            
-            # Безопасно подсчитываем статистику
-            for user in self.users.values():
-                try:
-                    requests = user.get("requests", {})
-                    total_requests += requests.get("total", 0)
-                    today_requests += requests.get("today", 0)
-                    week_requests += requests.get("week", 0)
-                except Exception as e:
-                    logger.error(f"Ошибка при обработке пользователя {user.get('user_id', 'unknown')}: {e}")
-                    continue
+            # Агрегаты поддерживаются инкрементально, поэтому здесь нет обхода всех пользователей
+            today_requests, week_requests = self.aggregates.get_period_requests(to_seconds(datetime.now()))
             
             # Топ пользователей по запросам
-            try:
-                top_users = sorted(
-                    self.users.values(),
-                    key=lambda x: x.get("requests", {}).get("total", 0),
-                    reverse=True
-                )[:5]
-            except Exception as e:
-                logger.error(f"Ошибка при сортировке пользователей: {e}")
-                top_users = []
+            top_users = [
+                self.users[user_id_str].to_dict()
+                for user_id_str in self.aggregates.get_top()
+            ]
             
             return {
-                "total_users": total_users,
-                "total_requests": total_requests,
+                "total_users": len(self.users),
+                "total_requests": self.aggregates.total_requests,
                 "today_requests": today_requests,
                 "week_requests": week_requests,
                 "top_users": top_users
@@ -168,10 +142,28 @@ class UserManager:
                 "top_users": []
             }
     
+    def check_stats_consistency(self, repair: bool = True) -> Dict:
+        """
+        Сверяет инкрементальную статистику с полным пересчетом по данным пользователей
+        
+        Args:
+            repair: Пересобрать агрегаты, если найдены расхождения
+        
+        Returns:
+            Расхождения {название: (текущее значение, пересчитанное значение)}
+        """
+        now = to_seconds(datetime.now())
+        mismatches = self.aggregates.check(self.users, now)
+        if mismatches:
+            logger.warning(f"Статистика расходится с данными пользователей: {mismatches}")
+            if repair:
+                self.aggregates.rebuild(self.users, now)
+        return mismatches
+    
     def get_user_stats(self, user_id: int) -> Optional[Dict]:
         """Получает статистику конкретного пользователя"""
         user_id_str = str(user_id)
         if user_id_str in self.users:
             self.update_period_stats(user_id_str)
-            return self.users[user_id_str]
+            return self.users[user_id_str].to_dict()
         return None 
\ No newline at end of file
@@ -0,0 +1,218 @@
+from array import array
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+# Сколько последних запросов хранится в истории пользователя
+HISTORY_LIMIT = 100
+
+DAY_SECONDS = 86400
+WEEK_SECONDS = 7 * DAY_SECONDS
+
+# Время хранится целыми секундами от 1970-01-01 по локальным часам
+# (как и прежние datetime.now().isoformat()), поэтому деление на сутки дает локальную дату
+EPOCH = datetime(1970, 1, 1)
+
+# Коды типов запросов; 0 - неизвестный тип из старых данных.
+# Коды однозначные: на диске они хранятся строкой по одному символу на запрос
+TASK_CODES = {
+    "check_grammar": 1,
+    "improve_text": 2,
+    "shorten_text": 3,
+    "translate_text": 4,
+}
+TASK_NAMES = {code: name for name, code in TASK_CODES.items()}
+UNKNOWN_TASK = "unknown"
+
+def to_seconds(moment: datetime) -> int:
+    """Переводит локальное время в целые секунды"""
+    return (moment - EPOCH) // timedelta(seconds=1)
+
+def from_seconds(seconds: int) -> datetime:
+    """Переводит целые секунды обратно в локальное время"""
+    return EPOCH + timedelta(seconds=seconds)
+
+def parse_timestamp(value: Optional[str]) -> int:
+    """Разбирает ISO-время из старого формата (0 - нет значения)"""
+    if not value:
+        return 0
+    return to_seconds(datetime.fromisoformat(value))
+
+class RequestHistory:
+    """
+    Кольцевой буфер последних запросов на двух массивах
+
+    Время запроса - 8 байт, код задачи - 1 байт. Массивы растут до
+    HISTORY_LIMIT, после чего новые запросы перезаписывают самые старые.
+    """
+
+    __slots__ = ("times", "codes", "start")
+
+    def __init__(self):
+        self.times = array('q')
+        self.codes = array('B')
+        self.start = 0
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def time_at(self, index: int) -> int:
+        """Время запроса по порядковому номеру (0 - самый старый)"""
+        times = self.times
+        return times[(self.start + index) % len(times)]
+
+    def append(self, seconds: int, code: int) -> Optional[int]:
+        """Добавляет запрос; возвращает время вытесненного самого старого запроса или None"""
+        if len(self.times) < HISTORY_LIMIT:
+            self.times.append(seconds)
+            self.codes.append(code)
+            return None
+
+        evicted = self.times[self.start]
+        self.times[self.start] = seconds
+        self.codes[self.start] = code
+        self.start = (self.start + 1) % HISTORY_LIMIT
+        return evicted
+
+    def items(self) -> Iterator[Tuple[int, int]]:
+        """Перебирает (время, код задачи) от старых к новым"""
+        size = len(self.times)
+        for i in range(size):
+            j = (self.start + i) % size
+            yield self.times[j], self.codes[j]
+
+class UserRecord:
+    """
+    Данные пользователя в памяти
+
+    Вместо словаря со списком словарей - объект со __slots__ и кольцевым
+    буфером истории, что в разы уменьшает расход памяти на пользователя.
+    Счетчики за сегодня и за 7 дней поддерживаются инкрементально: указатели
+    на первый запрос сегодняшнего дня и первый запрос в окне 7 дней только
+    двигаются вперед, поэтому подсчет занимает амортизированное O(1).
+    """
+
+    __slots__ = (
+        "user_id", "username", "first_name", "joined", "total", "last_request",
+        "today", "week", "history", "day_start", "week_start", "last_now"
+    )
+
+    def __init__(self, user_id: int, username: Optional[str] = None, first_name: Optional[str] = None,
+                 joined: int = 0):
+        self.user_id = user_id
+        self.username = username
+        self.first_name = first_name
+        self.joined = joined
+        self.total = 0
+        self.last_request = 0
+        self.today = 0
+        self.week = 0
+        self.history = RequestHistory()
+        self.day_start = 0
+        self.week_start = 0
+        self.last_now = 0
+
+    def add_request(self, seconds: int, request_type: str) -> Optional[int]:
+        """Учитывает новый запрос; возвращает время вытесненного из истории запроса или None"""
+        self.total += 1
+        self.last_request = seconds
+        evicted = self.history.append(seconds, TASK_CODES.get(request_type, 0))
+        if evicted is not None:
+            # Самый старый запрос вытеснен - индексы сдвигаются на один
+            self.day_start = max(0, self.day_start - 1)
+            self.week_start = max(0, self.week_start - 1)
+        return evicted
+
+    def update_period_stats(self, now: int):
+        """Пересчитывает today и week на момент now (в секундах)"""
+        if now < self.last_now:
+            # Часы перевели назад - пересчитываем указатели с начала
+            self.day_start = 0
+            self.week_start = 0
+        self.last_now = now
+
+        history = self.history
+        size = len(history)
+        today = now // DAY_SECONDS
+
+        while self.day_start < size and history.time_at(self.day_start) // DAY_SECONDS != today:
+            self.day_start += 1
+        while self.week_start < size and now - history.time_at(self.week_start) > WEEK_SECONDS:
+            self.week_start += 1
+
+        self.today = size - self.day_start
+        self.week = size - self.week_start
+
+    def to_dict(self) -> Dict:
+        """Возвращает данные в прежнем формате словаря (для API UserManager)"""
+        return {
+            "user_id": self.user_id,
+            "username": self.username,
+            "first_name": self.first_name,
+            "joined_date": from_seconds(self.joined).isoformat() if self.joined else None,
+            "requests": {
+                "total": self.total,
+                "today": self.today,
+                "week": self.week,
+                "last_request": from_seconds(self.last_request).isoformat() if self.last_request else None
+            },
+            "requests_history": [
+                {"type": TASK_NAMES.get(code, UNKNOWN_TASK), "timestamp": from_seconds(seconds).isoformat()}
+                for seconds, code in self.history.items()
+            ]
+        }
+
+    def to_data(self) -> List:
+        """
+        Компактное представление для хранения на диске:
+        [user_id, username, first_name, joined, total, last_request, today, week,
+         разности времен запросов, коды задач строкой]
+        """
+        deltas = []
+        previous = 0
+        codes = []
+        for seconds, code in self.history.items():
+            deltas.append(seconds - previous)
+            previous = seconds
+            codes.append(str(code))
+        return [
+            self.user_id, self.username, self.first_name, self.joined, self.total,
+            self.last_request, self.today, self.week, deltas, "".join(codes)
+        ]
+
+    @classmethod
+    def from_data(cls, data: Union[Dict, List]) -> "UserRecord":
+        """Восстанавливает пользователя из компактного или прежнего (словарь) формата"""
+        if isinstance(data, dict):
+            return cls._from_legacy(data)
+
+        user_id, username, first_name, joined, total, last_request, today, week, deltas, codes = data
+        record = cls(user_id, username, first_name, joined)
+        record.total = total
+        record.last_request = last_request
+        record.today = today
+        record.week = week
+        seconds = 0
+        for delta, code in zip(deltas, codes):
+            seconds += delta
+            record.history.append(seconds, int(code))
+        return record
+
+    @classmethod
+    def _from_legacy(cls, data: Dict) -> "UserRecord":
+        requests = data.get("requests", {})
+        record = cls(
+            data.get("user_id"),
+            data.get("username"),
+            data.get("first_name"),
+            parse_timestamp(data.get("joined_date"))
+        )
+        record.total = requests.get("total", 0)
+        record.last_request = parse_timestamp(requests.get("last_request"))
+        record.today = requests.get("today", 0)
+        record.week = requests.get("week", 0)
+        for request in data.get("requests_history", [])[-HISTORY_LIMIT:]:
+            record.history.append(
+                parse_timestamp(request.get("timestamp")),
+                TASK_CODES.get(request.get("type"), 0)
+            )
+        return record
@@ -0,0 +1,294 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class UserStorage:
+    """Базовый класс хранилища данных пользователей для UserManager"""
+
+    def load_users(self) -> Dict:
+        """Загружает всех пользователей: {user_id_str: данные пользователя}"""
+        raise NotImplementedError
+
+    def save_user(self, user_id_str: str, user: Dict):
+        """Сохраняет изменения одного пользователя"""
+        raise NotImplementedError
+
+    def save_all(self, users: Dict):
+        """Сохраняет всех пользователей"""
+        for user_id_str, user in users.items():
+            self.save_user(user_id_str, user)
+
+    def close(self):
+        """Освобождает ресурсы хранилища"""
+
+class WriteBehindStorage(UserStorage):
+    """
+    Хранилище с отложенной записью
+
+    save_user не обращается к диску в цикле событий: изменения копятся в памяти,
+    а фоновый поток вызывает flush раз в flush_interval секунд или после
+    flush_every изменений. При закрытии делается финальная запись.
+    """
+
+    def __init__(self, flush_interval: float = 5.0, flush_every: int = 100):
+        self.flush_interval = flush_interval
+        self.flush_every = max(1, flush_every)
+
+        self._dirty = 0
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._flusher: Optional[threading.Thread] = None
+
+    def _start_flusher(self):
+        if self._flusher is None:
+            self._flusher = threading.Thread(
+                target=self._flush_loop, name=f"{type(self).__name__}-flusher", daemon=True
+            )
+            self._flusher.start()
+
+    def _mark_dirty(self):
+        """Учитывает изменение (вызывается под self._lock)"""
+        self._dirty += 1
+        if self._dirty >= self.flush_every:
+            self._wakeup.set()
+
+    def _flush_loop(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._stopped:
+                break
+            self.flush()
+
+    def flush(self):
+        """Записывает накопленные изменения на диск, если они есть"""
+        raise NotImplementedError
+
+    def close(self):
+        """Останавливает фоновую запись и сбрасывает последние изменения"""
+        self._stopped = True
+        self._wakeup.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=self.flush_interval + 5)
+            self._flusher = None
+        self.flush()
+
+class JsonUserStorage(WriteBehindStorage):
+    """
+    Хранилище в одном JSON-файле (users.json) с отложенной записью
+
+    Изменения не пишутся на диск в момент запроса: save_user только сериализует
+    пользователя и помечает хранилище измененным. Фоновый поток сбрасывает файл
+    раз в flush_interval секунд или после flush_every изменений, а при закрытии
+    делает финальную запись. Файл пишется во временный файл с fsync и затем
+    атомарно переименовывается, поэтому сбой во время записи не повреждает users.json.
+    """
+
+    def __init__(self, data_file: str = "users.json", flush_interval: float = 5.0, flush_every: int = 100):
+        super().__init__(flush_interval, flush_every)
+        self.data_file = data_file
+
+        # user_id_str -> пользователь, уже сериализованный в JSON.
+        # Поток записи работает только с этими строками и не трогает живые данные
+        self._serialized: Dict[str, str] = {}
+
+    def load_users(self) -> Dict:
+        users = {}
+        if os.path.exists(self.data_file):
+            try:
+                with open(self.data_file, 'r', encoding='utf-8') as f:
+                    users = json.load(f)
+            except Exception as e:
+                logger.error(f"Ошибка загрузки данных пользователей: {e}")
+                users = {}
+
+        with self._lock:
+            self._serialized = {
+                user_id_str: self._serialize(user) for user_id_str, user in users.items()
+            }
+        self._start_flusher()
+        return users
+
+    @staticmethod
+    def _serialize(user: Dict) -> str:
+        return json.dumps(user, ensure_ascii=False, separators=(',', ':'))
+
+    def save_user(self, user_id_str: str, user: Dict):
+        data = self._serialize(user)
+        with self._lock:
+            self._serialized[user_id_str] = data
+            self._mark_dirty()
+
+    def save_all(self, users: Dict):
+        """Полностью заменяет данные и сразу записывает файл"""
+        serialized = {user_id_str: self._serialize(user) for user_id_str, user in users.items()}
+        with self._lock:
+            self._serialized = serialized
+            self._dirty += 1
+        self.flush()
+
+    def flush(self):
+        with self._write_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                items = list(self._serialized.items())
+                dirty = self._dirty
+                self._dirty = 0
+
+            try:
+                self._write_atomic(items)
+            except Exception as e:
+                logger.error(f"Ошибка сохранения данных пользователей: {e}")
+                # Изменения не потеряны: попробуем записать их при следующем сбросе
+                with self._lock:
+                    self._dirty += dirty
+
+    def _write_atomic(self, items):
+        # Один пользователь - одна строка: файл остается читаемым и валидным JSON
+        lines = [f"{json.dumps(user_id_str)}:{data}" for user_id_str, data in items]
+        content = "{\n" + ",\n".join(lines) + "\n}\n"
+
+        tmp_file = f"{self.data_file}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.data_file)
+
+class SqliteUserStorage(WriteBehindStorage):
+    """
+    Хранилище в SQLite в режиме WAL с отложенной записью
+
+    Каждый пользователь - одна строка, поэтому сброс изменений - небольшие записи
+    по первичному ключу, сколько бы пользователей ни было. Записи выполняет фоновый
+    поток одной транзакцией на сброс (как в JsonUserStorage), а не цикл событий.
+    При первом запуске данные однократно переносятся из users.json.
+    """
+
+    UPSERT = (
+        "INSERT INTO users (user_id, data, updated_at) VALUES (?, ?, ?) "
+        "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at"
+    )
+
+    def __init__(self, db_file: str = "users.db", migrate_from: str = "users.json",
+                 flush_interval: float = 5.0, flush_every: int = 100):
+        super().__init__(flush_interval, flush_every)
+        # user_id_str -> (пользователь в JSON, время изменения), еще не записанные в базу
+        self._pending: Dict[str, Tuple[str, float]] = {}
+        self.db_file = db_file
+        self.migrate_from = migrate_from
+        # isolation_level=None - каждая команда выполняется в своей транзакции
+        self.conn = sqlite3.connect(db_file, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS users ("
+            "user_id TEXT PRIMARY KEY, "
+            "data TEXT NOT NULL, "
+            "updated_at REAL NOT NULL)"
+        )
+
+    def load_users(self) -> Dict:
+        self.migrate_from_json()
+
+        users = {}
+        for user_id_str, data in self.conn.execute("SELECT user_id, data FROM users"):
+            try:
+                users[user_id_str] = json.loads(data)
+            except Exception as e:
+                logger.error(f"Ошибка чтения пользователя {user_id_str} из базы: {e}")
+        self._start_flusher()
+        return users
+
+    def migrate_from_json(self):
+        """Однократно переносит пользователей из users.json в пустую базу"""
+        if not self.migrate_from or not os.path.exists(self.migrate_from):
+            return
+
+        (count,) = self.conn.execute("SELECT COUNT(*) FROM users").fetchone()
+        if count:
+            return
+
+        try:
+            with open(self.migrate_from, 'r', encoding='utf-8') as f:
+                users = json.load(f)
+        except Exception as e:
+            logger.error(f"Ошибка чтения {self.migrate_from} для миграции: {e}")
+            return
+
+        now = time.time()
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "INSERT INTO users (user_id, data, updated_at) VALUES (?, ?, ?)",
+                [
+                    (user_id_str, json.dumps(user, ensure_ascii=False), now)
+                    for user_id_str, user in users.items()
+                ]
+            )
+
+        # Переименовываем исходный файл, чтобы миграция не повторялась
+        os.replace(self.migrate_from, f"{self.migrate_from}.migrated")
+        logger.info(f"Перенесено {len(users)} пользователей из {self.migrate_from} в {self.db_file}")
+
+    def save_user(self, user_id_str: str, user: Dict):
+        data = json.dumps(user, ensure_ascii=False, separators=(',', ':'))
+        with self._lock:
+            self._pending[user_id_str] = (data, time.time())
+            self._mark_dirty()
+
+    def save_all(self, users: Dict):
+        """Сохраняет всех пользователей и сразу записывает их в базу"""
+        now = time.time()
+        with self._lock:
+            for user_id_str, user in users.items():
+                self._pending[user_id_str] = (json.dumps(user, ensure_ascii=False, separators=(',', ':')), now)
+            self._dirty += 1
+        self.flush()
+
+    def flush(self):
+        with self._write_lock:
+            with self._lock:
+                if not self._pending:
+                    self._dirty = 0
+                    return
+                pending, self._pending = self._pending, {}
+                self._dirty = 0
+
+            try:
+                with self.conn:
+                    self.conn.execute("BEGIN")
+                    self.conn.executemany(
+                        self.UPSERT,
+                        [(user_id_str, data, updated_at) for user_id_str, (data, updated_at) in pending.items()]
+                    )
+            except Exception as e:
+                logger.error(f"Ошибка сохранения пользователей в базу: {e}")
+                # Изменения не потеряны: более новые версии пользователей важнее, остальные вернем в очередь
+                with self._lock:
+                    for user_id_str, item in pending.items():
+                        self._pending.setdefault(user_id_str, item)
+                    self._dirty += len(pending)
+
+    def close(self):
+        super().close()
+        self.conn.close()
+
+def create_user_storage(backend: str, data_file: str = "users.json", db_file: str = "users.db",
+                        flush_interval: float = 5.0, flush_every: int = 100) -> UserStorage:
+    """Создает хранилище по названию: 'json' или 'sqlite'"""
+    if backend == "sqlite":
+        return SqliteUserStorage(db_file, migrate_from=data_file,
+                                 flush_interval=flush_interval, flush_every=flush_every)
+    if backend != "json":
+        logger.warning(f"Неизвестное хранилище пользователей '{backend}', используем json")
+    return JsonUserStorage(data_file, flush_interval=flush_interval, flush_every=flush_every)
@@ -0,0 +1,128 @@
+import asyncio
+import hmac
+import json
+import logging
+import signal
+from typing import List, Optional
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+class WebhookServer:
+    """
+    Встроенный HTTP-сервер для приема обновлений Telegram через webhook
+
+    POST /<path> - обновление от Telegram (проверяется секретный токен)
+    GET /healthz - сервер жив
+    GET /readyz  - приложение запущено и принимает обновления
+
+    Для локальной проверки достаточно отправить POST-запросом сохраненный JSON
+    обновления Telegram с заголовком X-Telegram-Bot-Api-Secret-Token.
+    """
+
+    def __init__(self, application: Application, listen: str = "0.0.0.0", port: int = 8443,
+                 url_path: str = "telegram", secret_token: Optional[str] = None):
+        self.application = application
+        self.listen = listen
+        self.port = port
+        self.url_path = "/" + url_path.strip("/")
+        self.secret_token = secret_token or None
+        self._runner: Optional[web.AppRunner] = None
+
+        self.web_app = web.Application()
+        self.web_app.router.add_post(self.url_path, self.handle_update)
+        self.web_app.router.add_get("/healthz", self.handle_health)
+        self.web_app.router.add_get("/readyz", self.handle_ready)
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        """Принимает обновление и ставит его в очередь приложения"""
+        if self.secret_token:
+            received = request.headers.get(SECRET_HEADER, "")
+            if not hmac.compare_digest(received, self.secret_token):
+                logger.warning(f"Отклонен webhook-запрос с неверным секретным токеном от {request.remote}")
+                return web.Response(status=403)
+
+        try:
+            data = await request.json()
+            update = Update.de_json(data, self.application.bot)
+        except (json.JSONDecodeError, ValueError, TypeError, KeyError) as e:
+            logger.warning(f"Некорректное тело webhook-запроса: {e}")
+            return web.Response(status=400)
+
+        if update is None:
+            return web.Response(status=400)
+
+        # Отвечаем Telegram сразу, обновление обработается асинхронно
+        await self.application.update_queue.put(update)
+        return web.Response()
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok"})
+
+    async def handle_ready(self, request: web.Request) -> web.Response:
+        if self.application.running:
+            return web.json_response({"status": "ready"})
+        return web.json_response({"status": "starting"}, status=503)
+
+    async def start(self):
+        self._runner = web.AppRunner(self.web_app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.listen, self.port)
+        await site.start()
+        logger.info(f"Webhook-сервер слушает {self.listen}:{self.port}{self.url_path}")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+async def run_webhook(application: Application, server: WebhookServer, webhook_url: Optional[str],
+                      allowed_updates: List[str]):
+    """
+    Запускает приложение в режиме webhook и работает до SIGINT/SIGTERM
+
+    Если webhook_url не задан, webhook в Telegram не регистрируется - удобно
+    для локальной проверки, когда обновления отправляются на сервер вручную.
+    """
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            # Windows: сигналы через цикл событий не поддерживаются
+            pass
+
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+
+    try:
+        await application.start()
+        await server.start()
+
+        if webhook_url:
+            full_url = webhook_url.rstrip("/") + server.url_path
+            await application.bot.set_webhook(
+                url=full_url,
+                allowed_updates=allowed_updates,
+                secret_token=server.secret_token
+            )
+            logger.info(f"Webhook зарегистрирован: {full_url}")
+        else:
+            logger.warning("WEBHOOK_URL не задан, webhook в Telegram не регистрируется")
+
+        await stop_event.wait()
+    finally:
+        await server.stop()
+        if application.running:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)